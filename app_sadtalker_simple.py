@@ -1,4 +1,5 @@
 import os, sys
+import threading
 import gradio as gr
 from src.gradio_demo import SadTalker
 
@@ -23,6 +24,8 @@ def switch_to_home():
 
 def sadtalker_demo_with_home(checkpoint_path='checkpoints', config_path='src/config', warpfn=None):
     sad_talker = SadTalker(checkpoint_path, config_path, lazy_load=True)
+    # load the default lecture models in the background so the UI comes up immediately
+    threading.Thread(target=sad_talker.warmup, daemon=True).start()
 
     with gr.Blocks(analytics_enabled=False, title="SadTalker", css=custom_home_css()) as sadtalker_interface:
         # State để quản lý trang hiện tại
@@ -93,8 +96,8 @@ def sadtalker_demo_with_home(checkpoint_path='checkpoints', config_path='src/con
                 
                 # Kết nối với output handler
                 input_components['generate_btn'].click(
-                    fn=lambda pptx, img, voice_id, preprocess, still, enh, batch, size, pose: generate_lecture_video_handler(
-                        sad_talker, pptx, img, voice_id, preprocess, still, enh, batch, size, pose
+                    fn=lambda pptx, img, voice_id, preprocess, still, enh, batch, size, pose, precision: generate_lecture_video_handler(
+                        sad_talker, pptx, img, voice_id, preprocess, still, enh, batch, size, pose, precision
                     ),
                     inputs=[
                         input_components['pptx_file'], 
@@ -105,7 +108,8 @@ def sadtalker_demo_with_home(checkpoint_path='checkpoints', config_path='src/con
                         input_components['enhancer'], 
                         input_components['batch_size'], 
                         input_components['size_of_image'], 
-                        input_components['pose_style']
+                        input_components['pose_style'],
+                        input_components['precision']
                     ],
                     outputs=[input_components['final_video'], input_components['status']]
                 )
@@ -130,7 +134,13 @@ def sadtalker_demo_with_home(checkpoint_path='checkpoints', config_path='src/con
     return sadtalker_interface
 
 if __name__ == "__main__":
+    # load model TTS trong nền ngay khi khởi động, UI hiển thị trạng thái sẵn sàng
+    if os.environ.get("SADTALKER_TTS_WARM", "1") != "0":
+        from src.voice.enrollment import warm_load_xtts
+        warm_load_xtts()
     demo = sadtalker_demo_with_home()
+    # queue cho các event dạng generator (tiến độ đăng ký giọng chạy nền)
+    demo.queue()
     demo.launch(
         server_name='127.0.0.1',
         server_port=7862,
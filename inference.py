@@ -5,12 +5,10 @@ from time import  strftime
 import os, sys, time
 from argparse import ArgumentParser
 
-from src.utils.preprocess import CropAndExtract
-from src.test_audio2coeff import Audio2Coeff  
-from src.facerender.animate import AnimateFromCoeff
 from src.generate_batch import get_data
 from src.generate_facerender_batch import get_facerender_data
-from src.utils.init_path import init_path
+from src.utils.model_pool import get_model_pool
+from src.utils.precision import PRECISIONS, precision_scope, resolve_precision
 
 def main(args):
     #torch.backends.cudnn.enabled = False
@@ -30,14 +28,15 @@ def main(args):
 
     current_root_path = os.path.split(sys.argv[0])[0]
 
-    sadtalker_paths = init_path(args.checkpoint_dir, os.path.join(current_root_path, 'src/config'), args.size, args.old_version, args.preprocess)
+    model_pool = get_model_pool(args.checkpoint_dir, os.path.join(current_root_path, 'src/config'), args.old_version, max_ram_mb=args.pool_max_mb)
 
     #init model
-    preprocess_model = CropAndExtract(sadtalker_paths, device)
+    models = model_pool.get(args.size, args.preprocess, device)
+    preprocess_model = models.preprocess_model
 
-    audio_to_coeff = Audio2Coeff(sadtalker_paths,  device)
+    audio_to_coeff = models.audio_to_coeff
     
-    animate_from_coeff = AnimateFromCoeff(sadtalker_paths, device)
+    animate_from_coeff = models.animate_from_coeff
 
     #crop image and extract 3dmm from image
     first_frame_dir = os.path.join(save_dir, 'first_frame_dir')
@@ -54,7 +53,8 @@ def main(args):
         ref_eyeblink_frame_dir = os.path.join(save_dir, ref_eyeblink_videoname)
         os.makedirs(ref_eyeblink_frame_dir, exist_ok=True)
         print('3DMM Extraction for the reference video providing eye blinking')
-        ref_eyeblink_coeff_path, _, _ =  preprocess_model.generate(ref_eyeblink, ref_eyeblink_frame_dir, args.preprocess, source_image_flag=False)
+        ref_eyeblink_coeff_path, _, _ =  preprocess_model.generate(ref_eyeblink, ref_eyeblink_frame_dir, args.preprocess, source_image_flag=False,
+                                                                     recon_batch_size=args.recon_batch_size)
     else:
         ref_eyeblink_coeff_path=None
 
@@ -66,7 +66,8 @@ def main(args):
             ref_pose_frame_dir = os.path.join(save_dir, ref_pose_videoname)
             os.makedirs(ref_pose_frame_dir, exist_ok=True)
             print('3DMM Extraction for the reference video providing pose')
-            ref_pose_coeff_path, _, _ =  preprocess_model.generate(ref_pose, ref_pose_frame_dir, args.preprocess, source_image_flag=False)
+            ref_pose_coeff_path, _, _ =  preprocess_model.generate(ref_pose, ref_pose_frame_dir, args.preprocess, source_image_flag=False,
+                                                                 recon_batch_size=args.recon_batch_size)
     else:
         ref_pose_coeff_path=None
 
@@ -82,10 +83,11 @@ def main(args):
     #coeff2video
     data = get_facerender_data(coeff_path, crop_pic_path, first_coeff_path, audio_path, 
                                 batch_size, input_yaw_list, input_pitch_list, input_roll_list,
-                                expression_scale=args.expression_scale, still_mode=args.still, preprocess=args.preprocess, size=args.size)
+                                expression_scale=args.expression_scale, still_mode=args.still, preprocess=args.preprocess, size=args.size, verbose=args.verbose)
     
     result = animate_from_coeff.generate(data, save_dir, pic_path, crop_info, \
-                                enhancer=args.enhancer, background_enhancer=args.background_enhancer, preprocess=args.preprocess, img_size=args.size)
+                                enhancer=args.enhancer, background_enhancer=args.background_enhancer, preprocess=args.preprocess, img_size=args.size, \
+                                render_batch_size=args.render_batch_size)
     
     shutil.move(result, save_dir+'.mp4')
     print('The generated video is named:', save_dir+'.mp4')
@@ -106,6 +108,8 @@ if __name__ == '__main__':
     parser.add_argument("--pose_style", type=int, default=0,  help="input pose style from [0, 46)")
     parser.add_argument("--batch_size", type=int, default=2,  help="the batch size of facerender")
     parser.add_argument("--size", type=int, default=256,  help="the image size of the facerender")
+    parser.add_argument("--render_batch_size", type=int, default=None,  help="frames per face renderer call, defaults to batch_size")
+    parser.add_argument("--recon_batch_size", type=int, default=16,  help="reference video frames per 3DMM extraction call")
     parser.add_argument("--expression_scale", type=float, default=1.,  help="the batch size of facerender")
     parser.add_argument('--input_yaw', nargs='+', type=int, default=None, help="the input yaw degree of the user ")
     parser.add_argument('--input_pitch', nargs='+', type=int, default=None, help="the input pitch degree of the user")
@@ -118,6 +122,8 @@ if __name__ == '__main__':
     parser.add_argument("--preprocess", default='crop', choices=['crop', 'extcrop', 'resize', 'full', 'extfull'], help="how to preprocess the images" ) 
     parser.add_argument("--verbose",action="store_true", help="saving the intermedia output or not" ) 
     parser.add_argument("--old_version",action="store_true", help="use the pth other than safetensor version" ) 
+    parser.add_argument("--precision", default='fp32', choices=PRECISIONS, help="bf16 runs the networks under bf16 autocast on CPUs that support it" ) 
+    parser.add_argument("--pool_max_mb", type=float, default=None, help="RAM budget of the shared model pool in MB, unlimited by default" ) 
 
 
     # net structure and parameters
@@ -141,5 +147,6 @@ if __name__ == '__main__':
     else:
         args.device = "cpu"
 
-    main(args)
+    with precision_scope(resolve_precision(args.precision, args.device)):
+        main(args)
 
@@ -1,52 +1,31 @@
 import os
+import time
 import zipfile
-import subprocess
 import tempfile
 import logging
 import gradio as gr
 import xml.etree.ElementTree as ET
-from shutil import which
 from gtts import gTTS
 from pptx import Presentation
-from pdf2image import convert_from_path
 from src.utils.math_formula_processor import MathFormulaProcessor, process_math_text
-from src.voice.enrollment import enroll_voice
+from src.utils.slide_cache import get_slide_cache
+from src.voice.enrollment import tts_status
+from src.voice.enrollment_jobs import get_enrollment_jobs
 # Thêm import backend voice
 from src.voice.store import list_voices, has_voice
 from src.voice.tts_engine import synthesize
+from src.voice.tts_cache import get_tts_cache
 
 # Thiết lập logging
 logger = logging.getLogger(__name__)
 
 
-def convert_pptx_to_images(pptx_path, dpi=220):
-    if which("soffice") is None:
-        raise RuntimeError("Không tìm thấy LibreOffice (soffice). Vui lòng cài LibreOffice để chuyển PPTX -> PDF.")
-
-    tmpdir = tempfile.mkdtemp(prefix="pptx2img_")
-    try:
-        subprocess.run(
-            ["soffice", "--headless", "--convert-to", "pdf", "--outdir", tmpdir, pptx_path],
-            check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
-        )
-    except subprocess.CalledProcessError as e:
-        raise RuntimeError(f"Chuyển PPTX sang PDF thất bại: {e}")
-
-    pdf_path = os.path.join(tmpdir, os.path.splitext(os.path.basename(pptx_path))[0] + ".pdf")
-    if not os.path.exists(pdf_path):
-        raise RuntimeError("Không tạo được PDF từ PPTX. Kiểm tra file đầu vào.")
-
-    try:
-        images = convert_from_path(pdf_path, dpi=dpi, output_folder=tmpdir, fmt='png')
-    except Exception as e:
-        raise RuntimeError("Lỗi convert PDF -> ảnh. Có thể thiếu Poppler (poppler-utils).") from e
-
-    img_paths = []
-    for i, img in enumerate(images, 1):
-        img_path = os.path.join(tmpdir, f"slide-{i:02d}.png")
-        img.save(img_path)
-        img_paths.append(img_path)
-    return img_paths
+def convert_pptx_to_images(pptx_path, height=1080):
+    """
+    Ảnh của từng slide ở chiều cao video (1920x1080 với slide 16:9), cache theo nội dung file:
+    xem trước và tạo video dùng chung một lần render.
+    """
+    return get_slide_cache().render(pptx_path, height=height)
 
 
 def convert_text_to_audio(text, language='vi'):
@@ -56,8 +35,17 @@ def convert_text_to_audio(text, language='vi'):
         temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.mp3')
         temp_path = temp_file.name
         temp_file.close()
+
+        tts_cache = get_tts_cache()
+        if tts_cache is not None:
+            cache_key = tts_cache.key(text, "", "", language, 1.0, "gtts")
+            if tts_cache.get(cache_key, temp_path) is not None:
+                return temp_path
+
         tts = gTTS(text=text, lang=language, slow=False)
         tts.save(temp_path)
+        if tts_cache is not None:
+            tts_cache.put(cache_key, temp_path, lang=language, model_type="gtts")
         return temp_path
     except Exception:
         return None
@@ -179,7 +167,7 @@ def read_text_file(file):
 
 def extract_slides_from_pptx(pptx_file):
     slides_data = []
-    image_paths = convert_pptx_to_images(pptx_file.name, dpi=220)
+    image_paths = convert_pptx_to_images(pptx_file.name)
     math_processor = MathFormulaProcessor()
     processed_result = math_processor.process_powerpoint_text(pptx_file.name)
 
@@ -205,7 +193,8 @@ def extract_slides_from_pptx(pptx_file):
                 'slide_number': slide_info['slide_number'],
                 'text': slide_info['processed_text'],
                 'image_path': image_paths[slide_info['slide_number'] - 1] if slide_info['slide_number'] - 1 < len(image_paths) else None,
-                'has_math_objects': slide_info['has_math_objects']
+                'has_math_objects': slide_info['has_math_objects'],
+                'notes': slide_info.get('notes', '')
             })
     return slides_data
 
@@ -236,7 +225,8 @@ def set_lecture_fast_mode():
 
 def handle_register_voice(file_obj):
     if file_obj is None:
-        return "❌ Chưa upload file", gr.update(choices=[])
+        yield "❌ Chưa upload file", gr.update(choices=[])
+        return
     
     audio_path = file_obj.name  # lấy đường dẫn tạm mà Gradio lưu file
     voice_id = os.path.basename(audio_path).split('.')[0]
@@ -247,19 +237,31 @@ def handle_register_voice(file_obj):
     if has_voice("current_user", voice_id):
         print(f"⚠️  Voice '{voice_id}' đã tồn tại, sẽ ghi đè")
     
+    # Đăng ký chạy nền (load model có thể mất vài phút), ở đây chỉ theo dõi tiến độ
     # Sử dụng ngôn ngữ mặc định là 'vi' cho giọng nhân bản
-    success = enroll_voice(audio_path, "current_user", voice_id, lang_hint="vi")
+    jobs = get_enrollment_jobs()
+    job_id = jobs.submit(audio_path, "current_user", voice_id, lang_hint="vi")
+    last = None
+    while True:
+        job = jobs.status(job_id)
+        if job["state"] in ("done", "failed"):
+            break
+        if job["state"] == "queued":
+            text = f"⏳ Đang chờ đăng ký '{voice_id}' (vị trí {job['position']} trong hàng đợi)"
+        else:
+            text = f"⏳ {job['progress']:.0%} - {job['message']}"
+        if text != last:
+            last = text
+            yield text, gr.update()
+        time.sleep(0.5)
     
-    if not success:
-        print(f"❌ Đăng ký voice '{voice_id}' thất bại")
-        return "❌ Đăng ký giọng thất bại", gr.update(choices=[])
+    if job["state"] == "failed":
+        print(f"❌ Đăng ký voice '{voice_id}' thất bại: {job['message']}")
+        yield "❌ Đăng ký giọng thất bại", gr.update(choices=[])
+        return
     
     print(f"✅ Đăng ký voice '{voice_id}' thành công")
     
-    # Đợi một chút để đảm bảo file được lưu
-    import time
-    time.sleep(0.5)
-    
     # Refresh dropdown với danh sách giọng mới
     voices = list_voices("current_user")
     voice_choices = [m["voice_id"] for m in voices]
@@ -273,10 +275,21 @@ def handle_register_voice(file_obj):
         latest_voice = voices[0]  # voices đã được sort theo created_at
         duration = latest_voice.get("audio_length", 0) / latest_voice.get("sample_rate", 48000)
         print(f"✅ Voice '{voice_id}' đã được lưu với duration: {duration:.1f}s")
-        return f"✅ Đã lưu giọng '{voice_id}' (~{duration:.1f}s)", gr.update(choices=voice_choices, value=voice_id)
+        yield f"✅ Đã lưu giọng '{voice_id}' (~{duration:.1f}s)", gr.update(choices=voice_choices, value=voice_id)
     else:
         print(f"⚠️  Không tìm thấy voices sau khi đăng ký")
-        return f"✅ Đã lưu giọng '{voice_id}'", gr.update(choices=voice_choices, value=voice_id)
+        yield f"✅ Đã lưu giọng '{voice_id}'", gr.update(choices=voice_choices, value=voice_id)
+
+def tts_status_text():
+    """Trạng thái model TTS (đang load nền khi app khởi động) cho UI."""
+    status = tts_status()
+    if status["state"] == "ready":
+        return f"✅ Model TTS sẵn sàng: {status['model_type']} (load {status['load_seconds']:.1f}s)"
+    if status["state"] == "loading":
+        return f"⏳ Đang load model TTS... ({status.get('elapsed', 0):.0f}s)"
+    if status["state"] == "failed":
+        return f"❌ Load model TTS thất bại: {status['error']}"
+    return "💤 Model TTS sẽ được load khi cần"
 
 def create_lecture_input_interface():
     with gr.Row(equal_height=False):        
@@ -296,6 +309,9 @@ def create_lecture_input_interface():
                 file_types=[".wav", ".mp3"],
                 type="file"  # thay filepath thành file
             )
+            # Trạng thái load model TTS, cập nhật mỗi 2 giây
+            gr.Textbox(label="Model TTS", value=tts_status_text, every=2, interactive=False)
+
             # Nút đăng ký giọng
             register_voice_btn = gr.Button("💾 Đăng ký giọng", variant="primary")
             register_voice_status = gr.Textbox(
@@ -347,7 +363,9 @@ def create_lecture_input_interface():
                             print(f"  - meta.json exists: {meta_file.exists()}")
                             print(f"  - embedding.npy exists: {emb_file.exists()}")
                 
-                # Kiểm tra list_voices function
+                # Kiểm tra list_voices function (đọc lại index từ đĩa trước)
+                from src.voice.store import refresh_index
+                refresh_index()
                 voices = list_voices("current_user")
                 print(f"🔍 list_voices result: {voices}")
                 
@@ -381,6 +399,7 @@ def create_lecture_input_interface():
                     lecture_is_still_mode = gr.Checkbox(label="Still Mode")
                     lecture_batch_size = gr.Slider(label="Batch size", step=1, maximum=10, value=6)
                     lecture_enhancer = gr.Checkbox(label="GFPGAN Face enhancer")
+                    lecture_precision = gr.Radio(['fp32', 'bf16'], value='fp32', label='Độ chính xác (bf16 nhanh hơn trên CPU hỗ trợ)')
                     lecture_fast_mode_btn = gr.Button('⚡ Chế độ nhanh')
                     lecture_fast_mode_btn.click(
                         fn=set_lecture_fast_mode,
@@ -467,6 +486,7 @@ def create_lecture_input_interface():
         'is_still_mode': lecture_is_still_mode,
         'batch_size': lecture_batch_size,
         'enhancer': lecture_enhancer,
+        'precision': lecture_precision,
         'fast_mode_btn': lecture_fast_mode_btn,
         'final_video': lecture_final_video,
         'info': lecture_info
@@ -3,10 +3,16 @@ import gradio as gr
 import tempfile
 import time
 import shutil
+import threading
+import subprocess
 from datetime import datetime
 from moviepy.editor import VideoFileClip, concatenate_videoclips, CompositeVideoClip, TextClip, ImageClip, AudioFileClip
 from PIL import Image, ImageDraw, ImageFont
 from lecture_input import convert_text_to_audio, convert_text_to_audio_with_voice, extract_slides_from_pptx
+from src.utils.pipeline import StagePipeline
+from src.utils.compositor import COMPOSITORS
+from src.utils.slide_cache import get_slide_cache
+from pydub import AudioSegment
 
 def get_audio_duration(audio_path):
     """
@@ -66,7 +72,7 @@ def create_slide_image_with_text(text, output_path, width=1920, height=1080):
         print(f"Error creating slide image: {str(e)}")
         return None
 
-def generate_video_for_text(sad_talker, source_image, text, language, user_id, voice_id, preprocess_type, is_still_mode, enhancer, batch_size, size_of_image, pose_style):
+def generate_video_for_text(sad_talker, source_image, text, language, user_id, voice_id, preprocess_type, is_still_mode, enhancer, batch_size, size_of_image, pose_style, precision='fp32'):
     """
     Generate video for a single text using SadTalker
     REQUIRES voice_id to be provided
@@ -95,12 +101,16 @@ def generate_video_for_text(sad_talker, source_image, text, language, user_id, v
         # Generate video using the same method as the main interface
         video_path = sad_talker.test(
             source_image, audio_path, preprocess_type, is_still_mode, 
-            enhancer, batch_size, size_of_image, pose_style
+            enhancer, batch_size, size_of_image, pose_style, precision=precision
         )
         
-        # Clean up temporary audio file
+        # Clean up temporary audio file and its TTS request dir
         if os.path.exists(audio_path):
             os.remove(audio_path)
+            try:
+                os.rmdir(os.path.dirname(audio_path))
+            except OSError:
+                pass
         
         if video_path and os.path.exists(video_path):
             print(f"✅ Video generated successfully: {video_path}")
@@ -113,7 +123,7 @@ def generate_video_for_text(sad_talker, source_image, text, language, user_id, v
         print(f"Error generating video for text: {str(e)}")
         return None
 
-def generate_video_for_text_with_audio(sad_talker, source_image, audio_path, preprocess_type, is_still_mode, enhancer, batch_size, size_of_image, pose_style):
+def generate_video_for_text_with_audio(sad_talker, source_image, audio_path, preprocess_type, is_still_mode, enhancer, batch_size, size_of_image, pose_style, precision='fp32'):
     """
     Generate video using existing audio file (for lecture video)
     """
@@ -135,7 +145,7 @@ def generate_video_for_text_with_audio(sad_talker, source_image, audio_path, pre
         # Generate video using the existing audio file
         video_path = sad_talker.test(
             source_image, audio_path, preprocess_type, is_still_mode, 
-            enhancer, batch_size, size_of_image, pose_style
+            enhancer, batch_size, size_of_image, pose_style, precision=precision
         )
         
         # DON'T clean up audio file here - it's used by the lecture video
@@ -152,13 +162,131 @@ def generate_video_for_text_with_audio(sad_talker, source_image, audio_path, pre
         print(f"Error generating video with existing audio: {str(e)}")
         return None
 
-def create_lecture_video(sad_talker, slides_data, source_image, language, user_id, voice_id, preprocess_type, is_still_mode, enhancer, batch_size, size_of_image, pose_style):
+def concat_videos(video_paths, output_path):
+    """
+    Join segments that share codec settings with the ffmpeg concat demuxer, without re-encoding
+    """
+    list_path = output_path + '.txt'
+    with open(list_path, 'w', encoding='utf-8') as f:
+        for path in video_paths:
+            f.write("file '%s'\n" % os.path.abspath(path).replace("'", "'\\''"))
+    cmd = ['ffmpeg', '-y', '-hide_banner', '-loglevel', 'error', '-f', 'concat', '-safe', '0',
+           '-i', list_path, '-c', 'copy', output_path]
+    try:
+        result = subprocess.run(cmd, capture_output=True, text=True)
+    finally:
+        os.remove(list_path)
+    if result.returncode != 0:
+        raise RuntimeError(f"ffmpeg concat failed: {result.stderr.strip()}")
+    return output_path
+
+def composite_slide_video(slide_image_path, teacher_video_path, audio_path, audio_duration, output_path):
+    """
+    Picture-in-picture of the teacher video over the slide image, written to its own segment
+    """
+    slide_clip = ImageClip(slide_image_path, duration=audio_duration)
+    teacher_clip = VideoFileClip(teacher_video_path)
+    audio_clip = None
+    composite_clip = None
+    try:
+        # Resize teacher video to fit in bottom-right corner (picture-in-picture)
+        # Calculate size: 25% of slide width, maintain aspect ratio
+        slide_width, slide_height = slide_clip.size
+        teacher_width = int(slide_width * 0.25)
+        teacher_height = int(teacher_width * teacher_clip.h / teacher_clip.w)
+        resized_teacher = teacher_clip.resize((teacher_width, teacher_height))
+
+        # Position teacher video in bottom-right corner
+        teacher_x = slide_width - teacher_width - 50  # 50px margin
+        teacher_y = slide_height - teacher_height - 50  # 50px margin
+        resized_teacher = resized_teacher.set_position((teacher_x, teacher_y))
+
+        composite_clip = CompositeVideoClip([slide_clip, resized_teacher])
+        try:
+            audio_clip = AudioFileClip(audio_path)
+            composite_clip = composite_clip.set_audio(audio_clip)
+        except Exception as e:
+            print(f"⚠️ No audio added to composite video: {str(e)}")
+
+        # every segment uses the same fps and codecs so they can be concatenated without re-encoding
+        composite_clip.write_videofile(output_path, fps=25, codec='libx264', audio_codec='aac', verbose=False, logger=None)
+    finally:
+        for clip in (composite_clip, audio_clip, teacher_clip, slide_clip):
+            if clip is not None:
+                try:
+                    clip.close()
+                except Exception as e:
+                    print(f"⚠️ Could not close clip: {str(e)}")
+    return output_path
+
+def concat_narration(audio_paths, output_path, sr=16000, fps=25, min_duration=3.0):
+    """
+    Join the slide narrations into one track for a single talking-head render.
+    Every slide is padded with silence to a whole number of video frames, so slide boundaries
+    fall on frame edges of the teacher video. Returns (start, duration) of every slide in seconds.
+    """
+    samples_per_frame = sr // fps
+    track = AudioSegment.silent(duration=0, frame_rate=sr)
+    spans = []
+    for path in audio_paths:
+        segment = AudioSegment.from_file(path).set_frame_rate(sr).set_channels(1).set_sample_width(2)
+        num_samples = int(segment.frame_count())
+        if num_samples <= 0.1 * sr:
+            num_samples = int(min_duration * sr)  # Minimum 3 seconds per slide, like the per-slide path
+        num_samples = -(-num_samples // samples_per_frame) * samples_per_frame
+        raw = segment.raw_data[:num_samples * 2]
+        raw += b'\0' * (num_samples * 2 - len(raw))
+        start = track.frame_count() / sr
+        track += segment._spawn(raw)
+        spans.append((start, num_samples / sr))
+    track.export(output_path, format='wav')
+    return spans
+
+def render_lecture_single_pass(sad_talker, jobs, source_image, output_dir, preprocess_type, is_still_mode, enhancer, batch_size, size_of_image, pose_style, precision='fp32'):
+    """
+    Render one teacher video for the whole lecture and record where every slide starts in it.
+    get_data, audio-to-coefficients and the face renderer run once, so head pose and blinks are
+    continuous across slide changes and the fixed cost of SadTalker.test is paid once.
+    """
+    narration_path = os.path.join(output_dir, "lecture_narration.wav")
+    spans = concat_narration([job['audio_path'] for job in jobs], narration_path)
+    print(f"🎙️ Lecture narration: {sum(d for _, d in spans):.2f}s over {len(jobs)} slides")
+
+    teacher_video_path = generate_video_for_text_with_audio(
+        sad_talker, source_image, narration_path, 
+        preprocess_type, is_still_mode, enhancer, batch_size, size_of_image, pose_style, precision=precision
+    )
+    if os.path.exists(narration_path):
+        os.remove(narration_path)
+    if not teacher_video_path or not os.path.exists(teacher_video_path):
+        return None
+
+    for job, (start, duration) in zip(jobs, spans):
+        job.update(teacher_video_path=teacher_video_path, teacher_start=start, audio_duration=duration)
+    return teacher_video_path
+
+def create_lecture_video(sad_talker, slides_data, source_image, language, user_id, voice_id, preprocess_type, is_still_mode, enhancer, batch_size, size_of_image, pose_style, precision='fp32',
+                         tts_workers=1, render_workers=1, composite_workers=2, queue_size=2, compositor='ffmpeg', single_pass=True):
     """
     Create a lecture video combining slides and teacher video
+
+    With single_pass the narrations of all slides are joined and the teacher video is rendered
+    once for the whole lecture, then split by slide timestamps while compositing.
+    Otherwise slides go through pipelined stages (TTS, talking head) connected by bounded queues,
+    so while slide N is rendered the audio of slide N+1 is synthesized. SadTalker.test is not
+    re-entrant, keep render_workers at 1. compositor='ffmpeg' composites the whole lecture in one
+    ffmpeg filter graph at the end; 'moviepy' without single_pass composites every slide in a third stage.
+    The cached slide images are pinned until the video is done, so eviction cannot remove them mid-job.
     """
+    slide_cache = get_slide_cache()
+    pinned = slide_cache.acquire(slide_data.get('image_path') for slide_data in slides_data or [])
     try:
         if not slides_data:
             return None, "❌ Không có slide nào để xử lý!"
+
+        # Bắt buộc phải có voice_id cho tất cả slides
+        if not voice_id:
+            raise Exception("❌ Vui lòng chọn giọng nhân bản trước khi tạo video bài giảng!")
         
         # Create output directory
         output_dir = os.path.join("results", f"lecture_{datetime.now().strftime('%Y%m%d_%H%M%S')}")
@@ -175,201 +303,151 @@ def create_lecture_video(sad_talker, slides_data, source_image, language, user_i
         
         shutil.copy2(source_image, safe_image_path)
         print(f"✅ Source image copied to safe location: {safe_image_path}")
-        
-        # Process each slide
-        slide_clips = []
-        total_duration = 0
-        temp_video_files = []  # Track temporary video files for cleanup
-        
-        for i, slide_data in enumerate(slides_data):
-            print(f"\n--- Processing slide {i+1}/{len(slides_data)} ---")
-            
-            # Verify source image exists before each slide processing
-            if not os.path.exists(safe_image_path):
-                print(f"⚠️ Source image lost, copying again...")
-                if os.path.exists(source_image):
-                    shutil.copy2(source_image, safe_image_path)
-                    print(f"✅ Source image re-copied")
-                else:
-                    print(f"❌ Original source image also lost, stopping process")
-                    break
-            
-            # Determine slide image: use original if available, otherwise generate from text
-            slide_image_path = os.path.join(output_dir, f"slide_{i+1:02d}.png")
+
+        temp_files = []  # Track temporary files for cleanup
+        temp_lock = threading.Lock()
+
+        def track(path):
+            with temp_lock:
+                temp_files.append(path)
+            return path
+
+        def tts_stage(job):
+            i, slide_data = job['index'], job['slide']
+            print(f"\n--- TTS slide {i+1}/{len(slides_data)} ---")
+
+            # Determine slide image: use the cached rendering if available, otherwise generate from text
             original_image = slide_data.get('image_path')
             if original_image and os.path.exists(original_image):
-                # Copy the original slide image into the output directory
-                try:
-                    shutil.copy2(original_image, slide_image_path)
-                except Exception as e:
-                    print(f"⚠️ Could not copy original slide image for slide {i+1}: {e}")
-                    # Fallback: create a placeholder image with text
-                    generated = create_slide_image_with_text(slide_data['text'], slide_image_path)
-                    if not generated:
-                        print(f"❌ Failed to create slide image for slide {i+1}")
-                        continue
+                # already rendered at video resolution by the slide cache, used in place
+                slide_image_path = original_image
             else:
-                # No original image available; create a placeholder image from text
-                generated = create_slide_image_with_text(slide_data['text'], slide_image_path)
-                if not generated:
+                # No usable original image; create a placeholder image from text
+                slide_image_path = track(os.path.join(output_dir, f"slide_{i+1:02d}.png"))
+                if not create_slide_image_with_text(slide_data['text'], slide_image_path):
                     print(f"❌ Failed to create slide image for slide {i+1}")
-                    continue
+                    return None
 
-            # Bắt buộc phải có voice_id cho tất cả slides
-            if not voice_id:
-                raise Exception("❌ Vui lòng chọn giọng nhân bản trước khi tạo video bài giảng!")
-            
             # Generate audio for slide text using registered voice (bắt buộc)
             audio_path = convert_text_to_audio_with_voice(slide_data['text'], user_id, voice_id, language)
-                    
             if not audio_path:
                 print(f"❌ Failed to generate audio for slide {i+1}")
-                continue
-                
+                return None
+
+            # keep the narration next to the slide; the TTS request dir it came from is removed once empty
+            slide_audio_path = track(os.path.join(output_dir, f"slide_{i+1:02d}_audio{os.path.splitext(audio_path)[1]}"))
+            shutil.move(audio_path, slide_audio_path)
+            try:
+                os.rmdir(os.path.dirname(audio_path))
+            except OSError:
+                pass
+
             # Get audio duration
-            audio_duration = get_audio_duration(audio_path)
+            audio_duration = get_audio_duration(slide_audio_path)
             print(f"Audio duration for slide {i+1}: {audio_duration:.2f} seconds")
             
             # If audio duration is 0 or very short, set a minimum duration
             if audio_duration <= 0.1:
                 audio_duration = 3.0  # Minimum 3 seconds per slide
                 print(f"⚠️ Audio duration too short, setting to minimum: {audio_duration}s")
-            
+
+            job.update(slide_image_path=slide_image_path, audio_path=slide_audio_path, audio_duration=audio_duration)
+            return job
+
+        def talking_head_stage(job):
+            i = job['index']
+            print(f"\n--- Talking head slide {i+1}/{len(slides_data)} ---")
+
+            # Verify source image exists before each slide processing
+            if not os.path.exists(safe_image_path):
+                print(f"⚠️ Source image lost, copying again...")
+                if not os.path.exists(source_image):
+                    raise Exception("❌ Original source image also lost, stopping process")
+                shutil.copy2(source_image, safe_image_path)
+
+            # SadTalker moves its inputs into its own result dir, give it a copy of the slide audio
+            base, ext = os.path.splitext(job['audio_path'])
+            driven_audio = base + '_driven' + ext
+            shutil.copy2(job['audio_path'], driven_audio)
+
             # Generate teacher video using the SAME audio we created for the slide
             teacher_video_path = generate_video_for_text_with_audio(
-                sad_talker, safe_image_path, audio_path, 
-                preprocess_type, is_still_mode, enhancer, batch_size, size_of_image, pose_style
+                sad_talker, safe_image_path, driven_audio, 
+                preprocess_type, is_still_mode, enhancer, batch_size, size_of_image, pose_style, precision=precision
             )
+            if os.path.exists(driven_audio):
+                os.remove(driven_audio)
             
             if not teacher_video_path or not os.path.exists(teacher_video_path):
                 print(f"❌ Failed to generate teacher video for slide {i+1}")
-                # Clean up audio
-                if os.path.exists(audio_path):
-                    os.remove(audio_path)
-                continue
-            
-            # Add small delay to ensure file is fully written
-            time.sleep(1)
-            
-            # Create slide video clip (static image for audio duration)
-            slide_clip = ImageClip(slide_image_path, duration=audio_duration)
-            
-            # Load teacher video clip with error handling
-            try:
-                teacher_clip = VideoFileClip(teacher_video_path)
-            except Exception as e:
-                print(f"❌ Error loading teacher video for slide {i+1}: {str(e)}")
-                # Clean up audio
-                if os.path.exists(audio_path):
-                    os.remove(audio_path)
-                continue
-            
-            # Resize teacher video to fit in bottom-right corner (picture-in-picture)
-            # Calculate size: 25% of slide width, maintain aspect ratio
-            slide_width, slide_height = slide_clip.size
-            teacher_width = int(slide_width * 0.25)
-            teacher_height = int(teacher_width * teacher_clip.h / teacher_clip.w)
-            
-            # Resize teacher video
-            teacher_clip = teacher_clip.resize((teacher_width, teacher_height))
-            
-            # Position teacher video in bottom-right corner
-            teacher_x = slide_width - teacher_width - 50  # 50px margin
-            teacher_y = slide_height - teacher_height - 50  # 50px margin
-            teacher_clip = teacher_clip.set_position((teacher_x, teacher_y))
-            
-            # Load audio for the composite video
+                return None
+
+            job['teacher_video_path'] = track(teacher_video_path)
+            print(f"📁 Teacher video saved for slide {i+1}: {os.path.basename(teacher_video_path)}")
+            return job
+
+        def composite_stage(job):
+            i = job['index']
+            segment_path = track(os.path.join(output_dir, f"segment_{i+1:02d}.mp4"))
             try:
-                audio_clip = AudioFileClip(audio_path)
-                print(f"✅ Audio loaded for slide {i+1}: {audio_path}")
+                composite_slide_video(job['slide_image_path'], job['teacher_video_path'],
+                                      job['audio_path'], job['audio_duration'], segment_path)
             except Exception as e:
-                print(f"❌ Error loading audio for slide {i+1}: {str(e)}")
-                audio_clip = None
-            
-            # Composite slide and teacher video
-            composite_clip = CompositeVideoClip([slide_clip, teacher_clip])
-            
-            # Add audio to the composite video
-            if audio_clip:
-                composite_clip = composite_clip.set_audio(audio_clip)
-                print(f"✅ Audio added to composite video for slide {i+1}")
-            else:
-                print(f"⚠️ No audio added to composite video for slide {i+1}")
-            
-            # Add to clips list
-            slide_clips.append(composite_clip)
-            total_duration += audio_duration
-            
-            # Track video file for later cleanup
-            temp_video_files.append(teacher_video_path)
-            
-            print(f"✅ Slide {i+1} processed: {audio_duration:.2f}s")
-            
-            # Clean up temporary files with delay
-            time.sleep(0.5)  # Small delay before cleanup
-            if os.path.exists(audio_path):
-                try:
-                    os.remove(audio_path)
-                except Exception as e:
-                    print(f"⚠️ Could not remove audio file: {str(e)}")
-            
-            # Don't delete teacher video file immediately - it might still be in use
-            # We'll clean it up later in the final cleanup
-            print(f"📁 Teacher video saved for slide {i+1}: {os.path.basename(teacher_video_path)}")
+                print(f"❌ Error compositing slide {i+1}: {str(e)}")
+                return None
+            job['segment_path'] = segment_path
+            print(f"✅ Slide {i+1} processed: {job['audio_duration']:.2f}s")
+            return job
+
+        per_slide_composite = compositor == 'moviepy' and not single_pass
+        stages = [('tts', tts_stage, tts_workers)]
+        if not single_pass:
+            stages.append(('talking_head', talking_head_stage, render_workers))
+        if per_slide_composite:
+            stages.append(('composite', composite_stage, composite_workers))
+        pipeline = StagePipeline(stages, queue_size=queue_size)
+        start_time = time.time()
+        jobs = pipeline.run({'index': i, 'slide': slide_data} for i, slide_data in enumerate(slides_data))
+
+        if jobs and single_pass:
+            print(f"\n--- Rendering teacher video for the whole lecture ---")
+            teacher_video_path = render_lecture_single_pass(
+                sad_talker, jobs, safe_image_path, output_dir,
+                preprocess_type, is_still_mode, enhancer, batch_size, size_of_image, pose_style, precision=precision
+            )
+            if not teacher_video_path:
+                return None, "❌ Không thể tạo video giáo viên cho bài giảng!"
+            track(teacher_video_path)
+        wall_time = time.time() - start_time
         
-        if not slide_clips:
+        if not jobs:
             return None, "❌ Không thể tạo video cho bất kỳ slide nào!"
+
+        total_duration = sum(job['audio_duration'] for job in jobs)
         
         print(f"\n--- Creating final lecture video ---")
-        print(f"Total slides: {len(slide_clips)}")
+        print(f"Total slides: {len(jobs)}")
         print(f"Total duration: {total_duration:.2f} seconds")
+        print("⏱️ Stage busy time: " + ", ".join(f"{name} {t:.1f}s" for name, t in pipeline.stage_times.items()) + f", wall time {wall_time:.1f}s")
         
-        # Concatenate all slide clips
         final_video_path = os.path.join(output_dir, "lecture_final.mp4")
-        final_video = concatenate_videoclips(slide_clips, method="compose")
-        
         print(f"Writing final video to: {final_video_path}")
-        final_video.write_videofile(final_video_path, codec='libx264', audio_codec='aac', verbose=False, logger=None)
-        
-        # Clean up clips
-        for clip in slide_clips:
-            try:
-                clip.close()
-            except Exception as e:
-                print(f"⚠️ Could not close clip: {str(e)}")
-        try:
-            final_video.close()
-        except Exception as e:
-            print(f"⚠️ Could not close final video: {str(e)}")
-        
-        # Add delay before cleanup
-        time.sleep(1)
-        
-        # Clean up temporary slide images
-        for i in range(len(slides_data)):
-            slide_image_path = os.path.join(output_dir, f"slide_{i+1:02d}.png")
-            if os.path.exists(slide_image_path):
-                try:
-                    os.remove(slide_image_path)
-                except Exception as e:
-                    print(f"⚠️ Could not remove slide image {i+1}: {str(e)}")
-        
-        # Clean up source image copy
-        if os.path.exists(safe_image_path):
-            try:
-                os.remove(safe_image_path)
-            except Exception as e:
-                print(f"⚠️ Could not remove source image copy: {str(e)}")
-        
-        # Clean up temporary video files
-        print("🧹 Cleaning up temporary video files...")
-        for video_file in temp_video_files:
-            if os.path.exists(video_file):
+        if per_slide_composite:
+            # Concatenate all slide segments
+            concat_videos([job['segment_path'] for job in jobs], final_video_path)
+        else:
+            composite_start = time.time()
+            COMPOSITORS[compositor](jobs, final_video_path)
+            print(f"⏱️ {compositor} compositing: {time.time() - composite_start:.1f}s")
+        
+        # Clean up temporary slide images, audio, teacher videos and segments
+        print("🧹 Cleaning up temporary files...")
+        for path in temp_files + [safe_image_path]:
+            if os.path.exists(path):
                 try:
-                    os.remove(video_file)
-                    print(f"  ✅ Deleted: {os.path.basename(video_file)}")
+                    os.remove(path)
                 except Exception as e:
-                    print(f"  ❌ Could not delete {os.path.basename(video_file)}: {str(e)}")
+                    print(f"  ❌ Could not delete {os.path.basename(path)}: {str(e)}")
         
         # Also clean up temporary SadTalker directories
         print("🗂️ Cleaning up temporary SadTalker directories...")
@@ -396,8 +474,10 @@ def create_lecture_video(sad_talker, slides_data, source_image, language, user_i
     except Exception as e:
         print(f"Error in create_lecture_video: {str(e)}")
         return None, f"❌ Lỗi tạo video bài giảng: {str(e)}"
+    finally:
+        slide_cache.release(pinned)
 
-def generate_lecture_video_handler(sad_talker, pptx, img, voice_id, preprocess, still, enh, batch, size, pose):
+def generate_lecture_video_handler(sad_talker, pptx, img, voice_id, preprocess, still, enh, batch, size, pose, precision='fp32'):
     """Handler function for generating lecture video"""
     if not pptx or not img:
         return None, "❌ Vui lòng chọn file PowerPoint và ảnh giáo viên!"
@@ -415,5 +495,5 @@ def generate_lecture_video_handler(sad_talker, pptx, img, voice_id, preprocess,
     
     # Ngôn ngữ sẽ được lấy từ giọng nhân bản, không cần tham số lang
     return create_lecture_video(
-        sad_talker, slides_data, img, None, user_id, voice_id, preprocess, still, enh, batch, size, pose
+        sad_talker, slides_data, img, None, user_id, voice_id, preprocess, still, enh, batch, size, pose, precision
     )
@@ -2,15 +2,13 @@
 import os
 import shutil
 from argparse import Namespace
-from src.utils.preprocess import CropAndExtract
-from src.test_audio2coeff import Audio2Coeff
-from src.facerender.animate import AnimateFromCoeff
 from src.generate_batch import get_data
 from src.generate_facerender_batch import get_facerender_data
-from src.utils.init_path import init_path
+from src.utils.model_pool import get_model_pool
 from cog import BasePredictor, Input, Path
 
 checkpoints = "checkpoints"
+checkpoint_size = 512
 
 
 class Predictor(BasePredictor):
@@ -18,29 +16,12 @@ class Predictor(BasePredictor):
         """Load the model into memory to make running multiple predictions efficient"""
         device = "cuda"
 
-        
-        sadtalker_paths = init_path(checkpoints,os.path.join("src","config"))
-
-        # init model
-        self.preprocess_model = CropAndExtract(sadtalker_paths, device
-        )
-
-        self.audio_to_coeff = Audio2Coeff(
-            sadtalker_paths,
-            device,
+        # init model, one bundle per preprocess family so "full" gets the still facerender
+        self.model_pool = get_model_pool(checkpoints, os.path.join("src", "config"))
+        self.model_pool.warmup(
+            [(checkpoint_size, "crop"), (checkpoint_size, "full")], device, enhancer="gfpgan"
         )
 
-        self.animate_from_coeff = {
-            "full": AnimateFromCoeff(
-                sadtalker_paths,
-                device,
-            ),
-            "others": AnimateFromCoeff(
-                sadtalker_paths,
-                device,
-            ),
-        }
-
     def predict(
         self,
         source_image: Path = Input(
@@ -74,16 +55,15 @@ class Predictor(BasePredictor):
     ) -> Path:
         """Run a single prediction on the model"""
 
-        animate_from_coeff = (
-            self.animate_from_coeff["full"]
-            if preprocess == "full"
-            else self.animate_from_coeff["others"]
-        )
+        device = "cuda"
+        models = self.model_pool.get(checkpoint_size, preprocess, device)
+        preprocess_model = models.preprocess_model
+        audio_to_coeff = models.audio_to_coeff
+        animate_from_coeff = models.animate_from_coeff
 
         args = load_default()
         args.pic_path = str(source_image)
         args.audio_path = str(driven_audio)
-        device = "cuda"
         args.still = still
         args.ref_eyeblink = None if ref_eyeblink is None else str(ref_eyeblink)
         args.ref_pose = None if ref_pose is None else str(ref_pose)
@@ -97,7 +77,7 @@ class Predictor(BasePredictor):
         os.makedirs(first_frame_dir)
 
         print("3DMM Extraction for source image")
-        first_coeff_path, crop_pic_path, crop_info = self.preprocess_model.generate(
+        first_coeff_path, crop_pic_path, crop_info = preprocess_model.generate(
             args.pic_path, first_frame_dir, preprocess, source_image_flag=True
         )
         if first_coeff_path is None:
@@ -111,7 +91,7 @@ class Predictor(BasePredictor):
             ref_eyeblink_frame_dir = os.path.join(results_dir, ref_eyeblink_videoname)
             os.makedirs(ref_eyeblink_frame_dir, exist_ok=True)
             print("3DMM Extraction for the reference video providing eye blinking")
-            ref_eyeblink_coeff_path, _, _ = self.preprocess_model.generate(
+            ref_eyeblink_coeff_path, _, _ = preprocess_model.generate(
                 ref_eyeblink, ref_eyeblink_frame_dir
             )
         else:
@@ -125,7 +105,7 @@ class Predictor(BasePredictor):
                 ref_pose_frame_dir = os.path.join(results_dir, ref_pose_videoname)
                 os.makedirs(ref_pose_frame_dir, exist_ok=True)
                 print("3DMM Extraction for the reference video providing pose")
-                ref_pose_coeff_path, _, _ = self.preprocess_model.generate(
+                ref_pose_coeff_path, _, _ = preprocess_model.generate(
                     ref_pose, ref_pose_frame_dir
                 )
         else:
@@ -139,7 +119,7 @@ class Predictor(BasePredictor):
             ref_eyeblink_coeff_path,
             still=still,
         )
-        coeff_path = self.audio_to_coeff.generate(
+        coeff_path = audio_to_coeff.generate(
             batch, results_dir, args.pose_style, ref_pose_coeff_path
         )
         # coeff2video
@@ -0,0 +1,87 @@
+"""
+CPU frames/sec of the reference video 3DMM extraction: one align_img and batch-1 net_recon
+forward per frame (the old loop) against CropAndExtract.extract_3dmm at several batch sizes.
+net_recon has random weights and the frames are noise with jittered landmarks, so no
+checkpoint or video is needed.
+
+    python scripts/benchmark_3dmm.py --frames 200 --batch_sizes 1 4 16 32
+"""
+import os
+import sys
+import time
+from argparse import ArgumentParser
+
+import numpy as np
+import torch
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.face3d.models import networks
+from src.face3d.util.preprocess import align_img
+from src.utils.preprocess import CropAndExtract, split_coeff
+
+# 5 standard 3D landmarks (eyes, nose, mouth corners), close to similarity_Lm3D_all.mat
+LM3D_STD = np.array([[-0.31, 0.29, 0.13], [0.31, 0.29, 0.13], [0., 0., 0.48],
+                     [-0.25, -0.34, 0.21], [0.25, -0.34, 0.21]])
+
+
+def make_inputs(n, size, seed=0):
+    rng = np.random.default_rng(seed)
+    frames = [Image.fromarray(rng.integers(0, 255, (size, size, 3), dtype=np.uint8)) for _ in range(n)]
+    base = (LM3D_STD[:, :2] + 1) / 2 * size
+    lm = base[None] + rng.normal(0, 2, (n, 5, 2))
+    lm[..., 1] = size - 1 - lm[..., 1]     # image convention, as the landmark extractor writes them
+    return frames, lm.astype(np.float32)
+
+
+def per_frame(extractor, frames, lm):
+    """ The extraction loop as it was before batching, without its logging. """
+    W, H = frames[0].size
+    coeffs = []
+    for idx, frame in enumerate(frames):
+        lm1 = lm[idx].copy()
+        lm1[:, -1] = H - 1 - lm1[:, -1]
+        trans_params, im1, _, _ = align_img(frame, lm1, extractor.lm3d_std)
+        im_t = torch.tensor(np.array(im1)/255., dtype=torch.float32).permute(2, 0, 1).unsqueeze(0)
+        with torch.no_grad():
+            full_coeff = extractor.net_recon(im_t)
+        c = split_coeff(full_coeff)
+        coeffs.append(torch.cat([c['exp'], c['angle'], c['trans']], 1).numpy())
+    return np.concatenate(coeffs, 0)
+
+
+def main(args):
+    torch.manual_seed(0)
+    if args.threads:
+        torch.set_num_threads(args.threads)
+
+    # skip __init__: no checkpoints and no face detector are needed here
+    extractor = CropAndExtract.__new__(CropAndExtract)
+    extractor.net_recon = networks.define_net_recon(net_recon='resnet50', use_last_fc=False, init_path='').eval()
+    extractor.lm3d_std = LM3D_STD
+    extractor.device = 'cpu'
+
+    frames, lm = make_inputs(args.frames, args.size)
+    print(f'frames: {args.frames}, size: {args.size}, threads: {torch.get_num_threads()}')
+
+    start = time.time()
+    reference = per_frame(extractor, frames, lm)
+    old_time = time.time() - start
+    print(f'per frame       : {args.frames / old_time:7.2f} frames/sec ({old_time:.1f}s)')
+
+    for batch_size in args.batch_sizes:
+        start = time.time()
+        coeff_3dmm, _ = extractor.extract_3dmm(frames, lm, batch_size=batch_size)
+        elapsed = time.time() - start
+        print(f'batch {batch_size:<10}: {args.frames / elapsed:7.2f} frames/sec ({elapsed:.1f}s), '
+              f'{old_time / elapsed:.2f}x, max abs diff {np.abs(coeff_3dmm - reference).max():.2e}')
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument('--frames', type=int, default=200)
+    parser.add_argument('--size', type=int, default=256, help='pic_size of the cropped reference frames')
+    parser.add_argument('--batch_sizes', type=int, nargs='+', default=[1, 4, 16, 32])
+    parser.add_argument('--threads', type=int, default=0)
+    main(parser.parse_args())
@@ -0,0 +1,75 @@
+"""
+Wall time of the lecture compositors: one ffmpeg filter graph for the whole lecture against the
+moviepy CompositeVideoClip + concatenate_videoclips path. Synthetic slides, teacher videos and
+narration are generated with ffmpeg, so only ffmpeg and moviepy are needed.
+
+    python scripts/benchmark_compositor.py --slides 5 --seconds 8
+"""
+import os
+import sys
+import time
+import shutil
+import tempfile
+import subprocess
+from argparse import ArgumentParser
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.utils.compositor import composite_lecture_ffmpeg, composite_lecture_moviepy
+
+
+def ffmpeg(*args):
+    subprocess.run(['ffmpeg', '-y', '-hide_banner', '-loglevel', 'error'] + list(args), check=True)
+
+
+def make_segments(root, slides, seconds, width, height, teacher_size):
+    segments = []
+    for i in range(slides):
+        slide = os.path.join(root, f'slide_{i:02d}.png')
+        teacher = os.path.join(root, f'teacher_{i:02d}.mp4')
+        audio = os.path.join(root, f'audio_{i:02d}.wav')
+        ffmpeg('-f', 'lavfi', '-i', f'testsrc2=size={width}x{height}', '-frames:v', '1', slide)
+        ffmpeg('-f', 'lavfi', '-i', f'testsrc=size={teacher_size}x{teacher_size}:rate=25:duration={seconds}',
+               '-c:v', 'libx264', '-pix_fmt', 'yuv420p', teacher)
+        ffmpeg('-f', 'lavfi', '-i', f'sine=frequency={220 + 40 * i}:duration={seconds}', '-ar', '16000', audio)
+        segments.append({'slide_image_path': slide, 'teacher_video_path': teacher,
+                         'audio_path': audio, 'audio_duration': float(seconds)})
+    return segments
+
+
+def main(args):
+    root = tempfile.mkdtemp(prefix='compositor_bench_')
+    try:
+        segments = make_segments(root, args.slides, args.seconds, args.width, args.height, args.teacher_size)
+        total = args.slides * args.seconds
+
+        timings = {}
+        for name, fn in (('ffmpeg', composite_lecture_ffmpeg), ('moviepy', composite_lecture_moviepy)):
+            if name in args.skip:
+                continue
+            start = time.time()
+            fn(segments, os.path.join(root, f'lecture_{name}.mp4'))
+            timings[name] = time.time() - start
+
+        print(f'slides: {args.slides}, {total}s of video at {args.width}x{args.height}')
+        for name, elapsed in timings.items():
+            print(f'{name:<8}: {elapsed:7.1f}s ({total / elapsed:5.2f}x realtime)')
+        if len(timings) == 2:
+            print(f'speedup : {timings["moviepy"] / timings["ffmpeg"]:.2f}x')
+    finally:
+        if args.keep:
+            print(f'outputs kept in {root}')
+        else:
+            shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument('--slides', type=int, default=5)
+    parser.add_argument('--seconds', type=int, default=8, help='narration length of every slide')
+    parser.add_argument('--width', type=int, default=1920)
+    parser.add_argument('--height', type=int, default=1080)
+    parser.add_argument('--teacher_size', type=int, default=256)
+    parser.add_argument('--skip', nargs='*', default=[], choices=['ffmpeg', 'moviepy'])
+    parser.add_argument('--keep', action='store_true', help='keep the generated inputs and outputs')
+    main(parser.parse_args())
@@ -0,0 +1,93 @@
+"""
+CPU frames/sec of the face renderer: the old per-frame full generator forward against
+the encode-once, batch-many path in make_animation. Weights are random, so no checkpoint
+is needed; the numbers only depend on the architecture in the facerender yaml.
+
+    python scripts/benchmark_facerender.py --frames 50 --batch_size 2 --render_batch_size 16
+"""
+import os
+import sys
+import time
+from argparse import ArgumentParser
+
+import yaml
+import torch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.facerender.modules.keypoint_detector import KPDetector
+from src.facerender.modules.mapping import MappingNet
+from src.facerender.modules.generator import OcclusionAwareSPADEGenerator
+from src.facerender.modules.make_animation import make_animation, keypoint_transformation
+
+
+def build_models(config_path, device):
+    with open(config_path) as f:
+        config = yaml.safe_load(f)
+    generator = OcclusionAwareSPADEGenerator(**config['model_params']['generator_params'],
+                                             **config['model_params']['common_params'])
+    kp_extractor = KPDetector(**config['model_params']['kp_detector_params'],
+                              **config['model_params']['common_params'])
+    mapping = MappingNet(**config['model_params']['mapping_params'])
+    for m in (generator, kp_extractor, mapping):
+        m.to(device)
+        m.eval()
+    return generator, kp_extractor, mapping
+
+
+def per_frame_animation(source_image, source_semantics, target_semantics, generator, kp_detector, mapping):
+    """ The renderer loop as it was before the encode-once split, kept here as the baseline. """
+    bs = target_semantics.shape[0]
+    source_image = source_image.repeat(bs, 1, 1, 1)
+    source_semantics = source_semantics.repeat(bs, 1, 1)
+    with torch.no_grad():
+        predictions = []
+        kp_canonical = kp_detector(source_image)
+        he_source = mapping(source_semantics)
+        kp_source = keypoint_transformation(kp_canonical, he_source)
+        for frame_idx in range(target_semantics.shape[1]):
+            he_driving = mapping(target_semantics[:, frame_idx])
+            kp_driving = keypoint_transformation(kp_canonical, he_driving)
+            out = generator(source_image, kp_source=kp_source, kp_driving=kp_driving)
+            predictions.append(out['prediction'])
+        return torch.stack(predictions, dim=1)
+
+
+def main(args):
+    torch.manual_seed(0)
+    device = 'cpu'
+    if args.threads:
+        torch.set_num_threads(args.threads)
+
+    generator, kp_extractor, mapping = build_models(args.config, device)
+
+    frames = args.frames + (-args.frames) % args.batch_size
+    source_image = torch.rand(1, 3, args.size, args.size)
+    source_semantics = torch.randn(1, 70, 27) * 0.1
+    target_semantics = torch.randn(args.batch_size, frames // args.batch_size, 70, 27) * 0.1
+
+    start = time.time()
+    old = per_frame_animation(source_image, source_semantics, target_semantics, generator, kp_extractor, mapping)
+    old_time = time.time() - start
+
+    start = time.time()
+    new = make_animation(source_image, source_semantics, target_semantics, generator, kp_extractor, None, mapping,
+                         frame_batch_size=args.render_batch_size)
+    new_time = time.time() - start
+
+    print(f'frames: {frames}, size: {args.size}, threads: {torch.get_num_threads()}')
+    print(f'per-frame forward   : {frames / old_time:7.2f} frames/sec ({old_time:.1f}s)')
+    print(f'encode once, batched: {frames / new_time:7.2f} frames/sec ({new_time:.1f}s)')
+    print(f'speedup             : {old_time / new_time:.2f}x')
+    print(f'max abs diff        : {(old - new).abs().max().item():.2e}')
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument('--config', default=os.path.join('src', 'config', 'facerender.yaml'))
+    parser.add_argument('--frames', type=int, default=50)
+    parser.add_argument('--size', type=int, default=256)
+    parser.add_argument('--batch_size', type=int, default=2, help='the batch size of facerender, as in inference.py')
+    parser.add_argument('--render_batch_size', type=int, default=16, help='frames per renderer call on the new path')
+    parser.add_argument('--threads', type=int, default=0)
+    main(parser.parse_args())
@@ -0,0 +1,66 @@
+"""
+Landmark extraction on a reference video: RetinaFace + FAN on every frame against the
+detect-then-track mode of KeypointExtractor. Reports frames/sec, the number of detector
+calls and how far the tracked landmarks are from the per-frame ones. Needs the facexlib
+weights (downloaded to gfpgan/weights on first use, like the app).
+
+    python scripts/benchmark_landmarks.py --video examples/ref_video/WDA_AlexandriaOcasioCortez_000.mp4
+    python scripts/benchmark_landmarks.py --video ref.mp4 --keyframe_interval 50 --fan_batch_size 16
+"""
+import os
+import sys
+import time
+from argparse import ArgumentParser
+
+import numpy as np
+import torch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.face3d.extract_kp_videos_safe import KeypointExtractor, read_video
+
+
+def main(args):
+    device = 'cuda' if torch.cuda.is_available() and not args.cpu else 'cpu'
+    if args.threads:
+        torch.set_num_threads(args.threads)
+
+    extractor = KeypointExtractor(device)
+    extractor.keyframe_interval = args.keyframe_interval
+    extractor.fan_batch_size = args.fan_batch_size
+    extractor.track_ratio = args.track_ratio
+
+    frames = read_video(args.video)[:args.max_frames or None]
+    frames = [f.resize((args.size, args.size)) for f in frames] if args.size else frames
+    print(f'frames: {len(frames)}, size: {frames[0].size}, device: {device}, threads: {torch.get_num_threads()}')
+
+    start = time.time()
+    reference = extractor.extract_keypoint(frames, info=False, track=False)
+    old_time = time.time() - start
+
+    start = time.time()
+    tracked = extractor.extract_keypoint(frames, info=True, track=True)
+    new_time = time.time() - start
+
+    both = (reference.mean(axis=(1, 2)) != -1) & (tracked.mean(axis=(1, 2)) != -1)
+    dist = np.linalg.norm(reference[both] - tracked[both], axis=2)
+    # inter-ocular distance, the usual normalization for landmark error
+    iod = np.linalg.norm(reference[both, 36] - reference[both, 45], axis=1)
+    print(f'per frame    : {len(frames) / old_time:7.2f} frames/sec ({old_time:.1f}s)')
+    print(f'detect+track : {len(frames) / new_time:7.2f} frames/sec ({new_time:.1f}s)')
+    print(f'speedup      : {old_time / new_time:.2f}x')
+    print(f'landmark diff: mean {dist.mean():.2f}px, max {dist.max():.2f}px, '
+          f'mean/inter-ocular {(dist.mean(axis=1) / iod).mean():.3f}')
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument('--video', required=True)
+    parser.add_argument('--size', type=int, default=256, help='resize frames like CropAndExtract (pic_size), 0 keeps them')
+    parser.add_argument('--max_frames', type=int, default=0)
+    parser.add_argument('--keyframe_interval', type=int, default=25)
+    parser.add_argument('--fan_batch_size', type=int, default=8)
+    parser.add_argument('--track_ratio', type=float, default=0.7)
+    parser.add_argument('--threads', type=int, default=0)
+    parser.add_argument('--cpu', action='store_true')
+    main(parser.parse_args())
@@ -0,0 +1,73 @@
+"""
+Throughput of the slide text normalization: the step-by-step process_special_characters
+(kept as MathFormulaProcessor.debug_process) against the precompiled MathTransducer, on a real
+deck or on synthetic slides. Every output is compared, the run fails on the first difference.
+
+    python scripts/benchmark_math_text.py --slides 3000
+    python scripts/benchmark_math_text.py --pptx lecture.pptx --repeat 20
+"""
+import os
+import sys
+import time
+import random
+from argparse import ArgumentParser
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.utils.math_formula_processor import MathFormulaProcessor, SPECIAL_CHAR_MAP, get_math_transducer
+
+WORDS = ("hàm số đồ thị phương trình nghiệm điều kiện xét tính giá trị lớn nhất nhỏ nhất của biểu thức "
+         "trên đoạn cho tam giác vuông tại có cạnh góc diện tích chu vi").split()
+FORMULAS = ["x² + y² = r²", "a/b", "√x", "3√8", "x^2", "∫f(x)dx", "d/dx", "Σi=1", "α + β = π",
+            "∀x ∈ ℝ", "x ≥ 0", "A ⊂ B", "f'(x) → ∞", "(a + b) .", "H₂O", "Δ = b² − 4ac"]
+
+
+def synthetic_slides(n, seed=0):
+    rng = random.Random(seed)
+    symbols = list(SPECIAL_CHAR_MAP)
+    slides = []
+    for _ in range(n):
+        parts = []
+        for _ in range(rng.randint(20, 80)):
+            r = rng.random()
+            parts.append(rng.choice(FORMULAS) if r < 0.1 else rng.choice(symbols) if r < 0.15 else rng.choice(WORDS))
+        slides.append(" ".join(parts) + ".")
+    return slides
+
+
+def run(fn, texts, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        out = [fn(t) for t in texts]
+    return (time.perf_counter() - start) / repeat, out
+
+
+def main(args):
+    if args.pptx:
+        from src.utils.pptx_reader import read_pptx
+        slides = read_pptx(args.pptx)
+        texts = [s['text'] for s in slides] + [m for s in slides for m in s['math']]
+    else:
+        texts = synthetic_slides(args.slides)
+    size_mb = sum(len(t.encode('utf-8')) for t in texts) / 1e6
+
+    processor = MathFormulaProcessor()
+    transducer = get_math_transducer()
+    reference_time, reference = run(lambda t: processor.debug_process(t)['final'] if t else t, texts, args.repeat)
+    compiled_time, compiled = run(transducer, texts, args.repeat)
+    for i, (a, b) in enumerate(zip(reference, compiled)):
+        if a != b:
+            raise SystemExit(f'output differs on text {i}:\n{texts[i]!r}\n{a!r}\n{b!r}')
+
+    print(f'{len(texts)} texts, {size_mb:.2f} MB, outputs identical')
+    for name, elapsed in (('step by step', reference_time), ('transducer', compiled_time)):
+        print(f'{name:<13}: {elapsed * 1000:8.1f} ms  {size_mb / elapsed:7.2f} MB/s  {len(texts) / elapsed:9.0f} texts/s')
+    print(f'speedup      : {reference_time / compiled_time:.1f}x')
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument('--pptx', default=None, help='deck to read the slide texts from')
+    parser.add_argument('--slides', type=int, default=3000, help='synthetic slides when no deck is given')
+    parser.add_argument('--repeat', type=int, default=3)
+    main(parser.parse_args())
@@ -0,0 +1,99 @@
+"""
+fp32 against bf16 autocast on CPU for the networks that follow --precision: net_recon, Audio2Exp
+and the face renderer. Reports the speed of each stage and the parity of its outputs (max abs
+diff, and PSNR for the rendered frames). Weights are random, so no checkpoint is needed.
+
+    python scripts/benchmark_precision.py --frames 32 --render_batch_size 16
+"""
+import os
+import sys
+import time
+from argparse import ArgumentParser
+
+import torch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.face3d.models import networks
+from src.audio2exp_models.networks import SimpleWrapperV2
+from src.audio2exp_models.audio2exp import Audio2Exp
+from src.facerender.modules.make_animation import make_animation
+from src.utils.precision import autocast, precision_scope, bf16_supported
+
+from benchmark_facerender import build_models
+
+
+def psnr(a, b):
+    mse = ((a.clamp(0, 1) - b.clamp(0, 1)) ** 2).mean().item()
+    return float('inf') if mse == 0 else 10 * torch.log10(torch.tensor(1.0 / mse)).item()
+
+
+def timed(fn, repeat):
+    fn()  # warm up, the first bf16 call builds the oneDNN kernels
+    start = time.time()
+    for _ in range(repeat):
+        out = fn()
+    return out, (time.time() - start) / repeat
+
+
+def run_net_recon(net_recon, images, precision):
+    with torch.no_grad(), precision_scope(precision), autocast('cpu'):
+        return net_recon(images).float()
+
+
+def run_audio2exp(audio2exp, batch, precision):
+    with torch.no_grad(), precision_scope(precision):
+        return audio2exp.test(batch)['exp_coeff_pred']
+
+
+def run_facerender(models, inputs, render_batch_size, precision):
+    generator, kp_extractor, mapping = models
+    with precision_scope(precision):
+        return make_animation(*inputs, generator, kp_extractor, None, mapping, frame_batch_size=render_batch_size)
+
+
+def report(name, fp32_time, bf16_time, count, unit, diff, extra=''):
+    print(f'{name:<12}: fp32 {count / fp32_time:8.2f} {unit}/sec, bf16 {count / bf16_time:8.2f} {unit}/sec, '
+          f'speedup {fp32_time / bf16_time:.2f}x, max abs diff {diff:.2e}{extra}')
+
+
+def main(args):
+    torch.manual_seed(0)
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    if not bf16_supported('cpu'):
+        print('this CPU has no native bf16 support, bf16 numbers are emulated and will be slow')
+
+    net_recon = networks.define_net_recon(net_recon='resnet50', use_last_fc=False, init_path='').eval()
+    images = torch.rand(args.frames, 3, 224, 224)
+    old, old_time = timed(lambda: run_net_recon(net_recon, images, 'fp32'), args.repeat)
+    new, new_time = timed(lambda: run_net_recon(net_recon, images, 'bf16'), args.repeat)
+    report('net_recon', old_time, new_time, args.frames, 'frames', (old - new).abs().max().item())
+
+    audio2exp = Audio2Exp(SimpleWrapperV2().eval(), None, 'cpu')
+    batch = {'indiv_mels': torch.randn(1, args.frames, 1, 80, 16),
+             'ref': torch.randn(1, args.frames, 70) * 0.1,
+             'ratio_gt': torch.rand(1, args.frames, 1)}
+    old, old_time = timed(lambda: run_audio2exp(audio2exp, batch, 'fp32'), args.repeat)
+    new, new_time = timed(lambda: run_audio2exp(audio2exp, batch, 'bf16'), args.repeat)
+    report('audio2exp', old_time, new_time, args.frames, 'frames', (old - new).abs().max().item())
+
+    models = build_models(args.config, 'cpu')
+    inputs = (torch.rand(1, 3, args.size, args.size),
+              torch.randn(1, 70, 27) * 0.1,
+              torch.randn(1, args.frames, 70, 27) * 0.1)
+    old, old_time = timed(lambda: run_facerender(models, inputs, args.render_batch_size, 'fp32'), args.repeat)
+    new, new_time = timed(lambda: run_facerender(models, inputs, args.render_batch_size, 'bf16'), args.repeat)
+    report('facerender', old_time, new_time, args.frames, 'frames', (old - new).abs().max().item(),
+           f', PSNR {psnr(old, new):.2f} dB')
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument('--config', default=os.path.join('src', 'config', 'facerender.yaml'))
+    parser.add_argument('--frames', type=int, default=32)
+    parser.add_argument('--size', type=int, default=256)
+    parser.add_argument('--render_batch_size', type=int, default=16)
+    parser.add_argument('--repeat', type=int, default=2)
+    parser.add_argument('--threads', type=int, default=0)
+    main(parser.parse_args())
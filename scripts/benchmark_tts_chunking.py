@@ -0,0 +1,82 @@
+"""
+Time-to-audio of one long slide narration: the whole text as one TTS call, the text split at
+sentence / clause boundaries with the chunks synthesized one after another, and the same chunks
+in batched XTTS generate calls with shared conditioning latents. Uses the backend load_xtts picks
+and a registered voice; the TTS cache is disabled for the run.
+
+    python scripts/benchmark_tts_chunking.py --user_id demo --voice_id my_voice --chars 2000
+"""
+import os
+import sys
+import time
+import shutil
+import tempfile
+from argparse import ArgumentParser
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ["SADTALKER_TTS_CACHE"] = "0"
+
+from src.voice.chunking import split_text
+from src.voice.tts_cache import audio_duration
+from src.voice import tts_engine
+
+SAMPLE = ("Hôm nay chúng ta tìm hiểu về hàm số bậc hai và đồ thị của nó. Đồ thị là một parabol, "
+          "có đỉnh, có trục đối xứng, và bề lõm phụ thuộc vào dấu của hệ số a. Khi biệt thức delta "
+          "dương, phương trình có hai nghiệm phân biệt; khi delta bằng không, phương trình có nghiệm kép! "
+          "Các em hãy chú ý: điều kiện này rất hay xuất hiện trong đề thi. ")
+
+
+def make_text(chars):
+    text = SAMPLE * (chars // len(SAMPLE) + 1)
+    return text[:chars].rsplit(" ", 1)[0] + "."
+
+
+def timed(text, user_id, voice_id, lang, chunk_chars, out_path, gpt_batch=8):
+    os.environ["SADTALKER_TTS_CHUNK_CHARS"] = str(chunk_chars)
+    os.environ["SADTALKER_TTS_GPT_BATCH"] = str(gpt_batch)
+    start = time.time()
+    path = tts_engine.synthesize(text, user_id, voice_id, lang, out_path=out_path)
+    elapsed = time.time() - start
+    if path is None:
+        raise RuntimeError(f"synthesis failed (chunk_chars={chunk_chars})")
+    return elapsed, audio_duration(path) or 0.
+
+
+def main(args):
+    text = make_text(args.chars)
+    chunks = split_text(text, args.chunk_chars)
+    root = tempfile.mkdtemp(prefix="tts_chunk_bench_")
+    try:
+        # warm up: model load and strategy probe are not part of the measurement
+        timed("Xin chào.", args.user_id, args.voice_id, args.lang, 0, os.path.join(root, "warmup.wav"))
+
+        whole, whole_audio = timed(text, args.user_id, args.voice_id, args.lang, 0, os.path.join(root, "whole.wav"))
+        # a batch of one is the same model call per chunk as before batching
+        sequential, sequential_audio = timed(text, args.user_id, args.voice_id, args.lang, args.chunk_chars,
+                                             os.path.join(root, "sequential.wav"), gpt_batch=1)
+        batched, batched_audio = timed(text, args.user_id, args.voice_id, args.lang, args.chunk_chars,
+                                       os.path.join(root, "batched.wav"), gpt_batch=args.gpt_batch)
+
+        print(f"text: {len(text)} chars, {len(chunks)} chunks of <= {args.chunk_chars} chars")
+        print(f"whole text        : {whole:7.2f}s for {whole_audio:6.1f}s of audio")
+        print(f"chunks one by one : {sequential:7.2f}s for {sequential_audio:6.1f}s of audio ({whole / sequential:.2f}x)")
+        print(f"chunks batched ({args.gpt_batch:>2}): {batched:7.2f}s for {batched_audio:6.1f}s of audio "
+              f"({whole / batched:.2f}x, {sequential / batched:.2f}x over one by one)")
+        print(tts_engine.strategy_metrics())
+    finally:
+        if args.keep:
+            print(f"outputs kept in {root}")
+        else:
+            shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--user_id", required=True)
+    parser.add_argument("--voice_id", required=True)
+    parser.add_argument("--lang", default="vi")
+    parser.add_argument("--chars", type=int, default=2000)
+    parser.add_argument("--chunk_chars", type=int, default=250)
+    parser.add_argument("--gpt_batch", type=int, default=8, help="chunks per batched XTTS generate call")
+    parser.add_argument("--keep", action="store_true", help="keep the synthesized audio")
+    main(parser.parse_args())
@@ -0,0 +1,69 @@
+"""
+TTS startup time: how long after app start the first narration is ready, with a cold model
+(loaded on the first request, as before) and with the model warmed in the background while
+the UI is built. Each mode runs in a fresh process so nothing is shared between them.
+
+    python scripts/benchmark_tts_startup.py --ui_seconds 20
+    SADTALKER_TTS_OFFLINE=1 python scripts/benchmark_tts_startup.py
+"""
+import os
+import sys
+import json
+import time
+import subprocess
+from argparse import ArgumentParser
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+TEXT = "Xin chào các em, hôm nay chúng ta học bài mới."
+
+
+def child(args):
+    """ One simulated app start: optional warm load, UI build time, then the first request. """
+    start = time.time()
+    from src.voice.enrollment import load_xtts, warm_load_xtts, tts_status
+    imported = time.time() - start
+
+    if args.mode == "warm":
+        warm_load_xtts()
+    # stands in for building the Gradio UI and the user picking a deck
+    time.sleep(args.ui_seconds)
+
+    request = time.time()
+    model, model_type = load_xtts()
+    ready = time.time() - request
+    wav = model.tts(text=TEXT, language="en") if model_type != "gtts" else model.tts(text=TEXT, language="vi")
+    first_audio = time.time() - request
+    print(json.dumps({"mode": args.mode, "model_type": model_type, "import_s": imported,
+                      "load_s": tts_status()["load_seconds"], "wait_for_model_s": ready,
+                      "first_audio_s": first_audio, "samples": len(wav) if wav is not None else 0}))
+
+
+def main(args):
+    results = []
+    for mode in ("cold", "warm"):
+        cmd = [sys.executable, os.path.abspath(__file__), "--child", "--mode", mode, "--ui_seconds", str(args.ui_seconds)]
+        proc = subprocess.run(cmd, capture_output=True, text=True)
+        lines = [l for l in proc.stdout.splitlines() if l.startswith("{")]
+        if proc.returncode != 0 or not lines:
+            print(proc.stdout[-2000:], proc.stderr[-2000:])
+            raise RuntimeError(f"{mode} run failed")
+        results.append(json.loads(lines[-1]))
+
+    print(f"backend: {results[0]['model_type']}, simulated UI build: {args.ui_seconds:.0f}s")
+    for r in results:
+        print(f"{r['mode']:<5}: model load {r['load_s']:6.1f}s, request waited {r['wait_for_model_s']:6.1f}s "
+              f"for the model, first audio {r['first_audio_s']:6.1f}s after the request")
+    print(f"first-request latency saved by warming: {results[0]['first_audio_s'] - results[1]['first_audio_s']:.1f}s")
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--ui_seconds", type=float, default=10., help="time between app start and the first request")
+    parser.add_argument("--mode", choices=["cold", "warm"], default="cold")
+    parser.add_argument("--child", action="store_true", help="internal: run one mode")
+    args = parser.parse_args()
+    if args.child:
+        child(args)
+    else:
+        main(args)
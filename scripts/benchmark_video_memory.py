@@ -0,0 +1,67 @@
+"""
+Peak memory of decoding a reference video for preprocessing: the whole video as a list of
+full-resolution frames resized afterwards (the old loader) against VideoFrameSource chunks
+resized while decoding. Only decoding and resizing are measured, no model is needed.
+
+    python scripts/benchmark_video_memory.py --video examples/ref_video/WDA_KatieHill_000.mp4
+    python scripts/benchmark_video_memory.py --video lecture_1080p.mp4 --chunk_size 64
+"""
+import os
+import sys
+import time
+import tracemalloc
+from argparse import ArgumentParser
+
+import cv2
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.utils.videoio import VideoFrameSource
+
+
+def decode_list(path, size):
+    """ The loader as it was: every frame decoded into a list, then resized. """
+    video_stream = cv2.VideoCapture(path)
+    full_frames = []
+    while 1:
+        still_reading, frame = video_stream.read()
+        if not still_reading:
+            video_stream.release()
+            break
+        full_frames.append(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+    frames = [cv2.resize(frame, (size, size)) for frame in full_frames]
+    return len(frames)
+
+
+def decode_chunks(path, size, chunk_size):
+    source = VideoFrameSource(path, chunk_size=chunk_size, transform=lambda frame: cv2.resize(frame, (size, size)))
+    n = 0
+    for chunk in source.chunks():
+        n += len(chunk)     # the consumer (landmarks, 3DMM) is done with the chunk here
+    return n
+
+
+def measure(fn, *args):
+    tracemalloc.start()
+    start = time.time()
+    n = fn(*args)
+    elapsed = time.time() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return n, elapsed, peak / (1024 * 1024)
+
+
+def main(args):
+    n, old_time, old_peak = measure(decode_list, args.video, args.size)
+    _, new_time, new_peak = measure(decode_chunks, args.video, args.size, args.chunk_size)
+    print(f'frames: {n}, resized to {args.size}x{args.size}, chunk size {args.chunk_size}')
+    print(f'whole list: peak {old_peak:8.1f} MB, {n / old_time:7.1f} frames/sec')
+    print(f'chunked   : peak {new_peak:8.1f} MB, {n / new_time:7.1f} frames/sec')
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument('--video', required=True)
+    parser.add_argument('--size', type=int, default=256, help='pic_size of CropAndExtract')
+    parser.add_argument('--chunk_size', type=int, default=64)
+    main(parser.parse_args())
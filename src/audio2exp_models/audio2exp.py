@@ -2,6 +2,8 @@ from tqdm import tqdm
 import torch
 from torch import nn
 
+from src.utils.precision import autocast
+
 
 class Audio2Exp(nn.Module):
     def __init__(self, netG, cfg, device, prepare_training_loss=False):
@@ -28,7 +30,8 @@ class Audio2Exp(nn.Module):
 
             audiox = current_mel_input.view(-1, 1, 80, 16)                  # bs*T 1 80 16
 
-            curr_exp_coeff_pred  = self.netG(audiox, ref, ratio)         # bs T 64 
+            with autocast(audiox.device):
+                curr_exp_coeff_pred  = self.netG(audiox, ref, ratio).float()         # bs T 64 
 
             exp_coeff_pred += [curr_exp_coeff_pred]
 
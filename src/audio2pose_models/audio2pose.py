@@ -3,6 +3,7 @@ from torch import nn
 from src.audio2pose_models.cvae import CVAE
 from src.audio2pose_models.discriminator import PoseSequenceDiscriminator
 from src.audio2pose_models.audio_encoder import AudioEncoder
+from src.utils.precision import autocast
 
 class Audio2Pose(nn.Module):
     def __init__(self, cfg, wav2lip_checkpoint, device='cuda'):
@@ -68,22 +69,24 @@ class Audio2Pose(nn.Module):
         for i in range(div):
             z = torch.randn(bs, self.latent_dim).to(ref.device)
             batch['z'] = z
-            audio_emb = self.audio_encoder(indiv_mels_use[:, i*self.seq_len:(i+1)*self.seq_len,:,:,:]) #bs seq_len 512
-            batch['audio_emb'] = audio_emb
-            batch = self.netG.test(batch)
-            pose_motion_pred_list.append(batch['pose_motion_pred'])  #list of bs seq_len 6
+            with autocast(ref.device):
+                audio_emb = self.audio_encoder(indiv_mels_use[:, i*self.seq_len:(i+1)*self.seq_len,:,:,:]) #bs seq_len 512
+                batch['audio_emb'] = audio_emb
+                batch = self.netG.test(batch)
+            pose_motion_pred_list.append(batch['pose_motion_pred'].float())  #list of bs seq_len 6
         
         if re != 0:
             z = torch.randn(bs, self.latent_dim).to(ref.device)
             batch['z'] = z
-            audio_emb = self.audio_encoder(indiv_mels_use[:, -1*self.seq_len:,:,:,:]) #bs seq_len  512
-            if audio_emb.shape[1] != self.seq_len:
-                pad_dim = self.seq_len-audio_emb.shape[1]
-                pad_audio_emb = audio_emb[:, :1].repeat(1, pad_dim, 1) 
-                audio_emb = torch.cat([pad_audio_emb, audio_emb], 1) 
-            batch['audio_emb'] = audio_emb
-            batch = self.netG.test(batch)
-            pose_motion_pred_list.append(batch['pose_motion_pred'][:,-1*re:,:])   
+            with autocast(ref.device):
+                audio_emb = self.audio_encoder(indiv_mels_use[:, -1*self.seq_len:,:,:,:]) #bs seq_len  512
+                if audio_emb.shape[1] != self.seq_len:
+                    pad_dim = self.seq_len-audio_emb.shape[1]
+                    pad_audio_emb = audio_emb[:, :1].repeat(1, pad_dim, 1) 
+                    audio_emb = torch.cat([pad_audio_emb, audio_emb], 1) 
+                batch['audio_emb'] = audio_emb
+                batch = self.netG.test(batch)
+            pose_motion_pred_list.append(batch['pose_motion_pred'][:,-1*re:,:].float())   
         
         pose_motion_pred = torch.cat(pose_motion_pred_list, dim = 1)
         batch['pose_motion_pred'] = pose_motion_pred
@@ -15,6 +15,7 @@ from facexlib.detection import init_detection_model
 
 from facexlib.utils import load_file_from_url
 from src.face3d.util.my_awing_arch import FAN
+from src.utils.videoio import VideoFrameSource
 
 def init_alignment_model(model_name, half=False, device='cuda', model_rootpath=None):
     if model_name == 'awing_fan':
@@ -45,24 +46,144 @@ class KeypointExtractor():
         self.detector = init_alignment_model('awing_fan',device=device, model_rootpath=root_path)   
         self.det_net = init_detection_model('retinaface_resnet50', half=False,device=device, model_rootpath=root_path)
 
-    def extract_keypoint(self, images, name=None, info=True):
-        if isinstance(images, list):
-            keypoints = []
-            if info:
-                i_range = tqdm(images,desc='landmark Det:')
-            else:
-                i_range = images
+        # video inputs: detect on keyframes, track the face box from the landmarks in between
+        self.track = os.environ.get('SADTALKER_KP_TRACK', '1') != '0'
+        self.keyframe_interval = int(os.environ.get('SADTALKER_KP_KEYFRAME_INTERVAL', 25))
+        self.fan_batch_size = int(os.environ.get('SADTALKER_KP_BATCH', 8))
+        self.track_ratio = float(os.environ.get('SADTALKER_KP_TRACK_RATIO', 0.7))
+
+    def detect_face(self, image):
+        """ First RetinaFace box (x1, y1, x2, y2) of the image, None when there is no face. """
+        with torch.no_grad():
+            bboxes = self.det_net.detect_faces(image, 0.97)
+        if bboxes is None or len(bboxes) == 0:
+            return None
+        return np.asarray(bboxes[0][:4], dtype=np.float32)
+
+    def landmarks_in_boxes(self, images, boxes):
+        """ 68 landmarks (B, 68, 2) in image coordinates and a confidence per frame, one FAN call. """
+        crops = []
+        for image, box in zip(images, boxes):
+            img = np.array(image)
+            crops.append(img[int(box[1]):int(box[3]), int(box[0]):int(box[2]), :])
+        with torch.no_grad():
+            preds, scores = self.detector.get_landmarks_batch(crops)
+
+        keypoints = np.stack([landmark_98_to_68(pred) for pred in preds])
+        for kp, box in zip(keypoints, boxes):
+            kp[:, 0] += int(box[0])
+            kp[:, 1] += int(box[1])
+        return keypoints, scores.mean(axis=1)
 
-            for image in i_range:
-                current_kp = self.extract_keypoint(image)
-                # current_kp = self.detector.get_landmarks(np.array(image))
-                if np.mean(current_kp) == -1 and keypoints:
-                    keypoints.append(keypoints[-1])
+    @staticmethod
+    def box_offsets(box, kp):
+        """ The detector box relative to the landmark extent, in units of the extent size. """
+        lo, hi = kp.min(axis=0), kp.max(axis=0)
+        size = np.maximum(hi - lo, 1.)
+        return np.concatenate([(box[:2] - lo) / size, (box[2:] - hi) / size])
+
+    @staticmethod
+    def box_from_landmarks(kp, offsets, width, height):
+        """ Face box for the next frame: the landmark extent grown like the last detected box. """
+        lo, hi = kp.min(axis=0), kp.max(axis=0)
+        size = np.maximum(hi - lo, 1.)
+        box = np.concatenate([lo + offsets[:2] * size, hi + offsets[2:] * size])
+        box = np.clip(box, 0, [width, height, width, height])
+        if box[2] - box[0] < 8 or box[3] - box[1] < 8:
+            return None
+        return box
+
+    def track_keypoints(self, images, info=True, state=None):
+        """
+        Landmarks of a video: RetinaFace runs on a keyframe every keyframe_interval frames, the
+        frames in between are cropped with the box predicted from the previous landmarks and go
+        through FAN in batches of fan_batch_size. A frame whose confidence drops below
+        track_ratio times the keyframe's ends the run and the next frame is detected again.
+        Frames without a face repeat the previous landmarks, like the per-frame path.
+        Pass the same state dict for consecutive chunks of one video to keep tracking across them.
+        """
+        if state is None:
+            state = {}
+        box, offsets, key_conf = state.get('box'), state.get('offsets'), state.get('key_conf')
+        since_key, last = state.get('since_key', 0), state.get('last')
+        detected = 0
+        keypoints = []
+        pbar = tqdm(total=len(images), desc='landmark Det:', disable=not info)
+        i = 0
+        while i < len(images):
+            width, height = images[i].size if isinstance(images[i], Image.Image) else images[i].shape[1::-1]
+            if box is None or since_key >= self.keyframe_interval:
+                since_key = 1
+                face = self.detect_face(images[i])
+                detected += 1
+                if face is None:
+                    box = None
+                    keypoints.append(last if last is not None else -1. * np.ones([1, 68, 2]))
                 else:
-                    keypoints.append(current_kp[None])
+                    kp, conf = self.landmarks_in_boxes([images[i]], [face])
+                    offsets, key_conf = self.box_offsets(face, kp[0]), conf[0]
+                    box = self.box_from_landmarks(kp[0], offsets, width, height)
+                    keypoints.append(kp)
+                last = keypoints[-1]
+                i += 1
+                pbar.update(1)
+                continue
+
+            chunk = images[i:i + min(self.fan_batch_size, self.keyframe_interval - since_key)]
+            kps, conf = self.landmarks_in_boxes(chunk, [box] * len(chunk))
+            lost = np.flatnonzero(conf < self.track_ratio * key_conf)
+            n = lost[0] if len(lost) else len(chunk)
+            keypoints.extend(kp[None] for kp in kps[:n])
+            if n:
+                last = keypoints[-1]
+            i += n
+            since_key += n
+            pbar.update(n)
+            box = self.box_from_landmarks(kps[n - 1], offsets, width, height) if n and not len(lost) else None
+        pbar.close()
+
+        state.update(box=box, offsets=offsets, key_conf=key_conf, since_key=since_key, last=last,
+                     detected=state.get('detected', 0) + detected)
+        if info:
+            print(f' landmarks: {detected} detections for {len(images)} frames')
+        return np.concatenate(keypoints, 0)
 
-            keypoints = np.concatenate(keypoints, 0)
-            np.savetxt(os.path.splitext(name)[0]+'.txt', keypoints.reshape(-1))
+    def detect_keypoints(self, images, info=True, state=None):
+        """ Landmarks with RetinaFace + FAN on every frame; state carries the previous landmarks across chunks. """
+        if state is None:
+            state = {}
+        keypoints = []
+        for image in (tqdm(images, desc='landmark Det:') if info else images):
+            current_kp = self.extract_keypoint(image)
+            # current_kp = self.detector.get_landmarks(np.array(image))
+            if np.mean(current_kp) == -1 and state.get('last') is not None:
+                keypoints.append(state['last'])
+            else:
+                keypoints.append(current_kp[None])
+            state['last'] = keypoints[-1]
+        return np.concatenate(keypoints, 0)
+
+    def iter_keypoints(self, chunks, track=None):
+        """ (chunk, landmarks) for a stream of frame chunks, e.g. VideoFrameSource.chunks(). """
+        if track is None:
+            track = self.track
+        state = {}
+        for chunk in chunks:
+            if track:
+                yield chunk, self.track_keypoints(chunk, info=False, state=state)
+            else:
+                yield chunk, self.detect_keypoints(chunk, info=False, state=state)
+
+    def extract_keypoint(self, images, name=None, info=True, track=None):
+        if isinstance(images, list):
+            if track is None:
+                track = self.track
+            if track:
+                keypoints = self.track_keypoints(images, info=info)
+            else:
+                keypoints = self.detect_keypoints(images, info=info)
+            if name is not None:
+                np.savetxt(os.path.splitext(name)[0]+'.txt', keypoints.reshape(-1))
             return keypoints
         else:
             while True:
@@ -98,31 +219,21 @@ class KeypointExtractor():
                 np.savetxt(os.path.splitext(name)[0]+'.txt', keypoints.reshape(-1))
             return keypoints
 
-def read_video(filename):
-    frames = []
-    cap = cv2.VideoCapture(filename)
-    while cap.isOpened():
-        ret, frame = cap.read()
-        if ret:
-            frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            frame = Image.fromarray(frame)
-            frames.append(frame)
-        else:
-            break
-    cap.release()
-    return frames
+def read_video(filename, chunk_size=None):
+    """ All frames as PIL images, or with chunk_size a generator of chunks decoded on demand. """
+    source = VideoFrameSource(filename, chunk_size=chunk_size or 64, transform=Image.fromarray)
+    if chunk_size:
+        return source.chunks()
+    return list(source)
 
 def run(data):
     filename, opt, device = data
     os.environ['CUDA_VISIBLE_DEVICES'] = device
     kp_extractor = KeypointExtractor()
-    images = read_video(filename)
     name = filename.split('/')[-2:]
     os.makedirs(os.path.join(opt.output_dir, name[-2]), exist_ok=True)
-    kp_extractor.extract_keypoint(
-        images, 
-        name=os.path.join(opt.output_dir, name[-2], name[-1])
-    )
+    keypoints = np.concatenate([kp for _, kp in kp_extractor.iter_keypoints(read_video(filename, chunk_size=64))], 0)
+    np.savetxt(os.path.splitext(os.path.join(opt.output_dir, name[-2], name[-1]))[0]+'.txt', keypoints.reshape(-1))
 
 if __name__ == '__main__':
     set_start_method('spawn')
@@ -357,22 +357,35 @@ class FAN(nn.Module):
         return outputs, boundary_channels
 
     def get_landmarks(self, img):
-        H, W, _ = img.shape
-        offset = W / 64, H / 64, 0, 0
+        preds, _ = self.get_landmarks_batch([img])
+        return preds[0]
 
-        img = cv2.resize(img, (256, 256))
-        inp = img[..., ::-1]
-        inp = torch.from_numpy(np.ascontiguousarray(inp.transpose((2, 0, 1)))).float()
+    def get_landmarks_batch(self, imgs):
+        """
+        Landmarks of several face crops in one forward pass.
+
+        Return:
+            preds              --numpy.array  (B, 98, 2), in the coordinates of each crop
+            scores             --numpy.array  (B, 98), heatmap peak of every landmark
+
+        Parameters:
+            imgs               --list of numpy.array  (H, W, 3), crops may differ in size
+        """
+        inp = np.stack([cv2.resize(img, (256, 256))[..., ::-1].transpose((2, 0, 1)) for img in imgs])
+        inp = torch.from_numpy(np.ascontiguousarray(inp)).float()
         inp = inp.to(self.device)
-        inp.div_(255.0).unsqueeze_(0)
+        inp.div_(255.0)
 
         outputs, _ = self.forward(inp)
         out = outputs[-1][:, :-1, :, :]
         heatmaps = out.detach().cpu().numpy()
 
-        pred = calculate_points(heatmaps).reshape(-1, 2)
+        # calculate_points picks its border handling from the whole batch, keep every frame on its own
+        preds = np.concatenate([calculate_points(heatmaps[i:i + 1]) for i in range(len(imgs))], 0)
+        scores = heatmaps.reshape(heatmaps.shape[0], heatmaps.shape[1], -1).max(axis=2)
 
-        pred *= offset[:2]
-        pred += offset[-2:]
+        for pred, img in zip(preds, imgs):
+            H, W, _ = img.shape
+            pred *= (W / 64, H / 64)
 
-        return pred
+        return preds, scores
@@ -37,6 +37,36 @@ def POS(xp, x):
     t = np.stack([sTx, sTy], axis=0)
 
     return t, s
+
+# POS for a batch of landmark sets against the same 3D landmarks
+def POS_batch(xp, x):
+    """
+    Return:
+        t                  --numpy.array  (B, 2)
+        s                  --numpy.array  (B,)
+
+    Parameters:
+        xp                 --numpy.array  (B, npts, 2), 2D landmarks
+        x                  --numpy.array  (3, npts), 3D landmarks shared by the batch
+    """
+    npts = x.shape[1]
+
+    A = np.zeros([2*npts, 8])
+
+    A[0:2*npts-1:2, 0:3] = x.transpose()
+    A[0:2*npts-1:2, 3] = 1
+
+    A[1:2*npts:2, 4:7] = x.transpose()
+    A[1:2*npts:2, 7] = 1
+
+    # A only depends on the 3D landmarks, so the least squares solution of every frame is one product
+    b = np.reshape(xp, [xp.shape[0], 2*npts])
+    k = b @ np.linalg.pinv(A).transpose()
+
+    s = (np.linalg.norm(k[:, 0:3], axis=1) + np.linalg.norm(k[:, 4:7], axis=1))/2
+    t = k[:, [3, 7]]
+
+    return t, s
     
 # resize and crop images for face reconstruction
 def resize_n_crop_img(img, lm, t, s, target_size=224., mask=None):
@@ -70,6 +100,13 @@ def extract_5p(lm):
     lm5p = lm5p[[1, 2, 0, 3, 4], :]
     return lm5p
 
+def extract_5p_batch(lm):
+    lm_idx = np.array([31, 37, 40, 43, 46, 49, 55]) - 1
+    lm5p = np.stack([lm[:, lm_idx[0], :], np.mean(lm[:, lm_idx[[1, 2]], :], 1), np.mean(
+        lm[:, lm_idx[[3, 4]], :], 1), lm[:, lm_idx[5], :], lm[:, lm_idx[6], :]], axis=1)
+    lm5p = lm5p[:, [1, 2, 0, 3, 4], :]
+    return lm5p
+
 # utils for face reconstruction
 def align_img(img, lm, lm3D, mask=None, target_size=224., rescale_factor=102.):
     """
@@ -94,6 +131,7 @@ def align_img(img, lm, lm3D, mask=None, target_size=224., rescale_factor=102.):
 
     # calculate translation and scale factors using 5 facial landmarks and standard landmarks of a 3D face
     t, s = POS(lm5p.transpose(), lm3D.transpose())
+    t = t.ravel()
     s = rescale_factor/s
 
     # processing the image
@@ -101,3 +139,30 @@ def align_img(img, lm, lm3D, mask=None, target_size=224., rescale_factor=102.):
     trans_params = np.array([w0, h0, s, t[0], t[1]])
 
     return trans_params, img_new, lm_new, mask_new
+
+def align_imgs(imgs, lms, lm3D, target_size=224., rescale_factor=102.):
+    """
+    align_img for a batch of frames: the POS solve runs once for the whole batch,
+    only the resize and crop are done per image.
+
+    Return:
+        transparams        --numpy.array  (B, 5), (raw_W, raw_H, scale, tx, ty) per frame
+        imgs_new           --numpy.array  (B, target_size, target_size, 3), uint8
+
+    Parameters:
+        imgs               --list of PIL.Image  (raw_H, raw_W, 3)
+        lms                --numpy.array  (B, 68, 2) or (B, 5, 2), y direction is opposite to v direction
+        lm3D               --numpy.array  (5, 3)
+    """
+    lm5p = lms if lms.shape[1] == 5 else extract_5p_batch(lms)
+    t, s = POS_batch(lm5p, lm3D.transpose())
+    s = rescale_factor/s
+
+    trans_params = np.zeros([len(imgs), 5])
+    imgs_new = np.zeros([len(imgs), int(target_size), int(target_size), 3], dtype=np.uint8)
+    for i, img in enumerate(imgs):
+        img_new, _, _ = resize_n_crop_img(img, lms[i], t[i], s[i], target_size=target_size)
+        imgs_new[i] = np.array(img_new.convert('RGB'))
+        trans_params[i] = [img.size[0], img.size[1], s[i], t[i, 0], t[i, 1]]
+
+    return trans_params, imgs_new
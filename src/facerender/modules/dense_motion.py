@@ -2,6 +2,7 @@ from torch import nn
 import torch.nn.functional as F
 import torch
 from src.facerender.modules.util import Hourglass, make_coordinate_grid, kp2gaussian
+from src.utils.precision import grid_sample_fp32
 
 from src.facerender.sync_batchnorm import SynchronizedBatchNorm3d as BatchNorm3d
 
@@ -61,7 +62,7 @@ class DenseMotionNetwork(nn.Module):
         feature_repeat = feature.unsqueeze(1).unsqueeze(1).repeat(1, self.num_kp+1, 1, 1, 1, 1, 1)      # (bs, num_kp+1, 1, c, d, h, w)
         feature_repeat = feature_repeat.view(bs * (self.num_kp+1), -1, d, h, w)                         # (bs*(num_kp+1), c, d, h, w)
         sparse_motions = sparse_motions.view((bs * (self.num_kp+1), d, h, w, -1))                       # (bs*(num_kp+1), d, h, w, 3) !!!!
-        sparse_deformed = F.grid_sample(feature_repeat, sparse_motions)
+        sparse_deformed = grid_sample_fp32(feature_repeat, sparse_motions)
         sparse_deformed = sparse_deformed.view((bs, self.num_kp+1, -1, d, h, w))                        # (bs, num_kp+1, c, d, h, w)
         return sparse_deformed
 
@@ -3,6 +3,7 @@ from torch import nn
 import torch.nn.functional as F
 from src.facerender.modules.util import ResBlock2d, SameBlock2d, UpBlock2d, DownBlock2d, ResBlock3d, SPADEResnetBlock
 from src.facerender.modules.dense_motion import DenseMotionNetwork
+from src.utils.precision import grid_sample_fp32
 
 
 class OcclusionAwareGenerator(nn.Module):
@@ -65,10 +66,10 @@ class OcclusionAwareGenerator(nn.Module):
             deformation = deformation.permute(0, 4, 1, 2, 3)
             deformation = F.interpolate(deformation, size=(d, h, w), mode='trilinear')
             deformation = deformation.permute(0, 2, 3, 4, 1)
-        return F.grid_sample(inp, deformation)
+        return grid_sample_fp32(inp, deformation)
 
-    def forward(self, source_image, kp_driving, kp_source):
-        # Encoding (downsampling) part
+    def encode_source(self, source_image):
+        # Encoding (downsampling) part, depends on the source image only
         out = self.first(source_image)
         for i in range(len(self.down_blocks)):
             out = self.down_blocks[i](out)
@@ -76,10 +77,17 @@ class OcclusionAwareGenerator(nn.Module):
         bs, c, h, w = out.shape
         # print(out.shape)
         feature_3d = out.view(bs, self.reshape_channel, self.reshape_depth, h ,w) 
-        feature_3d = self.resblocks_3d(feature_3d)
+        return self.resblocks_3d(feature_3d)
+
+    def forward(self, source_image, kp_driving, kp_source):
+        feature_3d = self.encode_source(source_image)
+        return self.decode_from_source(feature_3d, kp_driving, kp_source)
 
+    def decode_from_source(self, feature_3d, kp_driving, kp_source):
         # Transforming feature representation according to deformation and occlusion
         output_dict = {}
+        bs, c, d, h, w = feature_3d.shape
+        out = feature_3d.view(bs, c*d, h, w)
         if self.dense_motion_network is not None:
             dense_motion = self.dense_motion_network(feature=feature_3d, kp_driving=kp_driving,
                                                      kp_source=kp_source)
@@ -205,10 +213,10 @@ class OcclusionAwareSPADEGenerator(nn.Module):
             deformation = deformation.permute(0, 4, 1, 2, 3)
             deformation = F.interpolate(deformation, size=(d, h, w), mode='trilinear')
             deformation = deformation.permute(0, 2, 3, 4, 1)
-        return F.grid_sample(inp, deformation)
+        return grid_sample_fp32(inp, deformation)
 
-    def forward(self, source_image, kp_driving, kp_source):
-        # Encoding (downsampling) part
+    def encode_source(self, source_image):
+        # Encoding (downsampling) part, depends on the source image only
         out = self.first(source_image)
         for i in range(len(self.down_blocks)):
             out = self.down_blocks[i](out)
@@ -216,10 +224,17 @@ class OcclusionAwareSPADEGenerator(nn.Module):
         bs, c, h, w = out.shape
         # print(out.shape)
         feature_3d = out.view(bs, self.reshape_channel, self.reshape_depth, h ,w) 
-        feature_3d = self.resblocks_3d(feature_3d)
+        return self.resblocks_3d(feature_3d)
+
+    def forward(self, source_image, kp_driving, kp_source):
+        feature_3d = self.encode_source(source_image)
+        return self.decode_from_source(feature_3d, kp_driving, kp_source)
 
+    def decode_from_source(self, feature_3d, kp_driving, kp_source):
         # Transforming feature representation according to deformation and occlusion
         output_dict = {}
+        bs, c, d, h, w = feature_3d.shape
+        out = feature_3d.view(bs, c*d, h, w)
         if self.dense_motion_network is not None:
             dense_motion = self.dense_motion_network(feature=feature_3d, kp_driving=kp_driving,
                                                      kp_source=kp_source)
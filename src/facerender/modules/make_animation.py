@@ -4,6 +4,8 @@ import torch.nn.functional as F
 import numpy as np
 from tqdm import tqdm 
 
+from src.utils.precision import autocast, current_precision
+
 def normalize_kp(kp_source, kp_driving, kp_driving_initial, adapt_movement_scale=False,
                  use_relative_movement=False, use_relative_jacobian=False):
     if adapt_movement_scale:
@@ -99,43 +101,96 @@ def keypoint_transformation(kp_canonical, he, wo_exp=False):
 
 
 
-def make_animation(source_image, source_semantics, target_semantics,
+def encode_source(source_image, source_semantics, generator, kp_detector, mapping, precision='fp32'):
+    """
+    First phase of the renderer: everything that only depends on the source image.
+    The source volume and kp_source are computed once for a single copy of the source.
+    Keypoints always stay in fp32, only the source volume follows precision.
+    """
+    source_image = source_image[:1]
+    source_semantics = source_semantics[:1]
+
+    kp_canonical = kp_detector(source_image)
+    he_source = mapping(source_semantics)
+    kp_source = keypoint_transformation(kp_canonical, he_source)
+    with autocast(source_image.device, precision):
+        feature_3d = generator.encode_source(source_image)
+
+    return {'kp_canonical': kp_canonical, 'kp_source': kp_source, 'feature_3d': feature_3d}
+
+def _expand_batch(x, bs):
+    return x.expand((bs,) + tuple(x.shape[1:]))
+
+def render_frames(source_encoding, target_semantics, generator, mapping,
+                  yaw_c_seq=None, pitch_c_seq=None, roll_c_seq=None, precision='fp32'):
+    """
+    Second phase of the renderer: motion, warp and decode for a batch of frames.
+    target_semantics is (N, 70, semantic_radius*2+1), the camera sequences are (N,).
+    """
+    bs = target_semantics.shape[0]
+    kp_canonical = {'value': _expand_batch(source_encoding['kp_canonical']['value'], bs)}
+    kp_source = {'value': _expand_batch(source_encoding['kp_source']['value'], bs)}
+    feature_3d = _expand_batch(source_encoding['feature_3d'], bs)
+
+    he_driving = mapping(target_semantics)
+    if yaw_c_seq is not None:
+        he_driving['yaw_in'] = yaw_c_seq
+    if pitch_c_seq is not None:
+        he_driving['pitch_in'] = pitch_c_seq
+    if roll_c_seq is not None:
+        he_driving['roll_in'] = roll_c_seq
+
+    kp_driving = keypoint_transformation(kp_canonical, he_driving)
+    with autocast(target_semantics.device, precision):
+        out = generator.decode_from_source(feature_3d, kp_driving=kp_driving, kp_source=kp_source)
+    return out['prediction'].float()
+
+def iter_animation(source_image, source_semantics, target_semantics,
                             generator, kp_detector, he_estimator, mapping, 
                             yaw_c_seq=None, pitch_c_seq=None, roll_c_seq=None,
-                            use_exp=True, use_half=False):
+                            use_exp=True, use_half=False, frame_batch_size=None):
+    """
+    Encode the source once, then yield predicted frames in chunks of frame_batch_size,
+    in the same order as make_animation flattens its output.
+    use_half forces bf16, otherwise the precision scope of the caller is used.
+    """
+    precision = 'bf16' if use_half else current_precision()
     with torch.no_grad():
-        predictions = []
+        source_encoding = encode_source(source_image, source_semantics, generator, kp_detector, mapping,
+                                        precision=precision)
+        if not frame_batch_size:
+            frame_batch_size = target_semantics.shape[0]
+
+        # (bs, T, 70, 27) -> (bs*T, 70, 27), row-major keeps the order of the old (bs, T) output
+        num_frames = target_semantics.shape[0] * target_semantics.shape[1]
+        target_semantics = target_semantics.reshape((num_frames,) + tuple(target_semantics.shape[2:]))
+        if yaw_c_seq is not None:
+            yaw_c_seq = yaw_c_seq.reshape(-1)
+        if pitch_c_seq is not None:
+            pitch_c_seq = pitch_c_seq.reshape(-1)
+        if roll_c_seq is not None:
+            roll_c_seq = roll_c_seq.reshape(-1)
+
+        for start in tqdm(range(0, num_frames, frame_batch_size), 'Face Renderer:'):
+            end = min(start + frame_batch_size, num_frames)
+            yield render_frames(source_encoding, target_semantics[start:end], generator, mapping,
+                                yaw_c_seq=None if yaw_c_seq is None else yaw_c_seq[start:end],
+                                pitch_c_seq=None if pitch_c_seq is None else pitch_c_seq[start:end],
+                                roll_c_seq=None if roll_c_seq is None else roll_c_seq[start:end],
+                                precision=precision)
 
-        kp_canonical = kp_detector(source_image)
-        he_source = mapping(source_semantics)
-        kp_source = keypoint_transformation(kp_canonical, he_source)
-    
-        for frame_idx in tqdm(range(target_semantics.shape[1]), 'Face Renderer:'):
-            # still check the dimension
-            # print(target_semantics.shape, source_semantics.shape)
-            target_semantics_frame = target_semantics[:, frame_idx]
-            he_driving = mapping(target_semantics_frame)
-            if yaw_c_seq is not None:
-                he_driving['yaw_in'] = yaw_c_seq[:, frame_idx]
-            if pitch_c_seq is not None:
-                he_driving['pitch_in'] = pitch_c_seq[:, frame_idx] 
-            if roll_c_seq is not None:
-                he_driving['roll_in'] = roll_c_seq[:, frame_idx] 
-            
-            kp_driving = keypoint_transformation(kp_canonical, he_driving)
-                
-            kp_norm = kp_driving
-            out = generator(source_image, kp_source=kp_source, kp_driving=kp_norm)
-            '''
-            source_image_new = out['prediction'].squeeze(1)
-            kp_canonical_new =  kp_detector(source_image_new)
-            he_source_new = he_estimator(source_image_new) 
-            kp_source_new = keypoint_transformation(kp_canonical_new, he_source_new, wo_exp=True)
-            kp_driving_new = keypoint_transformation(kp_canonical_new, he_driving, wo_exp=True)
-            out = generator(source_image_new, kp_source=kp_source_new, kp_driving=kp_driving_new)
-            '''
-            predictions.append(out['prediction'])
-        predictions_ts = torch.stack(predictions, dim=1)
+def make_animation(source_image, source_semantics, target_semantics,
+                            generator, kp_detector, he_estimator, mapping, 
+                            yaw_c_seq=None, pitch_c_seq=None, roll_c_seq=None,
+                            use_exp=True, use_half=False, frame_batch_size=None):
+    bs, num_steps = target_semantics.shape[:2]
+    with torch.no_grad():
+        predictions = list(iter_animation(source_image, source_semantics, target_semantics,
+                                          generator, kp_detector, he_estimator, mapping,
+                                          yaw_c_seq=yaw_c_seq, pitch_c_seq=pitch_c_seq, roll_c_seq=roll_c_seq,
+                                          use_exp=use_exp, use_half=use_half, frame_batch_size=frame_batch_size))
+        predictions_ts = torch.cat(predictions, dim=0)
+        predictions_ts = predictions_ts.reshape((bs, num_steps) + tuple(predictions_ts.shape[1:]))
     return predictions_ts
 
 class AnimateModel(torch.nn.Module):
@@ -6,6 +6,7 @@ import numpy as np
 import random
 import scipy.io as scio
 import src.utils.audio as audio
+from src.utils.mel_cache import get_mel_cache
 
 def crop_pad_audio(wav, audio_length):
     if len(wav) > audio_length:
@@ -22,6 +23,31 @@ def parse_audio_length(audio_length, sr, fps):
 
     return audio_length, num_frames
 
+def load_mel(audio_path, sr=16000, fps=25):
+    """ Mel spectrogram (nframes, 80) of the audio cropped to whole video frames and the frame count, cached by content hash. """
+    mel_cache = get_mel_cache()
+    if mel_cache is not None:
+        cache_key = mel_cache.key(audio_path, sr)
+        cached = mel_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+    wav = audio.load_wav(audio_path, sr) 
+    wav_length, num_frames = parse_audio_length(len(wav), sr, fps)
+    wav = crop_pad_audio(wav, wav_length)
+    orig_mel = audio.melspectrogram(wav).T
+
+    if mel_cache is not None:
+        mel_cache.put(cache_key, orig_mel, num_frames)
+    return orig_mel, num_frames
+
+def mel_windows(orig_mel, num_frames, fps=25, syncnet_mel_step_size=16):
+    """ (T, 80, 16) mel windows, one per video frame, gathered with a single index matrix. """
+    start_idx = (80. * ((np.arange(num_frames) - 2) / float(fps))).astype(np.int64)  # truncates like int()
+    seq = start_idx[:, None] + np.arange(syncnet_mel_step_size)[None, :]
+    seq = np.clip(seq, 0, orig_mel.shape[0]-1)
+    return orig_mel[seq].transpose(0, 2, 1)
+
 def generate_blink_seq(num_frames):
     ratio = np.zeros((num_frames,1))
     frame_id = 0
@@ -61,22 +87,8 @@ def get_data(first_coeff_path, audio_path, device, ref_eyeblink_coeff_path, stil
         num_frames = int(length_of_audio * 25)
         indiv_mels = np.zeros((num_frames, 80, 16))
     else:
-        wav = audio.load_wav(audio_path, 16000) 
-        wav_length, num_frames = parse_audio_length(len(wav), 16000, 25)
-        wav = crop_pad_audio(wav, wav_length)
-        orig_mel = audio.melspectrogram(wav).T
-        spec = orig_mel.copy()         # nframes 80
-        indiv_mels = []
-
-        for i in tqdm(range(num_frames), 'mel:'):
-            start_frame_num = i-2
-            start_idx = int(80. * (start_frame_num / float(fps)))
-            end_idx = start_idx + syncnet_mel_step_size
-            seq = list(range(start_idx, end_idx))
-            seq = [ min(max(item, 0), orig_mel.shape[0]-1) for item in seq ]
-            m = spec[seq, :]
-            indiv_mels.append(m.T)
-        indiv_mels = np.asarray(indiv_mels)         # T 80 16
+        orig_mel, num_frames = load_mel(audio_path, 16000, fps)         # nframes 80
+        indiv_mels = mel_windows(orig_mel, num_frames, fps, syncnet_mel_step_size)         # T 80 16
 
     ratio = generate_blink_seq_randomly(num_frames)      # T
     source_semantics_path = first_coeff_path
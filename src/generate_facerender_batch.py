@@ -1,13 +1,14 @@
 import os
+import cv2
 import numpy as np
 from PIL import Image
-from skimage import io, img_as_float32, transform
+from skimage import io, img_as_float32
 import torch
 import scipy.io as scio
 
 def get_facerender_data(coeff_path, pic_path, first_coeff_path, audio_path, 
                         batch_size, input_yaw_list=None, input_pitch_list=None, input_roll_list=None, 
-                        expression_scale=1.0, still_mode = False, preprocess='crop', size = 256):
+                        expression_scale=1.0, still_mode = False, preprocess='crop', size = 256, verbose=False):
 
     semantic_radius = 13
     video_name = os.path.splitext(os.path.split(coeff_path)[-1])[0]
@@ -15,13 +16,16 @@ def get_facerender_data(coeff_path, pic_path, first_coeff_path, audio_path,
 
     data={}
 
-    img1 = Image.open(pic_path)
+    img1 = Image.open(pic_path).convert('RGB')
     source_image = np.array(img1)
+    if source_image.shape[:2] != (size, size):
+        # resize the uint8 image once, area interpolation when shrinking like skimage's anti-aliasing
+        shrink = source_image.shape[0] > size or source_image.shape[1] > size
+        source_image = cv2.resize(source_image, (size, size), interpolation=cv2.INTER_AREA if shrink else cv2.INTER_LINEAR)
     source_image = img_as_float32(source_image)
-    source_image = transform.resize(source_image, (size, size, 3))
     source_image = source_image.transpose((2, 0, 1))
+    # a single copy, the renderer encodes the source once and broadcasts it over the frame batch
     source_image_ts = torch.FloatTensor(source_image).unsqueeze(0)
-    source_image_ts = source_image_ts.repeat(batch_size, 1, 1, 1)
     data['source_image'] = source_image_ts
  
     source_semantics_dict = scio.loadmat(first_coeff_path)
@@ -37,7 +41,6 @@ def get_facerender_data(coeff_path, pic_path, first_coeff_path, audio_path,
 
     source_semantics_new = transform_semantic_1(source_semantics, semantic_radius)
     source_semantics_ts = torch.FloatTensor(source_semantics_new).unsqueeze(0)
-    source_semantics_ts = source_semantics_ts.repeat(batch_size, 1, 1)
     data['source_semantics'] = source_semantics_ts
 
     # target 
@@ -49,25 +52,22 @@ def get_facerender_data(coeff_path, pic_path, first_coeff_path, audio_path,
     if still_mode:
         generated_3dmm[:, 64:] = np.repeat(source_semantics[:, 64:], generated_3dmm.shape[0], axis=0)
 
-    with open(txt_path+'.txt', 'w') as f:
-        for coeff in generated_3dmm:
-            for i in coeff:
-                f.write(str(i)[:7]   + '  '+'\t')
-            f.write('\n')
+    if verbose:
+        with open(txt_path+'.txt', 'w') as f:
+            for coeff in generated_3dmm:
+                for i in coeff:
+                    f.write(str(i)[:7]   + '  '+'\t')
+                f.write('\n')
 
-    target_semantics_list = [] 
     frame_num = generated_3dmm.shape[0]
     data['frame_num'] = frame_num
-    for frame_idx in range(frame_num):
-        target_semantics = transform_semantic_target(generated_3dmm, frame_idx, semantic_radius)
-        target_semantics_list.append(target_semantics)
-
     remainder = frame_num%batch_size
-    if remainder!=0:
-        for _ in range(batch_size-remainder):
-            target_semantics_list.append(target_semantics)
+    padded_num = frame_num if remainder == 0 else frame_num + batch_size - remainder
 
-    target_semantics_np = np.array(target_semantics_list)             #frame_num 70 semantic_radius*2+1
+    # the padding frames repeat the window of the last frame
+    target_semantics_np = np.empty((padded_num, generated_3dmm.shape[1], semantic_radius*2+1), dtype=generated_3dmm.dtype)
+    target_semantics_np[:frame_num] = transform_semantic_targets(generated_3dmm, semantic_radius)
+    target_semantics_np[frame_num:] = target_semantics_np[frame_num-1]             #frame_num 70 semantic_radius*2+1
     target_semantics_np = target_semantics_np.reshape(batch_size, -1, target_semantics_np.shape[-2], target_semantics_np.shape[-1])
     data['target_semantics_list'] = torch.FloatTensor(target_semantics_np)
     data['video_name'] = video_name
@@ -97,6 +97,13 @@ def transform_semantic_target(coeff_3dmm, frame_index, semantic_radius):
     coeff_3dmm_g = coeff_3dmm[index, :]
     return coeff_3dmm_g.transpose(1,0)
 
+def transform_semantic_targets(coeff_3dmm, semantic_radius):
+    """ transform_semantic_target for every frame at once: (num_frames, C, semantic_radius*2+1). """
+    num_frames = coeff_3dmm.shape[0]
+    index = np.arange(num_frames)[:, None] + np.arange(-semantic_radius, semantic_radius+1)[None, :]
+    index = np.clip(index, 0, num_frames-1)
+    return coeff_3dmm[index].transpose(0, 2, 1)
+
 def gen_camera_pose(camera_degree_list, frame_num, batch_size):
 
     new_degree_list = [] 
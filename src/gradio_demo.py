@@ -1,12 +1,10 @@
 import torch, uuid
 import os, sys, shutil
-from src.utils.preprocess import CropAndExtract
-from src.test_audio2coeff import Audio2Coeff  
-from src.facerender.animate import AnimateFromCoeff
 from src.generate_batch import get_data
 from src.generate_facerender_batch import get_facerender_data
 
-from src.utils.init_path import init_path
+from src.utils.model_pool import get_model_pool
+from src.utils.precision import precision_scope, resolve_precision
 
 from pydub import AudioSegment
 
@@ -31,6 +29,14 @@ class SadTalker():
 
         self.checkpoint_path = checkpoint_path
         self.config_path = config_path
+
+        self.model_pool = get_model_pool(checkpoint_path, config_path)
+        if not lazy_load:
+            self.warmup()
+
+    def warmup(self, configs=((256, 'crop'),), enhancer=None):
+        """ load the models for the given (size, preprocess) pairs before the first request """
+        self.model_pool.warmup(configs, self.device, enhancer=enhancer)
       
 
     def test(self, source_image, driven_audio, preprocess='crop', 
@@ -41,14 +47,17 @@ class SadTalker():
         ref_info = None,
         use_idle_mode = False,
         length_of_audio = 0, use_blink=True,
-        result_dir='./results/'):
+        result_dir='./results/', precision='fp32'):
 
-        self.sadtalker_paths = init_path(self.checkpoint_path, self.config_path, size, False, preprocess)
+        # 'bf16' runs the networks under bf16 autocast, falls back to fp32 where it is not supported
+        precision = resolve_precision(precision, self.device)
+        models = self.model_pool.get(size, preprocess, self.device)
+        self.sadtalker_paths = models.sadtalker_paths
         print(self.sadtalker_paths)
             
-        self.audio_to_coeff = Audio2Coeff(self.sadtalker_paths, self.device)
-        self.preprocess_model = CropAndExtract(self.sadtalker_paths, self.device)
-        self.animate_from_coeff = AnimateFromCoeff(self.sadtalker_paths, self.device)
+        self.audio_to_coeff = models.audio_to_coeff
+        self.preprocess_model = models.preprocess_model
+        self.animate_from_coeff = models.animate_from_coeff
 
         time_tag = str(uuid.uuid4())
         save_dir = os.path.join(result_dir, time_tag)
@@ -93,7 +102,8 @@ class SadTalker():
         #crop image and extract 3dmm from image
         first_frame_dir = os.path.join(save_dir, 'first_frame_dir')
         os.makedirs(first_frame_dir, exist_ok=True)
-        first_coeff_path, crop_pic_path, crop_info = self.preprocess_model.generate(pic_path, first_frame_dir, preprocess, True, size)
+        with precision_scope(precision):
+            first_coeff_path, crop_pic_path, crop_info = self.preprocess_model.generate(pic_path, first_frame_dir, preprocess, True, size)
         
         if first_coeff_path is None:
             raise AttributeError("No face is detected")
@@ -104,7 +114,8 @@ class SadTalker():
             ref_video_frame_dir = os.path.join(save_dir, ref_video_videoname)
             os.makedirs(ref_video_frame_dir, exist_ok=True)
             print('3DMM Extraction for the reference video providing pose')
-            ref_video_coeff_path, _, _ =  self.preprocess_model.generate(ref_video, ref_video_frame_dir, preprocess, source_image_flag=False)
+            with precision_scope(precision):
+                ref_video_coeff_path, _, _ =  self.preprocess_model.generate(ref_video, ref_video_frame_dir, preprocess, source_image_flag=False)
         else:
             ref_video_coeff_path = None
 
@@ -132,23 +143,20 @@ class SadTalker():
             coeff_path = ref_video_coeff_path # self.audio_to_coeff.generate(batch, save_dir, pose_style, ref_pose_coeff_path)
         else:
             batch = get_data(first_coeff_path, audio_path, self.device, ref_eyeblink_coeff_path=ref_eyeblink_coeff_path, still=still_mode, idlemode=use_idle_mode, length_of_audio=length_of_audio, use_blink=use_blink) # longer audio?
-            coeff_path = self.audio_to_coeff.generate(batch, save_dir, pose_style, ref_pose_coeff_path)
+            with precision_scope(precision):
+                coeff_path = self.audio_to_coeff.generate(batch, save_dir, pose_style, ref_pose_coeff_path)
 
         #coeff2video
         data = get_facerender_data(coeff_path, crop_pic_path, first_coeff_path, audio_path, batch_size, still_mode=still_mode, preprocess=preprocess, size=size, expression_scale = exp_scale)
-        return_path = self.animate_from_coeff.generate(data, save_dir,  pic_path, crop_info, enhancer='gfpgan' if use_enhancer else None, preprocess=preprocess, img_size=size)
+        with precision_scope(precision):
+            return_path = self.animate_from_coeff.generate(data, save_dir,  pic_path, crop_info, enhancer='gfpgan' if use_enhancer else None, preprocess=preprocess, img_size=size)
         video_name = data['video_name']
         print(f'The generated video is named {video_name} in {save_dir}')
 
-        del self.preprocess_model
-        del self.audio_to_coeff
-        del self.animate_from_coeff
-
+        # the models stay in the pool for the next call, only drop the per-call activations
         if torch.cuda.is_available():
             torch.cuda.empty_cache()
             torch.cuda.synchronize()
-            
-        import gc; gc.collect()
         
         return return_path
 
@@ -0,0 +1,113 @@
+import os
+import subprocess
+
+from PIL import Image
+
+
+def _even(value):
+    return int(value) // 2 * 2
+
+
+def build_lecture_filter_graph(segments, width, height, pip_ratio=0.25, margin=50, fps=25, sample_rate=44100):
+    """
+    ffmpeg input arguments and filter_complex for a whole lecture.
+
+    segments is a list of dicts with slide_image_path, teacher_video_path, audio_path and
+    audio_duration, plus teacher_start when the slides share one teacher video rendered for the
+    whole lecture. Each slide still is looped for its duration and scaled to width x height, the
+    teacher video is scaled to pip_ratio of the width and overlaid in the bottom-right corner,
+    the audio is padded/trimmed to the same duration, and all segments are concatenated.
+    """
+    teacher_width = _even(width * pip_ratio)
+    input_args = []
+    filters = []
+    concat_inputs = ''
+    for i, segment in enumerate(segments):
+        duration = '%.3f' % segment['audio_duration']
+        teacher_start = segment.get('teacher_start')
+        teacher_seek = [] if teacher_start is None else ['-ss', '%.3f' % teacher_start, '-t', duration]
+        input_args += ['-loop', '1', '-framerate', str(fps), '-t', duration, '-i', segment['slide_image_path']]
+        input_args += teacher_seek + ['-i', segment['teacher_video_path']]
+        input_args += ['-i', segment['audio_path']]
+        slide, teacher, audio = 3 * i, 3 * i + 1, 3 * i + 2
+        filters.append(f'[{slide}:v]scale={width}:{height},setsar=1,fps={fps}[bg{i}]')
+        filters.append(f'[{teacher}:v]scale={teacher_width}:-2,fps={fps}[pip{i}]')
+        # once the teacher video ends the slide keeps playing alone, like the moviepy composite
+        filters.append(f'[bg{i}][pip{i}]overlay=x=W-w-{margin}:y=H-h-{margin}:eof_action=pass,'
+                       f'trim=duration={duration},setpts=PTS-STARTPTS,format=yuv420p[v{i}]')
+        filters.append(f'[{audio}:a]aformat=sample_rates={sample_rate}:channel_layouts=stereo,'
+                       f'apad,atrim=duration={duration},asetpts=PTS-STARTPTS[a{i}]')
+        concat_inputs += f'[v{i}][a{i}]'
+    filters.append(f'{concat_inputs}concat=n={len(segments)}:v=1:a=1[v][a]')
+    return input_args, ';'.join(filters)
+
+
+def composite_lecture_ffmpeg(segments, output_path, size=None, pip_ratio=0.25, margin=50, fps=25):
+    """
+    Composite and concatenate every slide of the lecture in one native ffmpeg process.
+    size defaults to the size of the first slide image.
+    """
+    if not segments:
+        raise ValueError('no segments to composite')
+    if size is None:
+        with Image.open(segments[0]['slide_image_path']) as img:
+            size = img.size
+    width, height = _even(size[0]), _even(size[1])
+
+    input_args, filter_graph = build_lecture_filter_graph(segments, width, height, pip_ratio=pip_ratio, margin=margin, fps=fps)
+    # long lectures give long graphs, pass it as a script instead of on the command line
+    script_path = output_path + '.filter.txt'
+    with open(script_path, 'w', encoding='utf-8') as f:
+        f.write(filter_graph)
+    cmd = (['ffmpeg', '-y', '-hide_banner', '-loglevel', 'error'] + input_args +
+           ['-filter_complex_script', script_path, '-map', '[v]', '-map', '[a]',
+            '-c:v', 'libx264', '-pix_fmt', 'yuv420p', '-r', str(fps),
+            '-c:a', 'aac', '-movflags', '+faststart', output_path])
+    try:
+        result = subprocess.run(cmd, capture_output=True, text=True)
+    finally:
+        os.remove(script_path)
+    if result.returncode != 0:
+        raise RuntimeError(f'ffmpeg compositing failed: {result.stderr.strip()}')
+    return output_path
+
+
+def composite_lecture_moviepy(segments, output_path, pip_ratio=0.25, margin=50, fps=25):
+    """ The moviepy CompositeVideoClip + concatenate_videoclips path, kept as a fallback and benchmark baseline. """
+    from moviepy.editor import VideoFileClip, concatenate_videoclips, CompositeVideoClip, ImageClip, AudioFileClip
+
+    clips = []
+    opened = []
+    try:
+        for segment in segments:
+            slide_clip = ImageClip(segment['slide_image_path'], duration=segment['audio_duration'])
+            teacher_clip = VideoFileClip(segment['teacher_video_path'])
+            audio_clip = AudioFileClip(segment['audio_path'])
+            opened += [slide_clip, teacher_clip, audio_clip]
+            if segment.get('teacher_start') is not None:
+                start = segment['teacher_start']
+                teacher_clip = teacher_clip.subclip(start, min(start + segment['audio_duration'], teacher_clip.duration))
+
+            slide_width, slide_height = slide_clip.size
+            teacher_width = int(slide_width * pip_ratio)
+            teacher_height = int(teacher_width * teacher_clip.h / teacher_clip.w)
+            teacher_clip = teacher_clip.resize((teacher_width, teacher_height))
+            teacher_clip = teacher_clip.set_position((slide_width - teacher_width - margin, slide_height - teacher_height - margin))
+
+            clips.append(CompositeVideoClip([slide_clip, teacher_clip]).set_audio(audio_clip))
+        final_video = concatenate_videoclips(clips, method="compose")
+        opened.append(final_video)
+        final_video.write_videofile(output_path, fps=fps, codec='libx264', audio_codec='aac', verbose=False, logger=None)
+    finally:
+        for clip in clips + opened:
+            try:
+                clip.close()
+            except Exception:
+                pass
+    return output_path
+
+
+COMPOSITORS = {
+    'ffmpeg': composite_lecture_ffmpeg,
+    'moviepy': composite_lecture_moviepy,
+}
@@ -0,0 +1,148 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import threading
+
+
+def file_digest(path, algo='sha256', chunk_size=1 << 20):
+    h = hashlib.new(algo)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _crop_info_to_json(crop_info):
+    size, crop, quad = crop_info
+    return {'size': [int(v) for v in size],
+            'crop': None if crop is None else [int(v) for v in crop],
+            'quad': None if quad is None else [float(v) for v in quad]}
+
+
+def _crop_info_from_json(d):
+    return (tuple(d['size']),
+            None if d['crop'] is None else tuple(d['crop']),
+            d['quad'])
+
+
+class CropCache():
+    """
+    Persistent cache of CropAndExtract results for source images.
+
+    An entry is keyed by the image content hash, the preprocess mode, pic_size and the
+    3DMM model tag, and holds the first-frame coefficients (.mat), the cropped png and
+    crop_info. Entries are evicted least-recently-used once the cache grows past max_mb.
+    """
+
+    COEFF_NAME = 'coeff.mat'
+    PNG_NAME = 'crop.png'
+    INFO_NAME = 'crop_info.json'
+
+    def __init__(self, root=os.path.join('data', 'cache', 'crop'), max_mb=512):
+        self.root = root
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(self.root, exist_ok=True)
+
+    def key(self, image_path, preprocess, pic_size, model_tag=''):
+        raw = '|'.join([file_digest(image_path), preprocess.lower(), str(int(pic_size)), model_tag])
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def _entry_dir(self, key):
+        return os.path.join(self.root, key)
+
+    def get(self, key, coeff_path, png_path):
+        """ Copy a cached entry to coeff_path/png_path and return crop_info, or None on a miss. """
+        entry = self._entry_dir(key)
+        info_path = os.path.join(entry, self.INFO_NAME)
+        with self._lock:
+            if not os.path.isfile(info_path):
+                self.misses += 1
+                return None
+            try:
+                with open(info_path, 'r', encoding='utf-8') as f:
+                    crop_info = _crop_info_from_json(json.load(f))
+                shutil.copyfile(os.path.join(entry, self.COEFF_NAME), coeff_path)
+                shutil.copyfile(os.path.join(entry, self.PNG_NAME), png_path)
+            except (OSError, ValueError, KeyError):
+                shutil.rmtree(entry, ignore_errors=True)
+                self.misses += 1
+                return None
+            now = time.time()
+            os.utime(info_path, (now, now))
+            self.hits += 1
+            return crop_info
+
+    def put(self, key, coeff_path, png_path, crop_info):
+        entry = self._entry_dir(key)
+        tmp = entry + '.tmp-%d-%d' % (os.getpid(), threading.get_ident())
+        with self._lock:
+            try:
+                os.makedirs(tmp, exist_ok=True)
+                shutil.copyfile(coeff_path, os.path.join(tmp, self.COEFF_NAME))
+                shutil.copyfile(png_path, os.path.join(tmp, self.PNG_NAME))
+                # info is written last, its presence marks a complete entry
+                with open(os.path.join(tmp, self.INFO_NAME), 'w', encoding='utf-8') as f:
+                    json.dump(_crop_info_to_json(crop_info), f)
+                shutil.rmtree(entry, ignore_errors=True)
+                os.replace(tmp, entry)
+            except OSError as e:
+                print(f'crop cache: could not store entry: {e}')
+                shutil.rmtree(tmp, ignore_errors=True)
+                return
+            self._evict(keep=entry)
+
+    def _entries(self):
+        entries = []
+        for name in os.listdir(self.root):
+            entry = os.path.join(self.root, name)
+            info_path = os.path.join(entry, self.INFO_NAME)
+            if not os.path.isfile(info_path):
+                continue
+            size = sum(os.path.getsize(os.path.join(entry, f)) for f in os.listdir(entry))
+            entries.append((os.path.getmtime(info_path), size, entry))
+        return sorted(entries)
+
+    def _evict(self, keep=None):
+        entries = self._entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry in entries:
+            if total <= self.max_bytes:
+                break
+            if entry == keep:
+                continue
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
+
+    def clear(self):
+        with self._lock:
+            for _, _, entry in self._entries():
+                shutil.rmtree(entry, ignore_errors=True)
+
+    def stats(self):
+        with self._lock:
+            entries = self._entries()
+            return {'hits': self.hits,
+                    'misses': self.misses,
+                    'entries': len(entries),
+                    'size_mb': sum(size for _, size, _ in entries) / (1024 * 1024),
+                    'max_mb': self.max_bytes / (1024 * 1024)}
+
+
+_CROP_CACHE = None
+_CROP_CACHE_LOCK = threading.Lock()
+
+def get_crop_cache():
+    """ Shared cache instance; SADTALKER_CROP_CACHE=0 disables it, SADTALKER_CROP_CACHE_MB sets the cap. """
+    global _CROP_CACHE
+    if os.environ.get('SADTALKER_CROP_CACHE', '1') == '0':
+        return None
+    with _CROP_CACHE_LOCK:
+        if _CROP_CACHE is None:
+            _CROP_CACHE = CropCache(root=os.environ.get('SADTALKER_CROP_CACHE_DIR', os.path.join('data', 'cache', 'crop')),
+                                    max_mb=float(os.environ.get('SADTALKER_CROP_CACHE_MB', 512)))
+        return _CROP_CACHE
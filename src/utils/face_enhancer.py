@@ -5,7 +5,7 @@ from gfpgan import GFPGANer
 
 from tqdm import tqdm
 
-from src.utils.videoio import load_video_to_cv2
+from src.utils.videoio import VideoFrameSource
 
 import cv2
 
@@ -23,30 +23,14 @@ class GeneratorWithLen(object):
     def __iter__(self):
         return self.gen
 
-def enhancer_list(images, method='gfpgan', bg_upsampler='realesrgan'):
-    gen = enhancer_generator_no_len(images, method=method, bg_upsampler=bg_upsampler)
-    return list(gen)
-
-def enhancer_generator_with_len(images, method='gfpgan', bg_upsampler='realesrgan'):
-    """ Provide a generator with a __len__ method so that it can passed to functions that
-    call len()"""
+_RESTORERS = {}
 
-    if os.path.isfile(images): # handle video to images
-        # TODO: Create a generator version of load_video_to_cv2
-        images = load_video_to_cv2(images)
+def get_restorer(method='gfpgan', bg_upsampler='realesrgan'):
+    """ Build the GFPGAN restorer once per (method, bg_upsampler) and reuse it across videos. """
 
-    gen = enhancer_generator_no_len(images, method=method, bg_upsampler=bg_upsampler)
-    gen_with_len = GeneratorWithLen(gen, len(images))
-    return gen_with_len
-
-def enhancer_generator_no_len(images, method='gfpgan', bg_upsampler='realesrgan'):
-    """ Provide a generator function so that all of the enhanced images don't need
-    to be stored in memory at the same time. This can save tons of RAM compared to
-    the enhancer function. """
-
-    print('face enhancer....')
-    if not isinstance(images, list) and os.path.isfile(images): # handle video to images
-        images = load_video_to_cv2(images)
+    key = (method, bg_upsampler)
+    if key in _RESTORERS:
+        return _RESTORERS[key]
 
     # ------------------------ set up GFPGAN restorer ------------------------
     if  method == 'gfpgan':
@@ -107,10 +91,39 @@ def enhancer_generator_no_len(images, method='gfpgan', bg_upsampler='realesrgan'
         channel_multiplier=channel_multiplier,
         bg_upsampler=bg_upsampler)
 
+    _RESTORERS[key] = restorer
+    return restorer
+
+def enhancer_list(images, method='gfpgan', bg_upsampler='realesrgan'):
+    gen = enhancer_generator_no_len(images, method=method, bg_upsampler=bg_upsampler)
+    return list(gen)
+
+def enhancer_generator_with_len(images, method='gfpgan', bg_upsampler='realesrgan'):
+    """ Provide a generator with a __len__ method so that it can passed to functions that
+    call len()"""
+
+    if os.path.isfile(images): # handle video to images, decoded while enhancing
+        images = VideoFrameSource(images)
+
+    gen = enhancer_generator_no_len(images, method=method, bg_upsampler=bg_upsampler)
+    gen_with_len = GeneratorWithLen(gen, max(0, len(images)))
+    return gen_with_len
+
+def enhancer_generator_no_len(images, method='gfpgan', bg_upsampler='realesrgan'):
+    """ Provide a generator function so that all of the enhanced images don't need
+    to be stored in memory at the same time. This can save tons of RAM compared to
+    the enhancer function. """
+
+    print('face enhancer....')
+    if isinstance(images, str) and os.path.isfile(images): # handle video to images
+        images = VideoFrameSource(images)
+
+    restorer = get_restorer(method=method, bg_upsampler=bg_upsampler)
+
     # ------------------------ restore ------------------------
-    for idx in tqdm(range(len(images)), 'Face Enhancer:'):
+    for image in tqdm(images, 'Face Enhancer:'):
         
-        img = cv2.cvtColor(images[idx], cv2.COLOR_RGB2BGR)
+        img = cv2.cvtColor(image, cv2.COLOR_RGB2BGR)
         
         # restore faces and background if necessary
         cropped_faces, restored_faces, r_img = restorer.enhance(
@@ -2,12 +2,319 @@ import re
 import unicodedata
 import xml.etree.ElementTree as ET
 from typing import List, Dict, Tuple, Optional
+from functools import lru_cache
 import logging
 
+from src.utils.pptx_reader import read_pptx
+
 # Thiết lập logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Bảng tra cứu ký tự đặc biệt sang tiếng Việt
+SPECIAL_CHAR_MAP = {
+    # Số mũ
+    '²': ' mũ hai',
+    '³': ' mũ ba',
+    '¹': ' mũ một',
+    '⁴': ' mũ bốn',
+    '⁵': ' mũ năm',
+    '⁶': ' mũ sáu',
+    '⁷': ' mũ bảy',
+    '⁸': ' mũ tám',
+    '⁹': ' mũ chín',
+    '⁰': ' mũ không',
+
+    # Chỉ số dưới
+    '₁': ' chỉ số một',
+    '₂': ' chỉ số hai',
+    '₃': ' chỉ số ba',
+    '₄': ' chỉ số bốn',
+    '₅': ' chỉ số năm',
+    '₆': ' chỉ số sáu',
+    '₇': ' chỉ số bảy',
+    '₈': ' chỉ số tám',
+    '₉': ' chỉ số chín',
+    '₀': ' chỉ số không',
+
+    # Ký tự Hy Lạp
+    'α': ' alpha',
+    'β': ' beta',
+    'γ': ' gamma',
+    'δ': ' delta',
+    'ε': ' epsilon',
+    'ζ': ' zeta',
+    'η': ' eta',
+    'θ': ' theta',
+    'ι': ' iota',
+    'κ': ' kappa',
+    'λ': ' lambda',
+    'μ': ' mu',
+    'ν': ' nu',
+    'ξ': ' xi',
+    'ο': ' omicron',
+    'π': ' pi',
+    'ρ': ' rho',
+    'σ': ' sigma',
+    'τ': ' tau',
+    'υ': ' upsilon',
+    'φ': ' phi',
+    'χ': ' chi',
+    'ψ': ' psi',
+    'ω': ' omega',
+
+    # Chữ hoa Hy Lạp
+    'Α': ' Alpha',
+    'Β': ' Beta',
+    'Γ': ' Gamma',
+    'Δ': ' Delta',
+    'Ε': ' Epsilon',
+    'Ζ': ' Zeta',
+    'Η': ' Eta',
+    'Θ': ' Theta',
+    'Ι': ' Iota',
+    'Κ': ' Kappa',
+    'Λ': ' Lambda',
+    'Μ': ' Mu',
+    'Ν': ' Nu',
+    'Ξ': ' Xi',
+    'Ο': ' Omicron',
+    'Π': ' Pi',
+    'Ρ': ' Rho',
+    'Σ': ' Sigma',
+    'Τ': ' Tau',
+    'Υ': ' Upsilon',
+    'Φ': ' Phi',
+    'Χ': ' Chi',
+    'Ψ': ' Psi',
+    'Ω': ' Omega',
+
+    # Ký tự toán học
+    '±': ' cộng trừ',
+    '∓': ' trừ cộng',
+    '×': ' nhân',
+    '÷': ' chia',
+    '⋅': ' nhân',
+    '∗': ' nhân',
+    '√': ' căn bậc hai',
+    '∛': ' căn bậc ba',
+    '∜': ' căn bậc bốn',
+    '∞': ' vô cùng',
+    '≈': ' xấp xỉ',
+    '≠': ' khác',
+    '≤': ' nhỏ hơn hoặc bằng',
+    '≥': ' lớn hơn hoặc bằng',
+    '≪': ' nhỏ hơn rất nhiều',
+    '≫': ' lớn hơn rất nhiều',
+    '≡': ' đồng dư',
+    '≅': ' đồng dạng',
+    '∝': ' tỷ lệ thuận',
+    '∑': ' tổng',
+    '∏': ' tích',
+    '∫': ' tích phân',
+    '∬': ' tích phân kép',
+    '∭': ' tích phân ba',
+    '∮': ' tích phân đường',
+    '∯': ' tích phân mặt',
+    '∰': ' tích phân thể tích',
+    '∇': ' nabla',
+    '∂': ' đạo hàm riêng',
+    '∆': ' delta',
+    '∅': ' tập rỗng',
+    '∈': ' thuộc',
+    '∉': ' không thuộc',
+    '∋': ' chứa',
+    '∌': ' không chứa',
+    '⊂': ' tập con',
+    '⊃': ' tập cha',
+    '⊆': ' tập con hoặc bằng',
+    '⊇': ' tập cha hoặc bằng',
+    '∪': ' hợp',
+    '∩': ' giao',
+    '∖': ' hiệu',
+    '⊕': ' tổng trực tiếp',
+    '⊗': ' tích tensor',
+    '⊥': ' vuông góc',
+    '∥': ' song song',
+    '∠': ' góc',
+    '∡': ' góc đo',
+    '∢': ' góc phẳng',
+    '°': ' độ',
+    '′': ' phút',
+    '″': ' giây',
+    '‰': ' phần nghìn',
+    '‱': ' phần vạn',
+
+    # Mũi tên
+    '→': ' mũi tên phải',
+    '←': ' mũi tên trái',
+    '↑': ' mũi tên lên',
+    '↓': ' mũi tên xuống',
+    '↔': ' mũi tên hai chiều',
+    '↕': ' mũi tên lên xuống',
+    '⇒': ' suy ra',
+    '⇐': ' ngược lại',
+    '⇔': ' tương đương',
+    '⇎': ' không tương đương',
+
+    # Logic
+    '∀': ' với mọi',
+    '∃': ' tồn tại',
+    '∄': ' không tồn tại',
+    '∴': ' do đó',
+    '∵': ' vì',
+    '∧': ' và',
+    '∨': ' hoặc',
+    '¬': ' không',
+    '⊤': ' đúng',
+    '⊥': ' sai',
+
+    # Tập số
+    'ℕ': ' tập số tự nhiên',
+    'ℤ': ' tập số nguyên',
+    'ℚ': ' tập số hữu tỷ',
+    'ℝ': ' tập số thực',
+    'ℂ': ' tập số phức',
+    'ℙ': ' tập số nguyên tố',
+
+    # Ký tự khác
+    'ℵ': ' aleph',
+    'ℶ': ' beth',
+    'ℷ': ' gimel',
+    'ℸ': ' daleth',
+    'ℏ': ' h bar',
+    'ℯ': ' e',
+    'ℊ': ' g',
+    'ℴ': ' o',
+    'ℵ': ' aleph',
+}
+
+# Mẫu regex để nhận diện các công thức toán học đơn giản
+MATH_PATTERNS = [
+    # Phân số: a/b
+    (r'(\d+)/(\d+)', r'\1 chia \2'),
+    # Căn bậc hai: √x (cần xử lý trước khi thay thế √)
+    (r'√(\w+)', r'căn bậc hai của \1'),
+    # Căn bậc n: n√x (cần xử lý trước khi thay thế √)
+    (r'(\d+)√(\w+)', r'\1 căn bậc \1 của \2'),
+    # Lũy thừa: x^n
+    (r'(\w+)\^(\d+)', r'\1 mũ \2'),
+    # Tích phân: ∫f(x)dx
+    (r'∫([^d]+)d([a-z])', r'tích phân của \1 theo \2'),
+    # Đạo hàm: d/dx
+    (r'd/(d[a-z])', r'đạo hàm theo \1'),
+    # Tổng: Σ
+    (r'Σ([^=]+)=([^=]+)', r'tổng của \1 từ \2'),
+    # Tích: Π
+    (r'Π([^=]+)=([^=]+)', r'tích của \1 từ \2'),
+]
+
+
+def _unicode_reading(char: str) -> str:
+    """
+    Cách đọc một ký tự theo tên Unicode (bước 3 của process_special_characters), giữ nguyên
+    ký tự nếu không xử lý được.
+    """
+    if ord(char) <= 127:
+        return char
+    try:
+        # Lấy tên Unicode
+        char_name = unicodedata.name(char)
+    except ValueError:
+        # Nếu không lấy được tên Unicode, giữ nguyên
+        return char
+    if 'SUPERSCRIPT' in char_name:
+        # Số mũ
+        if char_name.endswith('TWO'):
+            return ' mũ hai'
+        elif char_name.endswith('THREE'):
+            return ' mũ ba'
+        elif char_name.endswith('ONE'):
+            return ' mũ một'
+        return f' mũ {char_name.split()[-1]}'
+    elif 'SUBSCRIPT' in char_name:
+        # Chỉ số dưới
+        if char_name.endswith('TWO'):
+            return ' chỉ số hai'
+        elif char_name.endswith('THREE'):
+            return ' chỉ số ba'
+        elif char_name.endswith('ONE'):
+            return ' chỉ số một'
+        return f' chỉ số {char_name.split()[-1]}'
+    elif 'GREEK' in char_name:
+        # Chữ Hy Lạp
+        return f' {char_name.split()[-1].lower()}'
+    elif 'MATHEMATICAL' in char_name:
+        # Ký tự toán học
+        return f' {char_name.split()[-1].lower()}'
+    return char
+
+
+_unicode_reading_cached = lru_cache(maxsize=8192)(_unicode_reading)
+
+
+class _TranslateTable(dict):
+    """ Bảng cho str.translate: ký tự đặc biệt cố định, các ký tự khác tra tên Unicode khi gặp lần đầu. """
+
+    def __missing__(self, code):
+        value = _unicode_reading_cached(chr(code))
+        self[code] = value
+        return value
+
+
+class MathTransducer:
+    """
+    Bản biên dịch sẵn của process_special_characters, cho kết quả giống hệt từng byte.
+
+    - Bước 1: một regex alternation của mọi mẫu toán học làm bộ lọc; các mẫu được áp dụng
+      tuần tự như cũ chỉ khi có ít nhất một mẫu khớp (mỗi bước thay thế có thể tạo đầu vào
+      cho mẫu sau, nên không gộp chúng thành một lần thay thế).
+    - Bước 2 + 3: một lần str.translate; ký tự trong bảng thay trực tiếp, ký tự ngoài ASCII
+      khác tra tên Unicode (memo LRU). Gộp được vì chuỗi thay thế không chứa ký tự nào của
+      bảng và đi qua bước 3 không đổi; nếu bảng vi phạm điều đó thì chạy lại từng bước như cũ.
+    - Bước 4: chuẩn hoá khoảng trắng, rồi một regex xoá khoảng trắng trước dấu câu / ")"
+      và sau "(".
+    """
+
+    _SPACE = re.compile(r'\s+')
+    _TIGHTEN = re.compile(r'\s+(?=[.,;:!?])|(?<=\()\s+|\s+(?=\))')
+
+    def __init__(self, special_char_map: Dict[str, str], math_patterns: List[Tuple[str, str]]):
+        self.special_char_map = dict(special_char_map)
+        self.patterns = [(re.compile(p), r) for p, r in math_patterns]
+        self.any_pattern = re.compile('|'.join(f'(?:{p})' for p, _ in math_patterns)) if math_patterns else None
+        keys = set(self.special_char_map)
+        self.single_pass = all(
+            not (set(v) & keys) and all(_unicode_reading(c) == c for c in v)
+            for v in self.special_char_map.values())
+        self.table = _TranslateTable({ord(k): v for k, v in self.special_char_map.items()})
+
+    def __call__(self, text: str) -> str:
+        if not text:
+            return text
+        if self.any_pattern is not None and self.any_pattern.search(text):
+            for pattern, replacement in self.patterns:
+                text = pattern.sub(replacement, text)
+        if self.single_pass:
+            text = text.translate(self.table)
+        else:
+            for special_char, replacement in self.special_char_map.items():
+                text = text.replace(special_char, replacement)
+            text = text.translate(_TranslateTable())
+        text = self._SPACE.sub(' ', text).strip()
+        return self._TIGHTEN.sub('', text)
+
+
+_DEFAULT_TRANSDUCER = None
+
+def get_math_transducer() -> MathTransducer:
+    """ Transducer dùng chung, dựng từ bảng mặc định một lần cho cả process. """
+    global _DEFAULT_TRANSDUCER
+    if _DEFAULT_TRANSDUCER is None:
+        _DEFAULT_TRANSDUCER = MathTransducer(SPECIAL_CHAR_MAP, MATH_PATTERNS)
+    return _DEFAULT_TRANSDUCER
+
+
 class MathFormulaProcessor:
     """
     Xử lý các ký tự đặc biệt và công thức toán học từ PowerPoint
@@ -15,202 +322,10 @@ class MathFormulaProcessor:
     
     def __init__(self):
         # Bảng tra cứu ký tự đặc biệt sang tiếng Việt
-        self.special_char_map = {
-            # Số mũ
-            '²': ' mũ hai',
-            '³': ' mũ ba',
-            '¹': ' mũ một',
-            '⁴': ' mũ bốn',
-            '⁵': ' mũ năm',
-            '⁶': ' mũ sáu',
-            '⁷': ' mũ bảy',
-            '⁸': ' mũ tám',
-            '⁹': ' mũ chín',
-            '⁰': ' mũ không',
-            
-            # Chỉ số dưới
-            '₁': ' chỉ số một',
-            '₂': ' chỉ số hai',
-            '₃': ' chỉ số ba',
-            '₄': ' chỉ số bốn',
-            '₅': ' chỉ số năm',
-            '₆': ' chỉ số sáu',
-            '₇': ' chỉ số bảy',
-            '₈': ' chỉ số tám',
-            '₉': ' chỉ số chín',
-            '₀': ' chỉ số không',
-            
-            # Ký tự Hy Lạp
-            'α': ' alpha',
-            'β': ' beta',
-            'γ': ' gamma',
-            'δ': ' delta',
-            'ε': ' epsilon',
-            'ζ': ' zeta',
-            'η': ' eta',
-            'θ': ' theta',
-            'ι': ' iota',
-            'κ': ' kappa',
-            'λ': ' lambda',
-            'μ': ' mu',
-            'ν': ' nu',
-            'ξ': ' xi',
-            'ο': ' omicron',
-            'π': ' pi',
-            'ρ': ' rho',
-            'σ': ' sigma',
-            'τ': ' tau',
-            'υ': ' upsilon',
-            'φ': ' phi',
-            'χ': ' chi',
-            'ψ': ' psi',
-            'ω': ' omega',
-            
-            # Chữ hoa Hy Lạp
-            'Α': ' Alpha',
-            'Β': ' Beta',
-            'Γ': ' Gamma',
-            'Δ': ' Delta',
-            'Ε': ' Epsilon',
-            'Ζ': ' Zeta',
-            'Η': ' Eta',
-            'Θ': ' Theta',
-            'Ι': ' Iota',
-            'Κ': ' Kappa',
-            'Λ': ' Lambda',
-            'Μ': ' Mu',
-            'Ν': ' Nu',
-            'Ξ': ' Xi',
-            'Ο': ' Omicron',
-            'Π': ' Pi',
-            'Ρ': ' Rho',
-            'Σ': ' Sigma',
-            'Τ': ' Tau',
-            'Υ': ' Upsilon',
-            'Φ': ' Phi',
-            'Χ': ' Chi',
-            'Ψ': ' Psi',
-            'Ω': ' Omega',
-            
-            # Ký tự toán học
-            '±': ' cộng trừ',
-            '∓': ' trừ cộng',
-            '×': ' nhân',
-            '÷': ' chia',
-            '⋅': ' nhân',
-            '∗': ' nhân',
-            '√': ' căn bậc hai',
-            '∛': ' căn bậc ba',
-            '∜': ' căn bậc bốn',
-            '∞': ' vô cùng',
-            '≈': ' xấp xỉ',
-            '≠': ' khác',
-            '≤': ' nhỏ hơn hoặc bằng',
-            '≥': ' lớn hơn hoặc bằng',
-            '≪': ' nhỏ hơn rất nhiều',
-            '≫': ' lớn hơn rất nhiều',
-            '≡': ' đồng dư',
-            '≅': ' đồng dạng',
-            '∝': ' tỷ lệ thuận',
-            '∑': ' tổng',
-            '∏': ' tích',
-            '∫': ' tích phân',
-            '∬': ' tích phân kép',
-            '∭': ' tích phân ba',
-            '∮': ' tích phân đường',
-            '∯': ' tích phân mặt',
-            '∰': ' tích phân thể tích',
-            '∇': ' nabla',
-            '∂': ' đạo hàm riêng',
-            '∆': ' delta',
-            '∅': ' tập rỗng',
-            '∈': ' thuộc',
-            '∉': ' không thuộc',
-            '∋': ' chứa',
-            '∌': ' không chứa',
-            '⊂': ' tập con',
-            '⊃': ' tập cha',
-            '⊆': ' tập con hoặc bằng',
-            '⊇': ' tập cha hoặc bằng',
-            '∪': ' hợp',
-            '∩': ' giao',
-            '∖': ' hiệu',
-            '⊕': ' tổng trực tiếp',
-            '⊗': ' tích tensor',
-            '⊥': ' vuông góc',
-            '∥': ' song song',
-            '∠': ' góc',
-            '∡': ' góc đo',
-            '∢': ' góc phẳng',
-            '°': ' độ',
-            '′': ' phút',
-            '″': ' giây',
-            '‰': ' phần nghìn',
-            '‱': ' phần vạn',
-            
-            # Mũi tên
-            '→': ' mũi tên phải',
-            '←': ' mũi tên trái',
-            '↑': ' mũi tên lên',
-            '↓': ' mũi tên xuống',
-            '↔': ' mũi tên hai chiều',
-            '↕': ' mũi tên lên xuống',
-            '⇒': ' suy ra',
-            '⇐': ' ngược lại',
-            '⇔': ' tương đương',
-            '⇎': ' không tương đương',
-            
-            # Logic
-            '∀': ' với mọi',
-            '∃': ' tồn tại',
-            '∄': ' không tồn tại',
-            '∴': ' do đó',
-            '∵': ' vì',
-            '∧': ' và',
-            '∨': ' hoặc',
-            '¬': ' không',
-            '⊤': ' đúng',
-            '⊥': ' sai',
-            
-            # Tập số
-            'ℕ': ' tập số tự nhiên',
-            'ℤ': ' tập số nguyên',
-            'ℚ': ' tập số hữu tỷ',
-            'ℝ': ' tập số thực',
-            'ℂ': ' tập số phức',
-            'ℙ': ' tập số nguyên tố',
-            
-            # Ký tự khác
-            'ℵ': ' aleph',
-            'ℶ': ' beth',
-            'ℷ': ' gimel',
-            'ℸ': ' daleth',
-            'ℏ': ' h bar',
-            'ℯ': ' e',
-            'ℊ': ' g',
-            'ℴ': ' o',
-            'ℵ': ' aleph',
-        }
+        self.special_char_map = dict(SPECIAL_CHAR_MAP)
         
         # Mẫu regex để nhận diện các công thức toán học đơn giản
-        self.math_patterns = [
-            # Phân số: a/b
-            (r'(\d+)/(\d+)', r'\1 chia \2'),
-            # Căn bậc hai: √x (cần xử lý trước khi thay thế √)
-            (r'√(\w+)', r'căn bậc hai của \1'),
-            # Căn bậc n: n√x (cần xử lý trước khi thay thế √)
-            (r'(\d+)√(\w+)', r'\1 căn bậc \1 của \2'),
-            # Lũy thừa: x^n
-            (r'(\w+)\^(\d+)', r'\1 mũ \2'),
-            # Tích phân: ∫f(x)dx
-            (r'∫([^d]+)d([a-z])', r'tích phân của \1 theo \2'),
-            # Đạo hàm: d/dx
-            (r'd/(d[a-z])', r'đạo hàm theo \1'),
-            # Tổng: Σ
-            (r'Σ([^=]+)=([^=]+)', r'tổng của \1 từ \2'),
-            # Tích: Π
-            (r'Π([^=]+)=([^=]+)', r'tích của \1 từ \2'),
-        ]
+        self.math_patterns = list(MATH_PATTERNS)
     
     def process_special_characters(self, text: str) -> str:
         """
@@ -219,23 +334,10 @@ class MathFormulaProcessor:
         if not text:
             return text
         
-        processed_text = text
-        
-        # Bước 1: Xử lý các mẫu toán học phức tạp TRƯỚC
-        for pattern, replacement in self.math_patterns:
-            processed_text = re.sub(pattern, replacement, processed_text)
-        
-        # Bước 2: Xử lý từng ký tự đặc biệt
-        for special_char, replacement in self.special_char_map.items():
-            processed_text = processed_text.replace(special_char, replacement)
-        
-        # Bước 3: Xử lý các ký tự Unicode khác
-        processed_text = self._process_unicode_chars(processed_text)
-        
-        # Bước 4: Làm sạch văn bản
-        processed_text = self._clean_text(processed_text)
-        
-        return processed_text
+        # Bảng mặc định: transducer biên dịch sẵn dùng chung; bảng đã bị sửa trên instance thì dựng riêng
+        if self.special_char_map == SPECIAL_CHAR_MAP and self.math_patterns == MATH_PATTERNS:
+            return get_math_transducer()(text)
+        return MathTransducer(self.special_char_map, self.math_patterns)(text)
     
     def debug_process(self, text: str) -> Dict[str, str]:
         """
@@ -355,51 +457,25 @@ class MathFormulaProcessor:
         Trích xuất các đối tượng toán học từ PowerPoint
         """
         try:
-            from pptx import Presentation
-            from pptx.oxml import parse_xml
-            from pptx.oxml.ns import qn
-            
-            prs = Presentation(pptx_file_path)
-            math_objects = []
-            
-            for slide_num, slide in enumerate(prs.slides):
-                slide_math = []
-                
-                for shape in slide.shapes:
-                    # Kiểm tra các đối tượng toán học
-                    if hasattr(shape, 'element'):
-                        element = shape.element
-                        
-                        # Tìm các phần tử toán học
-                        math_elements = element.findall('.//m:oMath', {'m': 'http://schemas.openxmlformats.org/officeDocument/2006/math'})
-                        
-                        for math_elem in math_elements:
-                            try:
-                                # Chuyển đổi XML thành văn bản
-                                math_text = self._extract_mathml_text(math_elem)
-                                if math_text:
-                                    slide_math.append({
-                                        'type': 'math_object',
-                                        'content': math_text,
-                                        'processed_content': self.process_special_characters(math_text)
-                                    })
-                            except Exception as e:
-                                logger.warning(f"Lỗi xử lý phần tử toán học: {e}")
-                
-                if slide_math:
-                    math_objects.append({
-                        'slide_number': slide_num + 1,
-                        'math_objects': slide_math
-                    })
-            
-            return math_objects
-            
-        except ImportError:
-            logger.error("Không thể import python-pptx. Vui lòng cài đặt: pip install python-pptx")
-            return []
+            return self._math_objects(read_pptx(pptx_file_path))
         except Exception as e:
             logger.error(f"Lỗi trích xuất đối tượng toán học: {e}")
             return []
+
+    def _math_objects(self, slides: List[Dict]) -> List[Dict]:
+        math_objects = []
+        for slide in slides:
+            slide_math = [{
+                'type': 'math_object',
+                'content': math_text,
+                'processed_content': self.process_special_characters(math_text)
+            } for math_text in slide['math']]
+            if slide_math:
+                math_objects.append({
+                    'slide_number': slide['slide_number'],
+                    'math_objects': slide_math
+                })
+        return math_objects
     
     def _extract_mathml_text(self, math_element) -> str:
         """
@@ -430,26 +506,19 @@ class MathFormulaProcessor:
         Xử lý toàn bộ văn bản từ PowerPoint, bao gồm cả đối tượng toán học
         """
         try:
-            from pptx import Presentation
-            
-            prs = Presentation(pptx_file_path)
+            # Đọc file pptx một lần: text, công thức (OMML) và ghi chú của mọi slide
+            slides = read_pptx(pptx_file_path)
             processed_slides = []
             
             # Trích xuất đối tượng toán học
-            math_objects = self.extract_math_objects_from_pptx(pptx_file_path)
+            math_objects = self._math_objects(slides)
             math_dict = {obj['slide_number']: obj['math_objects'] for obj in math_objects}
             
-            for i, slide in enumerate(prs.slides):
-                slide_num = i + 1
-                text_chunks = []
+            for slide in slides:
+                slide_num = slide['slide_number']
                 
-                # Trích xuất văn bản thông thường
-                for shape in slide.shapes:
-                    if hasattr(shape, "text") and shape.text:
-                        text_chunks.append(shape.text.strip())
-                
-                # Kết hợp văn bản thông thường và toán học
-                slide_text = " ".join(filter(None, text_chunks))
+                # Văn bản thông thường
+                slide_text = slide['text']
                 
                 # Xử lý văn bản thông thường
                 processed_text = self.process_special_characters(slide_text)
@@ -467,7 +536,8 @@ class MathFormulaProcessor:
                     'slide_number': slide_num,
                     'original_text': slide_text,
                     'processed_text': processed_text,
-                    'has_math_objects': slide_num in math_dict
+                    'has_math_objects': slide_num in math_dict,
+                    'notes': slide['notes']
                 })
             
             return {
@@ -490,8 +560,7 @@ def process_math_text(text: str) -> str:
     """
     Hàm tiện ích để xử lý nhanh văn bản chứa công thức toán học
     """
-    processor = MathFormulaProcessor()
-    return processor.process_special_characters(text)
+    return get_math_transducer()(text)
 
 def process_powerpoint_file(pptx_file_path: str) -> Dict:
     """
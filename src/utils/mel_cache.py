@@ -0,0 +1,127 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from src.utils.crop_cache import file_digest
+
+
+class MelCache():
+    """
+    Mel spectrograms keyed by audio content hash, stored with the video frame count of the audio.
+
+    The last few spectrograms are kept in memory, every entry is also written to root as a .npz
+    so a new process rendering the same narration skips audio.melspectrogram as well. Files are
+    evicted least-recently-used once the directory grows past max_mb.
+    """
+
+    def __init__(self, root=os.path.join('data', 'cache', 'mel'), max_mb=256, max_items=8):
+        self.root = root
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.max_items = max_items
+        self.hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        os.makedirs(self.root, exist_ok=True)
+
+    def key(self, audio_path, sr=16000):
+        return '%s-%d' % (file_digest(audio_path), sr)
+
+    def _path(self, key):
+        return os.path.join(self.root, key + '.npz')
+
+    def get(self, key):
+        """ (mel, num_frames) for key, or None on a miss. """
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return self._memory[key]
+            path = self._path(key)
+            try:
+                with np.load(path) as data:
+                    entry = (data['mel'], int(data['num_frames']))
+            except (OSError, ValueError, KeyError):
+                self.misses += 1
+                return None
+            now = time.time()
+            os.utime(path, (now, now))
+            self._remember(key, entry)
+            self.hits += 1
+            return entry
+
+    def put(self, key, mel, num_frames):
+        with self._lock:
+            self._remember(key, (mel, num_frames))
+            path = self._path(key)
+            tmp = path + '.tmp-%d-%d.npz' % (os.getpid(), threading.get_ident())
+            try:
+                np.savez(tmp, mel=mel, num_frames=num_frames)
+                os.replace(tmp, path)
+            except OSError as e:
+                print(f'mel cache: could not store entry: {e}')
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+                return
+            self._evict(keep=path)
+
+    def _remember(self, key, entry):
+        entry[0].setflags(write=False)  # shared between callers
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_items:
+            self._memory.popitem(last=False)
+
+    def _entries(self):
+        entries = []
+        for name in os.listdir(self.root):
+            if not name.endswith('.npz') or '.tmp-' in name:
+                continue
+            path = os.path.join(self.root, name)
+            entries.append((os.path.getmtime(path), os.path.getsize(path), path))
+        return sorted(entries)
+
+    def _evict(self, keep=None):
+        entries = self._entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            os.remove(path)
+            total -= size
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            for _, _, path in self._entries():
+                os.remove(path)
+
+    def stats(self):
+        with self._lock:
+            entries = self._entries()
+            return {'hits': self.hits,
+                    'misses': self.misses,
+                    'entries': len(entries),
+                    'in_memory': len(self._memory),
+                    'size_mb': sum(size for _, size, _ in entries) / (1024 * 1024),
+                    'max_mb': self.max_bytes / (1024 * 1024)}
+
+
+_MEL_CACHE = None
+_MEL_CACHE_LOCK = threading.Lock()
+
+def get_mel_cache():
+    """ Shared cache instance; SADTALKER_MEL_CACHE=0 disables it, SADTALKER_MEL_CACHE_MB sets the cap. """
+    global _MEL_CACHE
+    if os.environ.get('SADTALKER_MEL_CACHE', '1') == '0':
+        return None
+    with _MEL_CACHE_LOCK:
+        if _MEL_CACHE is None:
+            _MEL_CACHE = MelCache(root=os.environ.get('SADTALKER_MEL_CACHE_DIR', os.path.join('data', 'cache', 'mel')),
+                                  max_mb=float(os.environ.get('SADTALKER_MEL_CACHE_MB', 256)))
+        return _MEL_CACHE
@@ -0,0 +1,155 @@
+import os
+import gc
+import threading
+from collections import OrderedDict
+
+import torch
+
+from src.utils.preprocess import CropAndExtract
+from src.test_audio2coeff import Audio2Coeff
+from src.facerender.animate import AnimateFromCoeff
+from src.utils.init_path import init_path
+
+
+def preprocess_family(preprocess):
+    """ 'full' and 'extfull' use the still facerender config and mapping net, everything else shares the crop one. """
+    return 'full' if 'full' in preprocess.lower() else 'crop'
+
+
+def _module_nbytes(obj, seen=None, depth=0):
+    """ Rough RAM footprint of all torch modules reachable from obj (parameters + buffers). """
+    if seen is None:
+        seen = set()
+    if id(obj) in seen or depth > 4:
+        return 0
+    seen.add(id(obj))
+
+    if isinstance(obj, torch.nn.Module):
+        total = 0
+        for t in list(obj.parameters()) + list(obj.buffers()):
+            if id(t) not in seen:
+                seen.add(id(t))
+                total += t.numel() * t.element_size()
+        return total
+
+    total = 0
+    for value in getattr(obj, '__dict__', {}).values():
+        if isinstance(value, torch.nn.Module) or hasattr(value, '__dict__'):
+            total += _module_nbytes(value, seen, depth + 1)
+    return total
+
+
+class ModelBundle():
+    """ The three SadTalker stages built for one (size, preprocess family, device) key. """
+
+    def __init__(self, sadtalker_paths, device):
+        self.sadtalker_paths = sadtalker_paths
+        self.device = device
+        self.preprocess_model = CropAndExtract(sadtalker_paths, device)
+        self.audio_to_coeff = Audio2Coeff(sadtalker_paths, device)
+        self.animate_from_coeff = AnimateFromCoeff(sadtalker_paths, device)
+        self.nbytes = _module_nbytes(self)
+
+
+class ModelPool():
+    """
+    Process-wide cache of loaded SadTalker models.
+
+    Bundles are keyed by (size, preprocess family, device) and kept in LRU order. When
+    max_ram_mb is set, the least recently used bundles are dropped until the pool fits
+    the budget again; the bundle that was just requested is never evicted.
+    """
+
+    def __init__(self, checkpoint_path='checkpoints', config_path='src/config', old_version=False, max_ram_mb=None):
+        self.checkpoint_path = checkpoint_path
+        self.config_path = config_path
+        self.old_version = old_version
+        if max_ram_mb is None:
+            max_ram_mb = float(os.environ.get('SADTALKER_POOL_MAX_MB', 0)) or None
+        self.max_ram_mb = max_ram_mb
+
+        self._bundles = OrderedDict()
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, size, preprocess, device):
+        return (int(size), preprocess_family(preprocess), str(device))
+
+    def get(self, size, preprocess, device):
+        key = self.key(size, preprocess, device)
+        with self._lock:
+            if key in self._bundles:
+                self.hits += 1
+                self._bundles.move_to_end(key)
+                return self._bundles[key]
+
+            self.misses += 1
+            print(f'model pool: loading {key}')
+            sadtalker_paths = init_path(self.checkpoint_path, self.config_path, size, self.old_version, preprocess)
+            bundle = ModelBundle(sadtalker_paths, device)
+            self._bundles[key] = bundle
+            self._evict(keep=key)
+            return bundle
+
+    def warmup(self, configs, device, enhancer=None):
+        """ configs: iterable of (size, preprocess) pairs to load ahead of the first request. """
+        for size, preprocess in configs:
+            self.get(size, preprocess, device)
+        if enhancer:
+            from src.utils.face_enhancer import get_restorer
+            get_restorer(method=enhancer, bg_upsampler=None)
+
+    def _evict(self, keep=None):
+        if not self.max_ram_mb:
+            return
+        budget = self.max_ram_mb * 1024 * 1024
+        evicted = False
+        while len(self._bundles) > 1 and self.total_bytes() > budget:
+            oldest = next(iter(self._bundles))
+            if oldest == keep:
+                break
+            print(f'model pool: evicting {oldest}')
+            del self._bundles[oldest]
+            evicted = True
+        if evicted:
+            self._release()
+
+    def _release(self):
+        gc.collect()
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+
+    def total_bytes(self):
+        return sum(b.nbytes for b in self._bundles.values())
+
+    def keys(self):
+        with self._lock:
+            return list(self._bundles.keys())
+
+    def clear(self):
+        with self._lock:
+            self._bundles.clear()
+            self._release()
+
+    def stats(self):
+        with self._lock:
+            return {'keys': list(self._bundles.keys()),
+                    'hits': self.hits,
+                    'misses': self.misses,
+                    'ram_mb': self.total_bytes() / (1024 * 1024),
+                    'max_ram_mb': self.max_ram_mb}
+
+
+_POOLS = {}
+_POOLS_LOCK = threading.Lock()
+
+def get_model_pool(checkpoint_path='checkpoints', config_path='src/config', old_version=False, max_ram_mb=None):
+    """ Return the shared pool for this checkpoint/config pair, creating it on first use. """
+    key = (os.path.abspath(checkpoint_path), os.path.abspath(config_path), old_version)
+    with _POOLS_LOCK:
+        if key not in _POOLS:
+            _POOLS[key] = ModelPool(checkpoint_path, config_path, old_version=old_version, max_ram_mb=max_ram_mb)
+        elif max_ram_mb is not None:
+            _POOLS[key].max_ram_mb = max_ram_mb
+        return _POOLS[key]
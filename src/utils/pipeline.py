@@ -0,0 +1,83 @@
+import time
+import queue
+import threading
+
+_STOP = object()
+
+
+class StagePipeline():
+    """
+    Runs items through a chain of stages connected by bounded queues.
+
+    stages is a list of (name, fn, workers). Every stage has its own worker threads, so while
+    one item is in a slow stage the next items are already in the earlier ones and wall time
+    approaches the slowest stage instead of the sum of all of them. A stage returning None drops
+    the item; an exception stops the pipeline and is raised again from run().
+    """
+
+    def __init__(self, stages, queue_size=2):
+        self.stages = stages
+        self.queue_size = queue_size
+        self.stage_times = {name: 0. for name, _, _ in stages}
+        self._lock = threading.Lock()
+        self._error = None
+
+    def _worker(self, name, fn, inbox, outbox, alive):
+        while True:
+            item = inbox.get()
+            if item is _STOP:
+                inbox.put(_STOP)  # let the sibling workers see it too
+                with self._lock:
+                    alive[0] -= 1
+                    last = alive[0] == 0
+                if last:
+                    outbox.put(_STOP)
+                return
+            if self._error is not None:
+                continue  # drain, the pipeline is stopping
+            index, value = item
+            start = time.time()
+            try:
+                result = fn(value)
+            except Exception as e:
+                with self._lock:
+                    if self._error is None:
+                        self._error = e
+                continue
+            finally:
+                with self._lock:
+                    self.stage_times[name] += time.time() - start
+            if result is not None:
+                outbox.put((index, result))
+
+    def _feed(self, items, inbox):
+        for index, value in enumerate(items):
+            if self._error is not None:
+                break
+            inbox.put((index, value))
+        inbox.put(_STOP)
+
+    def run(self, items):
+        """ Results of the last stage, in input order, without the dropped items. """
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in range(len(self.stages) + 1)]
+        threads = [threading.Thread(target=self._feed, args=(items, queues[0]), daemon=True)]
+        for k, (name, fn, workers) in enumerate(self.stages):
+            alive = [max(1, int(workers))]
+            for _ in range(alive[0]):
+                threads.append(threading.Thread(target=self._worker, args=(name, fn, queues[k], queues[k+1], alive), daemon=True))
+        for t in threads:
+            t.start()
+
+        results = {}
+        while True:
+            item = queues[-1].get()
+            if item is _STOP:
+                break
+            index, value = item
+            results[index] = value
+        for t in threads:
+            t.join()
+
+        if self._error is not None:
+            raise self._error
+        return [results[index] for index in sorted(results)]
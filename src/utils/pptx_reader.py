@@ -0,0 +1,153 @@
+import posixpath
+import zipfile
+import xml.etree.ElementTree as ET
+from typing import Dict, List
+
+_P = '{http://schemas.openxmlformats.org/presentationml/2006/main}'
+_A = '{http://schemas.openxmlformats.org/drawingml/2006/main}'
+_M = '{http://schemas.openxmlformats.org/officeDocument/2006/math}'
+_R = '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}'
+_MC = '{http://schemas.openxmlformats.org/markup-compatibility/2006}'
+_REL = '{http://schemas.openxmlformats.org/package/2006/relationships}'
+
+# the same shape types python-pptx lists in slide.shapes
+_SHAPES = {_P + 'sp', _P + 'grpSp', _P + 'graphicFrame', _P + 'cxnSp', _P + 'pic', _P + 'contentPart'}
+_WRAPPERS = {_MC + 'AlternateContent', _MC + 'Choice'}
+_NOTES_REL = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships/notesSlide'
+
+
+def _rels(zf, part_name):
+    """ {rId: (type, absolute part name)} of a part, {} when it has no relationships. """
+    rels_name = posixpath.join(posixpath.dirname(part_name), '_rels', posixpath.basename(part_name) + '.rels')
+    try:
+        root = ET.fromstring(zf.read(rels_name))
+    except KeyError:
+        return {}
+    out = {}
+    for rel in root.iter(_REL + 'Relationship'):
+        if rel.get('TargetMode') == 'External':
+            continue
+        target = posixpath.normpath(posixpath.join(posixpath.dirname(part_name), rel.get('Target')))
+        out[rel.get('Id')] = (rel.get('Type'), target)
+    return out
+
+
+def _slide_parts(zf):
+    """ Slide part names in presentation order. """
+    pres = 'ppt/presentation.xml'
+    rels = _rels(zf, pres)
+    root = ET.fromstring(zf.read(pres))
+    lst = root.find(_P + 'sldIdLst')
+    if lst is None:
+        return []
+    return [rels[sld.get(_R + 'id')][1] for sld in lst.findall(_P + 'sldId') if sld.get(_R + 'id') in rels]
+
+
+def _parse_shape_tree(fp, notes=False):
+    """
+    Stream one slide (or notes slide) part and return (shape texts, math texts).
+
+    Text follows python-pptx shape.text for the top-level shapes: paragraphs joined by newline,
+    line breaks as vertical tab. Math is the text of every m:oMath inside a top-level shape.
+    Shapes wrapped in mc:AlternateContent are read from mc:Choice, mc:Fallback is skipped.
+    For notes only the body placeholder is read.
+    """
+    texts, maths = [], []
+    stack = []
+    tree_depth = None
+    fallback = 0
+    shape = None      # state of the current top-level shape
+    order = 0
+    orders = []       # pre-order index of the open elements inside the current formula
+    for event, elem in ET.iterparse(fp, events=('start', 'end')):
+        tag = elem.tag
+        if event == 'start':
+            stack.append(tag)
+            depth = len(stack)
+            if tag == _MC + 'Fallback':
+                fallback += 1
+            if fallback:
+                continue
+            if tree_depth is None:
+                if tag == _P + 'spTree':
+                    tree_depth = depth
+                continue
+            if shape is None:
+                if tag in _SHAPES and all(t in _WRAPPERS for t in stack[tree_depth:-1]):
+                    shape = {'depth': depth, 'sp': tag == _P + 'sp', 'paras': [], 'body': None,
+                             'para': None, 'ph': None, 'math': None}
+                continue
+            if tag == _P + 'ph':
+                shape['ph'] = elem.get('type')
+            elif shape['sp'] and tag == _P + 'txBody' and depth == shape['depth'] + 1:
+                shape['body'] = depth
+            elif shape['body'] and tag == _A + 'p' and depth == shape['body'] + 1:
+                shape['para'] = (depth, [])
+            elif shape['para'] and tag == _A + 'br' and depth == shape['para'][0] + 1:
+                shape['para'][1].append('\v')
+            if tag == _M + 'oMath' and shape['math'] is None:
+                shape['math'] = (depth, [])
+            if shape['math'] is not None:
+                orders.append(order)
+                order += 1
+            continue
+
+        # end event
+        depth = len(stack)
+        stack.pop()
+        if tag == _MC + 'Fallback':
+            fallback -= 1
+            continue
+        if fallback or shape is None:
+            if tag == _P + 'spTree' and depth == tree_depth:
+                tree_depth = None
+            continue
+        if shape['math'] is not None:
+            # texts are complete at the end event, sort them back into document order
+            index = orders.pop()
+            if elem.text and elem.text.strip():
+                shape['math'][1].append((index, elem.text.strip()))
+            if tag == _M + 'oMath' and depth == shape['math'][0]:
+                text = ' '.join(t for _, t in sorted(shape['math'][1]))
+                if text:
+                    maths.append(text)
+                shape['math'] = None
+        if shape['para'] and tag == _A + 't' and depth == shape['para'][0] + 2:
+            shape['para'][1].append(elem.text or '')
+        elif shape['para'] and tag == _A + 'p' and depth == shape['para'][0]:
+            shape['paras'].append(''.join(shape['para'][1]))
+            shape['para'] = None
+        elif tag in _SHAPES and depth == shape['depth']:
+            text = '\n'.join(shape['paras']).strip()
+            if text and (not notes or shape['ph'] == 'body'):
+                texts.append(text)
+            shape = None
+            elem.clear()
+    return texts, maths
+
+
+def read_pptx(pptx_path) -> List[Dict]:
+    """
+    Text, OMML math and speaker notes of every slide, reading the deck zip once.
+
+    Only the slide and notes XML parts are decompressed (media is never touched) and each part
+    is streamed with iterparse. Returns one dict per slide in presentation order:
+    slide_number, text (shape texts joined by spaces, like python-pptx), math (list of the
+    text of every formula) and notes.
+    """
+    slides = []
+    with zipfile.ZipFile(pptx_path) as zf:
+        for number, part in enumerate(_slide_parts(zf), 1):
+            with zf.open(part) as fp:
+                texts, maths = _parse_shape_tree(fp)
+            notes = ''
+            for rel_type, target in _rels(zf, part).values():
+                if rel_type == _NOTES_REL and target in zf.NameToInfo:
+                    with zf.open(target) as fp:
+                        notes = '\n'.join(_parse_shape_tree(fp, notes=True)[0])
+                    break
+            slides.append({'slide_number': number,
+                           'text': ' '.join(texts),
+                           'math': maths,
+                           'notes': notes})
+    return slides
@@ -0,0 +1,58 @@
+import threading
+from contextlib import contextmanager, nullcontext
+
+import torch
+import torch.nn.functional as F
+
+PRECISIONS = ['fp32', 'bf16']
+
+_state = threading.local()
+
+
+def bf16_supported(device='cpu'):
+    if str(device).startswith('cuda'):
+        return torch.cuda.is_available() and torch.cuda.is_bf16_supported()
+    try:
+        return bool(torch.ops.mkldnn._is_mkldnn_bf16_supported())
+    except Exception:
+        return False
+
+
+def resolve_precision(precision, device):
+    """ Fall back to fp32 when bf16 is asked for on hardware without native bf16 support. """
+    if precision not in PRECISIONS:
+        raise ValueError(f'Unknown precision {precision}, expected one of {PRECISIONS}.')
+    if precision == 'bf16' and not bf16_supported(device):
+        print(f'bf16 is not supported on {device}, running in fp32')
+        return 'fp32'
+    return precision
+
+
+@contextmanager
+def precision_scope(precision):
+    """ Set the precision used by autocast() for the stages run in this thread. """
+    previous = getattr(_state, 'precision', 'fp32')
+    _state.precision = precision
+    try:
+        yield
+    finally:
+        _state.precision = previous
+
+
+def current_precision():
+    return getattr(_state, 'precision', 'fp32')
+
+
+def autocast(device, precision=None):
+    """ bf16 autocast for the current precision scope, a no-op in fp32. """
+    precision = precision or current_precision()
+    if precision != 'bf16':
+        return nullcontext()
+    device_type = 'cuda' if str(device).startswith('cuda') else 'cpu'
+    return torch.autocast(device_type=device_type, dtype=torch.bfloat16)
+
+
+def grid_sample_fp32(inp, grid, **kwargs):
+    """ grid_sample is sensitive to coordinate rounding, always run it in fp32. """
+    with torch.autocast(device_type=inp.device.type, enabled=False):
+        return F.grid_sample(inp.float(), grid.float(), **kwargs)
@@ -0,0 +1,205 @@
+import os
+import json
+import time
+import shutil
+import tempfile
+import threading
+import subprocess
+from shutil import which
+from collections import Counter
+
+from src.utils.crop_cache import file_digest
+
+
+class SlideCache():
+    """
+    Rasterized slides keyed by deck content hash and target height.
+
+    A deck is converted to PDF by LibreOffice once, then pdftoppm renders the pages straight at
+    the target height (width follows the slide aspect, 1920x1080 for 16:9 decks) with several
+    processes in parallel, writing the PNGs directly into the entry directory. The entry is
+    built in a temp directory and renamed into place, its manifest.json lists the images and
+    its mtime is the LRU clock. The same paths serve the preview and the video generation;
+    a job pins the entries it uses with acquire() / release() so eviction and clear() skip them.
+    """
+
+    def __init__(self, root=os.path.join('data', 'cache', 'slides'), max_mb=2048):
+        self.root = root
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._pins = Counter()
+        os.makedirs(self.root, exist_ok=True)
+
+    def key(self, pptx_path, height=1080):
+        return '%s-%dp' % (file_digest(pptx_path), height)
+
+    def _manifest_path(self, key):
+        return os.path.join(self.root, key, 'manifest.json')
+
+    def get(self, key):
+        """ Image paths of a cached deck, or None on a miss. """
+        manifest_path = self._manifest_path(key)
+        with self._lock:
+            try:
+                with open(manifest_path, 'r', encoding='utf-8') as f:
+                    names = json.load(f)['images']
+            except (OSError, ValueError, KeyError):
+                self.misses += 1
+                return None
+            paths = [os.path.join(self.root, key, name) for name in names]
+            if not all(os.path.exists(p) for p in paths):
+                self.misses += 1
+                return None
+            now = time.time()
+            os.utime(manifest_path, (now, now))
+            self.hits += 1
+            return paths
+
+    def render(self, pptx_path, height=1080, thread_count=None):
+        """ Image paths of every slide of the deck at the target height, rendered on a miss. """
+        key = self.key(pptx_path, height)
+        paths = self.get(key)
+        if paths is not None:
+            return paths
+
+        tmp = tempfile.mkdtemp(prefix=key + '.tmp-', dir=self.root)
+        try:
+            names = rasterize_pptx(pptx_path, tmp, height=height, thread_count=thread_count)
+            with open(os.path.join(tmp, 'manifest.json'), 'w', encoding='utf-8') as f:
+                json.dump({'images': names, 'height': height, 'source': os.path.basename(pptx_path)}, f, ensure_ascii=False)
+            with self._lock:
+                target = os.path.join(self.root, key)
+                if os.path.exists(target):
+                    # rendered concurrently by another job, keep the first one
+                    shutil.rmtree(tmp, ignore_errors=True)
+                else:
+                    os.replace(tmp, target)
+                self._evict(keep=key)
+        finally:
+            if os.path.exists(tmp):
+                shutil.rmtree(tmp, ignore_errors=True)
+        return [os.path.join(self.root, key, name) for name in names]
+
+    def acquire(self, paths):
+        """ Pin the cache entries holding these image paths; returns the keys to hand to release(). """
+        root = os.path.abspath(self.root)
+        keys = set()
+        for path in paths:
+            if not path:
+                continue
+            rel = os.path.relpath(os.path.abspath(path), root)
+            if rel.startswith(os.pardir) or os.sep not in rel:
+                continue  # not an entry of this cache
+            keys.add(rel.split(os.sep)[0])
+        with self._lock:
+            # an entry evicted before the job started is not pinned, its images fall back as before
+            keys = [key for key in sorted(keys) if os.path.exists(self._manifest_path(key))]
+            now = time.time()
+            for key in keys:
+                self._pins[key] += 1
+                os.utime(self._manifest_path(key), (now, now))
+        return keys
+
+    def release(self, keys):
+        with self._lock:
+            for key in keys:
+                self._pins[key] -= 1
+                if self._pins[key] <= 0:
+                    del self._pins[key]
+
+    def _entries(self):
+        entries = []
+        for name in os.listdir(self.root):
+            manifest_path = self._manifest_path(name)
+            if '.tmp-' in name or not os.path.exists(manifest_path):
+                continue
+            d = os.path.join(self.root, name)
+            size = sum(os.path.getsize(os.path.join(d, f)) for f in os.listdir(d))
+            entries.append((os.path.getmtime(manifest_path), size, name))
+        return sorted(entries)
+
+    def _evict(self, keep=None):
+        entries = self._entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, key in entries:
+            if total <= self.max_bytes:
+                break
+            if key == keep or self._pins[key] > 0:
+                continue
+            shutil.rmtree(os.path.join(self.root, key), ignore_errors=True)
+            total -= size
+
+    def clear(self):
+        with self._lock:
+            for _, _, key in self._entries():
+                if self._pins[key] > 0:
+                    continue  # in use by a running job
+                shutil.rmtree(os.path.join(self.root, key), ignore_errors=True)
+
+    def stats(self):
+        with self._lock:
+            entries = self._entries()
+            return {'hits': self.hits,
+                    'misses': self.misses,
+                    'entries': len(entries),
+                    'pinned': len(self._pins),
+                    'size_mb': sum(size for _, size, _ in entries) / (1024 * 1024),
+                    'max_mb': self.max_bytes / (1024 * 1024)}
+
+
+def rasterize_pptx(pptx_path, output_dir, height=1080, thread_count=None):
+    """
+    PPTX -> PDF with LibreOffice, then PDF -> slide-XX.png in output_dir at the target height.
+    Returns the image file names in slide order; the intermediate PDF is removed.
+    """
+    if which("soffice") is None:
+        raise RuntimeError("Không tìm thấy LibreOffice (soffice). Vui lòng cài LibreOffice để chuyển PPTX -> PDF.")
+    from pdf2image import convert_from_path, pdfinfo_from_path
+
+    pdf_dir = tempfile.mkdtemp(prefix="pptx2pdf_")
+    try:
+        try:
+            subprocess.run(
+                ["soffice", "--headless", "--convert-to", "pdf", "--outdir", pdf_dir, pptx_path],
+                check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+            )
+        except subprocess.CalledProcessError as e:
+            raise RuntimeError(f"Chuyển PPTX sang PDF thất bại: {e}")
+
+        pdf_path = os.path.join(pdf_dir, os.path.splitext(os.path.basename(pptx_path))[0] + ".pdf")
+        if not os.path.exists(pdf_path):
+            raise RuntimeError("Không tạo được PDF từ PPTX. Kiểm tra file đầu vào.")
+
+        try:
+            pages = int(pdfinfo_from_path(pdf_path)["Pages"])
+            if thread_count is None:
+                thread_count = min(pages, os.cpu_count() or 1, 8)
+            # pdftoppm renders at the final height and writes the PNGs itself, nothing is re-encoded
+            paths = convert_from_path(pdf_path, size=(None, height), output_folder=output_dir, fmt='png',
+                                      output_file='page', paths_only=True, thread_count=max(1, thread_count))
+        except Exception as e:
+            raise RuntimeError("Lỗi convert PDF -> ảnh. Có thể thiếu Poppler (poppler-utils).") from e
+    finally:
+        shutil.rmtree(pdf_dir, ignore_errors=True)
+
+    names = []
+    for i, path in enumerate(paths, 1):
+        name = f"slide-{i:02d}.png"
+        os.replace(path, os.path.join(output_dir, name))
+        names.append(name)
+    return names
+
+
+_SLIDE_CACHE = None
+_SLIDE_CACHE_LOCK = threading.Lock()
+
+def get_slide_cache():
+    """ Shared cache instance; SADTALKER_SLIDE_CACHE_MB sets the cap. """
+    global _SLIDE_CACHE
+    with _SLIDE_CACHE_LOCK:
+        if _SLIDE_CACHE is None:
+            _SLIDE_CACHE = SlideCache(root=os.environ.get('SADTALKER_SLIDE_CACHE_DIR', os.path.join('data', 'cache', 'slides')),
+                                      max_mb=float(os.environ.get('SADTALKER_SLIDE_CACHE_MB', 2048)))
+        return _SLIDE_CACHE
@@ -1,21 +1,77 @@
 import shutil
 import uuid
+import queue
+import threading
+import subprocess
 
 import os
 
 import cv2
+import numpy as np
+import torch
 
-def load_video_to_cv2(input_path):
-    video_stream = cv2.VideoCapture(input_path)
-    fps = video_stream.get(cv2.CAP_PROP_FPS)
-    full_frames = [] 
-    while 1:
-        still_reading, frame = video_stream.read()
-        if not still_reading:
+class VideoFrameSource():
+    """
+    Decodes a video in chunks of RGB frames instead of one list of the whole video.
+
+    chunks() yields lists of at most chunk_size frames; transform (e.g. crop and resize) is
+    applied to every frame right after decoding, so only one full-resolution frame and one
+    chunk of transformed frames are alive at a time. Iterating the source yields single
+    frames. len() is the frame count from the container, which can be off by a few frames
+    and is 0 when the container does not report it.
+    """
+
+    def __init__(self, path, chunk_size=64, transform=None, max_frames=None):
+        self.path = path
+        self.chunk_size = chunk_size
+        self.transform = transform
+        self.max_frames = max_frames
+        video_stream = cv2.VideoCapture(path)
+        self.fps = video_stream.get(cv2.CAP_PROP_FPS)
+        # some containers / backends report 0 or a negative count
+        self.frame_count = max(0, int(video_stream.get(cv2.CAP_PROP_FRAME_COUNT)))
+        video_stream.release()
+
+    def __len__(self):
+        if self.max_frames is not None:
+            return min(self.frame_count, self.max_frames)
+        return self.frame_count
+
+    def first_frame(self):
+        """ The first RGB frame (without transform), read with its own capture; None for an empty video. """
+        video_stream = cv2.VideoCapture(self.path)
+        try:
+            still_reading, frame = video_stream.read()
+        finally:
             video_stream.release()
-            break 
-        full_frames.append(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
-    return full_frames
+        return cv2.cvtColor(frame, cv2.COLOR_BGR2RGB) if still_reading else None
+
+    def chunks(self):
+        video_stream = cv2.VideoCapture(self.path)
+        try:
+            chunk, count = [], 0
+            while self.max_frames is None or count < self.max_frames:
+                still_reading, frame = video_stream.read()
+                if not still_reading:
+                    break
+                frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+                chunk.append(frame if self.transform is None else self.transform(frame))
+                count += 1
+                if len(chunk) == self.chunk_size:
+                    yield chunk
+                    chunk = []
+            if chunk:
+                yield chunk
+        finally:
+            video_stream.release()
+
+    def __iter__(self):
+        for chunk in self.chunks():
+            yield from chunk
+
+
+def load_video_to_cv2(input_path):
+    return list(VideoFrameSource(input_path))
 
 def save_video_with_watermark(video, audio, save_path, watermark=False):
     temp_file = str(uuid.uuid4())+'.mp4'
@@ -38,4 +94,91 @@ def save_video_with_watermark(video, audio, save_path, watermark=False):
 
         cmd = r'ffmpeg -y -hide_banner -loglevel error -i "%s" -i "%s" -filter_complex "[1]scale=100:-1[wm];[0][wm]overlay=(main_w-overlay_w)-10:10" "%s"' % (temp_file, watarmark_path, save_path)
         os.system(cmd)
-        os.remove(temp_file)
\ No newline at end of file
+        os.remove(temp_file)
+
+
+def get_ffmpeg_exe():
+    try:
+        import imageio_ffmpeg
+        return imageio_ffmpeg.get_ffmpeg_exe()
+    except Exception:
+        return 'ffmpeg'
+
+
+class FFmpegFrameWriter():
+    """
+    Streams RGB frames into an mp4 through an ffmpeg subprocess.
+
+    write() takes a chunk of frames, either a float tensor (N, 3, H, W) in [0, 1] or a uint8
+    array (N, H, W, 3), and hands it to a writer thread that resizes and pipes it to ffmpeg.
+    The queue between them holds at most max_pending chunks, so memory stays bounded by the
+    chunk size no matter how long the video is, and rendering continues while ffmpeg encodes.
+    """
+
+    def __init__(self, path, fps=25, size=None, max_pending=2):
+        self.path = path
+        self.fps = fps
+        self.size = size  # (width, height) of the output, None keeps the rendered size
+        self.frames_written = 0
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._proc = None
+        self._error = None
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _open(self, width, height):
+        cmd = [get_ffmpeg_exe(), '-y', '-hide_banner', '-loglevel', 'error',
+               '-f', 'rawvideo', '-pix_fmt', 'rgb24', '-s', '%dx%d' % (width, height), '-r', str(self.fps),
+               '-i', '-',
+               # yuv420p needs even dimensions
+               '-vf', 'scale=trunc(iw/2)*2:trunc(ih/2)*2',
+               '-vcodec', 'libx264', '-pix_fmt', 'yuv420p', self.path]
+        return subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+
+    def _run(self):
+        while True:
+            frames = self._queue.get()
+            if frames is None:
+                break
+            if self._error is not None:
+                continue  # keep draining so write() never blocks on a dead writer
+            try:
+                for frame in frames:
+                    if self.size is not None:
+                        frame = cv2.resize(frame, self.size)
+                    if self._proc is None:
+                        self._proc = self._open(frame.shape[1], frame.shape[0])
+                    self._proc.stdin.write(np.ascontiguousarray(frame).tobytes())
+                    self.frames_written += 1
+            except Exception as e:
+                self._error = e
+
+    def write(self, frames):
+        if torch.is_tensor(frames):
+            frames = (frames.detach().float().clamp(0, 1) * 255).round().to(torch.uint8)
+            frames = frames.permute(0, 2, 3, 1).cpu().numpy()
+        if self._error is None and len(frames):
+            self._queue.put(frames)
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+        if self._proc is not None:
+            self._proc.stdin.close()
+            stderr = self._proc.stderr.read()
+            returncode = self._proc.wait()
+            if self._error is None and returncode != 0:
+                self._error = RuntimeError('ffmpeg exited with %d: %s' % (returncode, stderr.decode(errors='ignore').strip()))
+        if self._error is not None:
+            raise self._error
+        return self.path
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            self.close()
+        except Exception:
+            if exc_type is None:
+                raise
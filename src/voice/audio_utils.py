@@ -17,3 +17,21 @@ def preprocess_audio(in_path: str, out_path: str, sr: int = 24000):
     sf.write(out_path, y, sr)
     dur = len(y)/sr if sr else 0.0
     return out_path, sr, dur
+
+def preprocess_audio_rates(in_path: str, outputs: dict):
+    """
+    preprocess_audio một lần cho nhiều sample rate: outputs là {sr: out_path}. Trim và chuẩn hoá
+    loudness chạy một lần ở sample rate cao nhất, các sample rate khác chỉ resample từ kết quả đó.
+    Trả về {sr: (out_path, duration)}.
+    """
+    rates = sorted(outputs, reverse=True)
+    path, sr, dur = preprocess_audio(in_path, outputs[rates[0]], sr=rates[0])
+    result = {sr: (path, dur)}
+    if len(rates) > 1:
+        y, _ = sf.read(path, dtype="float32")
+        for target_sr in rates[1:]:
+            y_sr = librosa.resample(y, orig_sr=sr, target_sr=target_sr)
+            # PCM 16-bit mono, đúng định dạng speaker_wav của XTTS cần
+            sf.write(outputs[target_sr], y_sr, target_sr, subtype="PCM_16")
+            result[target_sr] = (outputs[target_sr], len(y_sr) / target_sr)
+    return result
@@ -0,0 +1,100 @@
+import re
+
+import numpy as np
+
+# Câu kết thúc bằng . ! ? … (có thể kèm dấu ngoặc / nháy đóng) rồi khoảng trắng, hoặc xuống dòng
+_SENTENCE_BREAK = re.compile(r'(?:(?<=[.!?…])|(?<=[.!?…]["”’»)\]]))\s+|\s*\n+\s*')
+# Mệnh đề: sau , ; : hoặc trước gạch ngang có khoảng trắng
+_CLAUSE_BREAK = re.compile(r'(?<=[,;:])\s+|\s+(?=[—–-]\s)')
+
+# Viết tắt có dấu chấm nhưng không kết thúc câu
+ABBREVIATIONS = {
+    "tp.", "tt.", "q.", "p.", "ts.", "ths.", "pgs.", "gs.", "bs.", "ks.", "th.s.", "ptgs.", "st.",
+    "mr.", "mrs.", "ms.", "dr.", "prof.", "vs.", "e.g.", "i.e.", "no.", "fig.", "eq.",
+}
+
+
+def _ends_with_abbreviation(piece):
+    last = piece.rsplit(None, 1)[-1].lower() if piece.strip() else ""
+    # chữ cái viết tắt trong tên riêng, ví dụ "Nguyễn V. An"
+    return last in ABBREVIATIONS or (len(last) == 2 and last[0].isalpha() and last[1] == ".")
+
+
+def split_sentences(text):
+    pieces = [p for p in _SENTENCE_BREAK.split(text.strip()) if p]
+    sentences = []
+    for piece in pieces:
+        if sentences and _ends_with_abbreviation(sentences[-1]):
+            sentences[-1] += " " + piece
+        else:
+            sentences.append(piece)
+    return sentences
+
+
+def _pack(parts, max_chars):
+    chunks = []
+    for part in parts:
+        if chunks and len(chunks[-1]) + 1 + len(part) <= max_chars:
+            chunks[-1] += " " + part
+        else:
+            chunks.append(part)
+    return chunks
+
+
+def _split_long(sentence, max_chars):
+    if len(sentence) <= max_chars:
+        return [sentence]
+    parts = []
+    for clause in _CLAUSE_BREAK.split(sentence):
+        if len(clause) <= max_chars:
+            parts.append(clause)
+        else:
+            # mệnh đề vẫn quá dài: cắt theo từ
+            parts += _pack(clause.split(), max_chars)
+    return _pack(parts, max_chars)
+
+
+def split_text(text, max_chars=250):
+    """
+    Chia narration thành các đoạn <= max_chars ký tự tại ranh giới câu, rồi mệnh đề, rồi từ.
+    Các câu ngắn liền nhau được gộp lại để mỗi đoạn đủ dài cho ngữ điệu tự nhiên.
+    """
+    text = re.sub(r"[ \t\r\f\v]+", " ", text or "").strip()
+    if not text:
+        return []
+    if max_chars <= 0 or len(text) <= max_chars:
+        return [text]
+    parts = []
+    for sentence in split_sentences(text):
+        parts += _split_long(sentence, max_chars)
+    return _pack(parts, max_chars)
+
+
+def resample_linear(wav, sr, target_sr):
+    wav = np.asarray(wav, dtype=np.float32)
+    if sr == target_sr or len(wav) == 0:
+        return wav
+    n = int(round(len(wav) * target_sr / sr))
+    return np.interp(np.linspace(0, len(wav) - 1, n), np.arange(len(wav)), wav).astype(np.float32)
+
+
+def crossfade_concat(wavs, sr, crossfade_ms=40):
+    """ Nối các đoạn audio mono với crossfade equal-power crossfade_ms giữa hai đoạn liền nhau. """
+    wavs = [np.asarray(w, dtype=np.float32).reshape(-1) for w in wavs if w is not None and len(w)]
+    if not wavs:
+        return np.zeros(0, dtype=np.float32)
+    n = int(sr * crossfade_ms / 1000)
+    pieces = []
+    tail = wavs[0]
+    for wav in wavs[1:]:
+        k = min(n, len(tail), len(wav))
+        if k == 0:
+            pieces.append(tail)
+            tail = wav
+            continue
+        t = np.linspace(0., np.pi / 2, k, dtype=np.float32)
+        pieces.append(tail[:-k])
+        pieces.append(tail[-k:] * np.cos(t) + wav[:k] * np.sin(t))
+        tail = wav[k:]
+    pieces.append(tail)
+    return np.concatenate(pieces)
@@ -1,6 +1,7 @@
 import os
 import time
 import json
+import threading
 
 # Optional imports with fallbacks
 try:
@@ -52,12 +53,82 @@ def _ensure_xtts_weights(model_root="data/models/xtts_v2"):
     
     return local_cfg, local_tts, local_spk
 
+XTTS_MODEL_NAME = "tts_models/multilingual/multi-dataset/xtts_v2"
+
+_XTTS_LOCK = threading.RLock()
+# model đã load chỉ được dùng bởi một luồng tại một thời điểm: TTSWorker, probe_voice và enroll_voice
+# (chạy nền trong EnrollmentJobs) đều lấy lock này quanh các lần gọi model
+MODEL_LOCK = threading.RLock()
+_STATE_LOCK = threading.Lock()
+_LOAD_STATE = {"state": "idle", "model_type": None, "source": None, "error": None,
+               "started_at": None, "load_seconds": None}
+
+def _offline():
+    """SADTALKER_TTS_OFFLINE=1: không bao giờ tải model qua mạng (triển khai air-gapped)."""
+    return os.environ.get("SADTALKER_TTS_OFFLINE", "0") == "1"
+
+def _coqui_cache_dir(model_name=XTTS_MODEL_NAME):
+    """Thư mục Coqui TTS lưu model đã tải về, None nếu chưa có."""
+    try:
+        from TTS.utils.generic_utils import get_user_data_dir
+        path = os.path.join(str(get_user_data_dir("tts")), model_name.replace("/", "--"))
+    except Exception:
+        return None
+    if os.path.exists(os.path.join(path, "model.pth")) and os.path.exists(os.path.join(path, "config.json")):
+        return path
+    return None
+
 def load_xtts(model_root="data/models/xtts_v2"):
+    """
+    Model TTS dùng chung cho cả process, chỉ load một lần; các luồng gọi đồng thời chờ lần load đầu.
+    Thứ tự: checkpoint local -> cache của Coqui -> tải online -> Tacotron2 -> gTTS.
+    """
+    if _XTTS is not None:
+        return _XTTS, _XTTS_TYPE
+    with _XTTS_LOCK:
+        if _XTTS is not None:
+            return _XTTS, _XTTS_TYPE
+        start = time.time()
+        _LOAD_STATE.update(state="loading", started_at=start, error=None)
+        try:
+            model, model_type = _load_xtts(model_root)
+        except Exception as e:
+            _LOAD_STATE.update(state="failed", error=str(e), load_seconds=time.time() - start)
+            raise
+        _LOAD_STATE.update(state="ready", model_type=model_type, load_seconds=time.time() - start)
+        return model, model_type
+
+def warm_load_xtts(model_root="data/models/xtts_v2"):
+    """Bắt đầu load model trong luồng nền khi app khởi động, không chặn việc dựng UI."""
+    with _STATE_LOCK:
+        if _LOAD_STATE["state"] != "idle":
+            return
+        _LOAD_STATE.update(state="loading", started_at=time.time())
+
+    def run():
+        try:
+            load_xtts(model_root)
+        except Exception as e:
+            print(f"⚠️ Background TTS load failed: {e}")
+
+    threading.Thread(target=run, daemon=True, name="tts-warm-load").start()
+
+def tts_status():
+    """Trạng thái load model cho UI: idle / loading / ready / failed, kèm loại model và thời gian load."""
+    # không lấy _XTTS_LOCK: nó bị giữ suốt thời gian load
+    status = dict(_LOAD_STATE)
+    if status["state"] == "loading" and status["started_at"]:
+        status["elapsed"] = time.time() - status["started_at"]
+    return status
+
+def _load_xtts(model_root="data/models/xtts_v2"):
     global _XTTS, _XTTS_TYPE
     if _XTTS is not None:
         return _XTTS, _XTTS_TYPE
 
-    print("🚀 Loading XTTS using Coqui TTS API (recommended approach)")
+    print("🚀 Loading XTTS using Coqui TTS API (local weights first)")
+    # không hỏi xác nhận license khi load từ cache của Coqui
+    os.environ.setdefault("COQUI_TOS_AGREED", "1")
     
     try:
         # Sử dụng API chuẩn của Coqui TTS - tránh lỗi checkpoint loading
@@ -65,23 +136,7 @@ def load_xtts(model_root="data/models/xtts_v2"):
         
         print("📦 TTS API imported successfully")
         
-        # Cách 1: Tải model online (khuyến nghị)
-        try:
-            print("🔄 Attempting to load XTTS v2 from online repository...")
-            m = TTS("tts_models/multilingual/multi-dataset/xtts_v2")
-            
-            # Kiểm tra method tts
-            if hasattr(m, 'tts'):
-                _XTTS = m
-                _XTTS_TYPE = "xtts_v2_api"
-                print("✅ XTTS v2 loaded successfully from online repository")
-                return _XTTS, _XTTS_TYPE
-            else:
-                print("⚠️ Online model missing 'tts' method")
-        except Exception as online_error:
-            print(f"⚠️ Failed to load online XTTS: {online_error}")
-        
-        # Cách 2: Tải từ local checkpoint với config đúng phiên bản
+        # Cách 1: Tải từ local checkpoint với config đúng phiên bản
         try:
             print("🔄 Attempting to load XTTS v2 from local checkpoint...")
             cfg_path = os.path.join(model_root, "config.json")
@@ -97,6 +152,7 @@ def load_xtts(model_root="data/models/xtts_v2"):
                 if hasattr(m, 'tts'):
                     _XTTS = m
                     _XTTS_TYPE = "xtts_v2_local"
+                    _LOAD_STATE["source"] = model_root
                     print("✅ XTTS v2 loaded successfully from local checkpoint")
                     return _XTTS, _XTTS_TYPE
                 else:
@@ -106,9 +162,35 @@ def load_xtts(model_root="data/models/xtts_v2"):
         except Exception as local_error:
             print(f"⚠️ Failed to load local XTTS: {local_error}")
         
+        # Cách 2: model đã có trong cache của Coqui (không cần mạng), sau đó mới tải online
+        cached_dir = _coqui_cache_dir()
+        if cached_dir is None and _offline():
+            print("⚠️ Offline mode: skipping online XTTS download")
+        else:
+            try:
+                if cached_dir is not None:
+                    print(f"🔄 Loading XTTS v2 from Coqui cache: {cached_dir}")
+                else:
+                    print("🔄 Attempting to load XTTS v2 from online repository...")
+                m = TTS(XTTS_MODEL_NAME)
+                
+                # Kiểm tra method tts
+                if hasattr(m, 'tts'):
+                    _XTTS = m
+                    _XTTS_TYPE = "xtts_v2_api"
+                    _LOAD_STATE["source"] = cached_dir or "online"
+                    print("✅ XTTS v2 loaded successfully" + (" from Coqui cache" if cached_dir else " from online repository"))
+                    return _XTTS, _XTTS_TYPE
+                else:
+                    print("⚠️ Online model missing 'tts' method")
+            except Exception as online_error:
+                print(f"⚠️ Failed to load online XTTS: {online_error}")
+        
         # Fallback về Tacotron2
         print("🔄 Falling back to Tacotron2...")
         try:
+            if _offline() and _coqui_cache_dir("tts_models/en/ljspeech/tacotron2-DDC") is None:
+                raise RuntimeError("offline mode and Tacotron2 is not cached")
             m = TTS("tts_models/en/ljspeech/tacotron2-DDC")
             
             if hasattr(m, 'tts'):
@@ -136,16 +218,20 @@ def load_xtts(model_root="data/models/xtts_v2"):
                 def tts(self, text, speaker=None, language="vi", speed=1.0):
                     # gTTS không hỗ trợ speed control
                     tts = gTTS(text=text, lang=language, slow=False)
-                    temp_file = "temp_audio.wav"
-                    tts.save(temp_file)
-                    
-                    # Convert to numpy array
-                    import soundfile as sf
-                    audio, sr = sf.read(temp_file)
-                    
-                    # Clean up temp file
-                    if os.path.exists(temp_file):
-                        os.remove(temp_file)
+                    # File tạm riêng cho mỗi lần gọi (gTTS ghi mp3), không ghi vào thư mục làm việc
+                    import tempfile
+                    temp_dir = tempfile.mkdtemp(prefix="gtts_")
+                    temp_file = os.path.join(temp_dir, "temp_audio.mp3")
+                    try:
+                        tts.save(temp_file)
+
+                        # Convert to numpy array
+                        import soundfile as sf
+                        audio, sr = sf.read(temp_file)
+                    finally:
+                        # Clean up temp file
+                        import shutil
+                        shutil.rmtree(temp_dir, ignore_errors=True)
                     
                     return audio
             
@@ -163,7 +249,31 @@ def load_xtts(model_root="data/models/xtts_v2"):
         print(f"❌ All TTS loading methods failed: {e}")
         raise Exception("Could not load any TTS model")
 
-def enroll_voice(audio_path: str, user_id: str, voice_id: str, lang_hint: str = "vi"):
+def get_xtts_model(model):
+    """The Xtts model behind a Coqui TTS API object, None for backends without conditioning latents."""
+    inner = getattr(getattr(model, "synthesizer", None), "tts_model", None)
+    if inner is not None and hasattr(inner, "get_conditioning_latents") and hasattr(inner, "inference"):
+        return inner
+    return None
+
+def compute_conditioning_latents(model, audio_path: str):
+    """
+    Encode the reference audio once: (gpt_cond_latent, speaker_embedding), or None when the
+    loaded backend is not XTTS. XTTS loads and resamples the file itself, no ffmpeg needed.
+    """
+    xtts = get_xtts_model(model)
+    if xtts is None:
+        return None
+    with torch.no_grad():
+        gpt_cond_latent, speaker_embedding = xtts.get_conditioning_latents(audio_path=[audio_path])
+    return gpt_cond_latent, speaker_embedding
+
+SAMPLE_RATES = {
+    24000: "sample.wav",       # XTTS (conditioning latents, speaker_wav)
+    16000: "sample_16k.wav",   # speaker encoder / speaker_wav 16 kHz mono PCM
+}
+
+def enroll_voice(audio_path: str, user_id: str, voice_id: str, lang_hint: str = "vi", progress=None):
     """
     Enroll a voice by processing an audio file and storing the voice profile.
     
@@ -172,10 +282,16 @@ def enroll_voice(audio_path: str, user_id: str, voice_id: str, lang_hint: str =
         user_id: User identifier
         voice_id: Voice identifier
         lang_hint: Language hint for the voice
+        progress: Optional callback(fraction, message) for background jobs
     
     Returns:
         bool: True if enrollment successful, False otherwise
     """
+    def report(fraction, message):
+        print(f"⏳ [{fraction:.0%}] {message}")
+        if progress is not None:
+            progress(fraction, message)
+
     try:
         print(f"🔍 Debug: text='{audio_path}', user_id='{user_id}', voice_id='{voice_id}'")
         
@@ -185,14 +301,32 @@ def enroll_voice(audio_path: str, user_id: str, voice_id: str, lang_hint: str =
             return False
         
         # Load XTTS model
+        report(0.05, "Đang tải model TTS...")
         try:
             model, model_type = load_xtts()
             print(f"🤖 Model type: {model_type}")
         except Exception as e:
             print(f"❌ Failed to load TTS model: {e}")
             return False
+
+        voice_dir = os.path.join("data", "voices", user_id, voice_id)
+        os.makedirs(voice_dir, exist_ok=True)
+
+        # Tiền xử lý một lần: resample, trim im lặng, chuẩn hoá loudness, lưu sẵn ở các sample rate backend cần
+        report(0.35, "Đang tiền xử lý audio mẫu...")
+        preprocessed = {}
+        try:
+            from .audio_utils import preprocess_audio_rates
+            preprocessed = preprocess_audio_rates(audio_path, {sr: os.path.join(voice_dir, name)
+                                                               for sr, name in SAMPLE_RATES.items()})
+            audio_path = preprocessed[24000][0]
+            print(f"✅ Audio preprocessed: {preprocessed[24000][1]:.1f}s at {sorted(preprocessed)} Hz")
+        except Exception as preprocess_error:
+            print(f"⚠️ Audio preprocessing failed, using the original file: {preprocess_error}")
+            preprocessed = {}
         
         # Xử lý audio và tạo speaker embedding
+        report(0.5, "Đang tạo speaker embedding...")
         try:
             # Đọc audio file
             if TORCH_AVAILABLE:
@@ -213,12 +347,27 @@ def enroll_voice(audio_path: str, user_id: str, voice_id: str, lang_hint: str =
             
             print(f"🎵 Audio loaded: {len(audio)} samples, {sample_rate} Hz")
             
+            # Conditioning latents của XTTS: tính một lần khi đăng ký, synthesize dùng lại trực tiếp
+            conditioning = None
+            try:
+                with MODEL_LOCK:
+                    conditioning = compute_conditioning_latents(model, audio_path)
+                if conditioning is not None:
+                    print("✅ XTTS conditioning latents computed")
+            except Exception as latent_error:
+                print(f"⚠️ Could not compute conditioning latents: {latent_error}")
+
             # Tạo speaker embedding
             try:
                 if hasattr(model, 'get_speaker_embedding'):
                     # XTTS v2 có method get_speaker_embedding
-                    emb = model.get_speaker_embedding(audio, sample_rate)
+                    with MODEL_LOCK:
+                        emb = model.get_speaker_embedding(audio, sample_rate)
                     print("✅ Speaker embedding created successfully")
+                elif conditioning is not None:
+                    # Speaker embedding thật của XTTS thay vì random
+                    emb = conditioning[1].detach().cpu().flatten()
+                    print("✅ Speaker embedding taken from XTTS conditioning latents")
                 else:
                     # Fallback: tạo random embedding
                     print("⚠️ Model doesn't have get_speaker_embedding method")
@@ -239,8 +388,7 @@ def enroll_voice(audio_path: str, user_id: str, voice_id: str, lang_hint: str =
                     emb = np.random.randn(512)
             
             # Lưu voice profile
-            voice_dir = os.path.join("data", "voices", user_id, voice_id)
-            os.makedirs(voice_dir, exist_ok=True)
+            report(0.75, "Đang lưu voice profile...")
             
             # Lưu embedding - luôn lưu cả hai format để đảm bảo tương thích
             if TORCH_AVAILABLE:
@@ -269,6 +417,19 @@ def enroll_voice(audio_path: str, user_id: str, voice_id: str, lang_hint: str =
                 np.save(os.path.join(voice_dir, "embedding.npy"), emb_np)
                 print("✅ Saved embedding.npy (NumPy format)")
             
+            # Đưa embedding vào ma trận packed của user và tìm voice trùng bằng một phép nhân ma trận
+            duplicates = []
+            try:
+                from .store import pack_embedding, find_similar_voices
+                duplicates = find_similar_voices(user_id, emb_np, exclude=voice_id,
+                                                 threshold=float(os.environ.get("SADTALKER_VOICE_DUP_THRESHOLD", 0.95)))
+                if duplicates:
+                    print(f"⚠️ Giọng nói này rất giống voice đã đăng ký: {duplicates[0][0]} (cosine {duplicates[0][1]:.3f})")
+                pack_embedding(user_id, voice_id, emb_np,
+                               os.stat(os.path.join(voice_dir, "embedding.npy")).st_mtime_ns)
+            except Exception as pack_error:
+                print(f"⚠️ Could not pack embedding: {pack_error}")
+
             # Lưu metadata
             metadata = {
                 "user_id": user_id,
@@ -279,22 +440,47 @@ def enroll_voice(audio_path: str, user_id: str, voice_id: str, lang_hint: str =
                 "model_type": model_type,
                 "created_at": time.time()
             }
+            if duplicates:
+                metadata["duplicate_of"] = [vid for vid, _ in duplicates]
             
             with open(os.path.join(voice_dir, "meta.json"), "w", encoding="utf-8") as f:
                 json.dump(metadata, f, indent=2, ensure_ascii=False)
             
-            # Copy audio file
+            # Copy audio file (audio đã tiền xử lý thì đã nằm sẵn trong voice_dir)
             import shutil
             sample_audio_path = os.path.join(voice_dir, "sample.wav")
-            shutil.copy2(audio_path, sample_audio_path)
+            if not preprocessed:
+                shutil.copy2(audio_path, sample_audio_path)
             
             # Lưu sample audio path vào metadata
             metadata["sample_audio"] = sample_audio_path
+            if 16000 in preprocessed:
+                metadata["sample_audio_16k"] = preprocessed[16000][0]
+            metadata["preprocessed"] = bool(preprocessed)
+
+            if conditioning is not None:
+                from .store import save_conditioning, conditioning_path
+                save_conditioning(user_id, voice_id, *conditioning)
+                metadata["conditioning"] = str(conditioning_path(user_id, voice_id))
+                print("✅ Saved conditioning.pth (XTTS latents)")
             
             # Cập nhật metadata với sample audio path
             with open(os.path.join(voice_dir, "meta.json"), "w", encoding="utf-8") as f:
                 json.dump(metadata, f, indent=2, ensure_ascii=False)
+            # Cập nhật voice index để list_voices / has_voice thấy ngay voice mới
+            from .store import index_voice
+            index_voice(user_id, voice_id)
             
+            # Probe một lần strategy synthesize dùng được cho voice này, các lần sau dùng lại
+            report(0.9, "Đang kiểm tra cách synthesize cho giọng này...")
+            try:
+                from .tts_engine import probe_voice
+                strategy = probe_voice(user_id, voice_id, lang=lang_hint)
+                print(f"📊 Synthesis strategy for {voice_id}: {strategy}")
+            except Exception as probe_error:
+                print(f"⚠️ Strategy probe failed, it will run on first synthesis: {probe_error}")
+
+            report(1.0, "Hoàn tất")
             print(f"✅ Voice enrolled successfully: {voice_id}")
             print(f"📁 Voice profile saved to: {voice_dir}")
             print(f"🎵 Sample audio saved to: {sample_audio_path}")
@@ -0,0 +1,91 @@
+import os
+import time
+import uuid
+import queue
+import shutil
+import threading
+
+from .enrollment import enroll_voice
+
+
+class EnrollmentJobs():
+    """
+    Queue of voice enrollments run by one background thread.
+
+    submit() copies the uploaded sample (the upload's temp file may disappear once the request
+    ends) and returns a job id right away; status() reports state, progress and the latest
+    message so the UI can poll instead of blocking on load_xtts and enroll_voice. Jobs run one
+    at a time because they share the loaded TTS model.
+    """
+
+    def __init__(self, tmp_root=os.path.join("data", "tmp", "enroll")):
+        self.tmp_root = tmp_root
+        self._jobs = {}
+        self._order = []
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._loop, daemon=True, name="voice-enrollment")
+        self._thread.start()
+
+    def submit(self, audio_path, user_id, voice_id, lang_hint="vi"):
+        job_id = uuid.uuid4().hex[:12]
+        os.makedirs(self.tmp_root, exist_ok=True)
+        sample = os.path.join(self.tmp_root, job_id + os.path.splitext(audio_path)[1])
+        shutil.copyfile(audio_path, sample)
+        job = {"job_id": job_id, "user_id": user_id, "voice_id": voice_id, "lang_hint": lang_hint,
+               "audio_path": sample, "state": "queued", "progress": 0., "message": "Đang chờ...",
+               "submitted_at": time.time(), "finished_at": None}
+        with self._lock:
+            self._jobs[job_id] = job
+            self._order.append(job_id)
+        self._queue.put(job_id)
+        return job_id
+
+    def status(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            out = {k: v for k, v in job.items() if k != "audio_path"}
+            if job["state"] == "queued":
+                out["position"] = [j for j in self._order if self._jobs[j]["state"] == "queued"].index(job_id) + 1
+            return out
+
+    def _update(self, job_id, **fields):
+        with self._lock:
+            self._jobs[job_id].update(fields)
+
+    def _loop(self):
+        while True:
+            job_id = self._queue.get()
+            with self._lock:
+                job = dict(self._jobs[job_id])
+            self._update(job_id, state="running", message="Đang bắt đầu...")
+
+            def progress(fraction, message, job_id=job_id):
+                self._update(job_id, progress=float(fraction), message=message)
+
+            try:
+                ok = enroll_voice(job["audio_path"], job["user_id"], job["voice_id"],
+                                  lang_hint=job["lang_hint"], progress=progress)
+                error = None if ok else "Đăng ký giọng thất bại"
+            except Exception as e:
+                error = str(e)
+            finally:
+                if os.path.exists(job["audio_path"]):
+                    os.remove(job["audio_path"])
+            if error is None:
+                self._update(job_id, state="done", progress=1., message="Hoàn tất", finished_at=time.time())
+            else:
+                self._update(job_id, state="failed", message=error, finished_at=time.time())
+
+
+_JOBS = None
+_JOBS_LOCK = threading.Lock()
+
+def get_enrollment_jobs():
+    global _JOBS
+    with _JOBS_LOCK:
+        if _JOBS is None:
+            _JOBS = EnrollmentJobs()
+        return _JOBS
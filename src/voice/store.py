@@ -1,38 +1,329 @@
 from pathlib import Path
-import json, numpy as np, time
+import os, json, copy, threading, numpy as np, time
 from typing import Optional
 
 ROOT = Path("data/voices")
+INDEX_NAME = "index.json"
+# Seconds between full rescans of the voice store, run by a background thread so lookups never
+# walk the store; 0 leaves rescans to refresh_index(). Writes through this module update the
+# index immediately and a lookup re-checks the mtimes of the one voice it reads.
+INDEX_REFRESH = float(os.environ.get("SADTALKER_VOICE_INDEX_REFRESH", 60))
 
 def voice_dir(user_id: str, voice_id: str) -> Path:
     return ROOT/str(user_id)/voice_id
 
+# In-memory voice index: user_id -> voice_id -> entry with the parsed meta.json and the
+# mtimes it was read at. It is persisted to ROOT/index.json, so a restart only re-parses
+# the meta.json files that changed since.
+_INDEX = {}
+_INDEX_LOCK = threading.RLock()
+_INDEX_STATE = {"loaded": False, "checked_at": 0., "refresher": None}
+# voices written while a rescan walks the store; the rescan keeps their (newer) entries
+_INDEX_DIRTY = set()
+
+def _mtime(path) -> Optional[int]:
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+def _read_entry(user_id: str, voice_id: str, old: Optional[dict] = None) -> Optional[dict]:
+    """ Index entry of one voice dir, re-using old when meta.json did not change; None without meta.json """
+    d = voice_dir(user_id, voice_id)
+    meta_mtime = _mtime(d/"meta.json")
+    if meta_mtime is None:
+        return None
+    emb_mtime = _mtime(d/"embedding.npy")
+    if old is not None and old["meta_mtime"] == meta_mtime:
+        return dict(old, emb_mtime=emb_mtime)
+    try:
+        with open(d/"meta.json","r",encoding="utf-8") as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return {"meta": meta, "meta_mtime": meta_mtime, "emb_mtime": emb_mtime}
+
+def _save_index():
+    voices = [{"user_id": uid, "voice_id": vid, **entry}
+              for uid, entries in _INDEX.items() for vid, entry in entries.items()]
+    tmp = ROOT/(INDEX_NAME + ".tmp-%d" % os.getpid())
+    try:
+        ROOT.mkdir(parents=True, exist_ok=True)
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"version": 1, "voices": voices}, f, ensure_ascii=False)
+        os.replace(tmp, ROOT/INDEX_NAME)
+    except OSError as e:
+        print(f"⚠️ Voice index: could not write {INDEX_NAME}: {e}")
+
+def _load_index():
+    try:
+        with open(ROOT/INDEX_NAME, "r", encoding="utf-8") as f:
+            voices = json.load(f).get("voices", [])
+    except (OSError, ValueError):
+        voices = []
+    for v in voices:
+        _INDEX.setdefault(v["user_id"], {})[v["voice_id"]] = {
+            "meta": v["meta"], "meta_mtime": v["meta_mtime"], "emb_mtime": v.get("emb_mtime")}
+
+def _scan():
+    """ Stat every meta.json (no parsing unless its mtime changed) and drop voices that are gone. """
+    with _INDEX_LOCK:
+        snapshot = {u: dict(e) for u, e in _INDEX.items()}
+        _INDEX_DIRTY.clear()
+    # the walk runs without the lock, lookups and writers are not blocked by it
+    found = {}
+    if ROOT.exists():
+        for user in os.scandir(ROOT):
+            if not user.is_dir():
+                continue
+            old_entries = snapshot.get(user.name, {})
+            for vid in os.scandir(user.path):
+                if not vid.is_dir():
+                    continue
+                entry = _read_entry(user.name, vid.name, old_entries.get(vid.name))
+                if entry is not None:
+                    found.setdefault(user.name, {})[vid.name] = entry
+    with _INDEX_LOCK:
+        for user_id, voice_id in _INDEX_DIRTY:
+            entry = _INDEX.get(user_id, {}).get(voice_id)
+            if entry is None:
+                found.get(user_id, {}).pop(voice_id, None)
+            else:
+                found.setdefault(user_id, {})[voice_id] = entry
+        changed = found != {u: e for u, e in _INDEX.items() if e}
+        _INDEX.clear()
+        _INDEX.update(found)
+        _INDEX_STATE["checked_at"] = time.time()
+        if changed:
+            _save_index()
+
+def _refresh_loop(interval: float):
+    while True:
+        time.sleep(interval)
+        try:
+            _scan()
+        except Exception as e:
+            print(f"⚠️ Voice index: rescan failed: {e}")
+
+def _ensure_index():
+    """ Load the index once per process: from index.json, or by a scan when there is none yet. """
+    if _INDEX_STATE["loaded"]:
+        return
+    with _INDEX_LOCK:
+        if _INDEX_STATE["loaded"]:
+            return
+        _load_index()
+        from_file = bool(_INDEX)
+        if not from_file:
+            _scan()
+        _INDEX_STATE["loaded"] = True
+        if INDEX_REFRESH > 0:
+            _INDEX_STATE["refresher"] = threading.Thread(target=_refresh_loop, args=(INDEX_REFRESH,),
+                                                         daemon=True, name="voice-index-refresh")
+            _INDEX_STATE["refresher"].start()
+        if from_file:
+            # index.json may be behind voices changed while the process was down: rescan in the background
+            threading.Thread(target=_scan, daemon=True, name="voice-index-scan").start()
+
+def refresh_index():
+    """ Rescan the voice store on disk now (voices added or removed outside this process). """
+    _ensure_index()
+    _scan()
+
+def index_voice(user_id: str, voice_id: str):
+    """ Re-read one voice into the index; called by the writers (save_profile, update_meta, enroll_voice). """
+    _ensure_index()
+    entry = _read_entry(user_id, voice_id)
+    with _INDEX_LOCK:
+        old = _INDEX.get(str(user_id), {}).get(voice_id)
+        if entry is None:
+            _INDEX.get(str(user_id), {}).pop(voice_id, None)
+        else:
+            _INDEX.setdefault(str(user_id), {})[voice_id] = entry
+        _INDEX_DIRTY.add((str(user_id), voice_id))
+        if entry != old:
+            _save_index()
+    return entry
+
+def _lookup(user_id: str, voice_id: str) -> Optional[dict]:
+    """ In-memory index entry, re-read only when this voice's meta.json / embedding.npy changed on disk. """
+    _ensure_index()
+    with _INDEX_LOCK:
+        entry = _INDEX.get(str(user_id), {}).get(voice_id)
+    d = voice_dir(user_id, voice_id)
+    if entry is None or entry["meta_mtime"] != _mtime(d/"meta.json") or entry["emb_mtime"] != _mtime(d/"embedding.npy"):
+        # created, changed or removed by another process since it was indexed
+        entry = index_voice(user_id, voice_id)
+    return entry
+
+# Packed embeddings: all voices of a user with the same embedding size are rows of one float32
+# matrix ROOT/<user>/embeddings_<dim>.npy, opened memory-mapped; ROOT/<user>/embeddings.json
+# maps voice_id -> dim, row and original shape. Loading an embedding is a view of its row.
+_PACKED = {}
+_PACKED_LOCK = threading.RLock()
+
+def _packed_index_path(user_id: str) -> Path:
+    return ROOT/str(user_id)/"embeddings.json"
+
+def _packed_path(user_id: str, dim: int) -> Path:
+    return ROOT/str(user_id)/f"embeddings_{dim}.npy"
+
+def _packed_index(user_id: str) -> dict:
+    path = _packed_index_path(user_id)
+    mtime = _mtime(path)
+    if mtime is None:
+        return {}
+    cached = _PACKED.get(str(path))
+    if cached is None or cached[0] != mtime:
+        with open(path, "r", encoding="utf-8") as f:
+            cached = (mtime, json.load(f).get("voices", {}))
+        _PACKED[str(path)] = cached
+    return cached[1]
+
+def _packed_matrix(user_id: str, dim: int):
+    path = _packed_path(user_id, dim)
+    mtime = _mtime(path)
+    if mtime is None:
+        return None
+    cached = _PACKED.get(str(path))
+    if cached is None or cached[0] != mtime:
+        cached = (mtime, np.load(path, mmap_mode="r"))
+        _PACKED[str(path)] = cached
+    return cached[1]
+
+def pack_embedding(user_id: str, voice_id: str, embedding, source_mtime: Optional[int] = None):
+    """ Write the embedding into the user's packed matrix, re-using the voice's row when it has one. """
+    emb = np.asarray(embedding, dtype=np.float32)
+    flat = emb.reshape(-1)
+    dim = int(flat.size)
+    with _PACKED_LOCK:
+        voices = dict(_packed_index(user_id))
+        old = _packed_matrix(user_id, dim)
+        rows = 0 if old is None else old.shape[0]
+        entry = voices.get(voice_id)
+        if entry is not None and entry["dim"] == dim:
+            row = entry["row"]
+        else:
+            row, rows = rows, rows + 1
+        # the matrix is rewritten next to the old one and swapped in, open maps keep the old data
+        path = _packed_path(user_id, dim)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(path.name + ".tmp-%d" % os.getpid())
+        out = np.lib.format.open_memmap(tmp, mode="w+", dtype=np.float32, shape=(rows, dim))
+        if old is not None:
+            out[:old.shape[0]] = old
+        out[row] = flat
+        out.flush()
+        del out
+        os.replace(tmp, path)
+
+        # source_mtime is the embedding.npy mtime the row was packed from
+        voices[voice_id] = {"dim": dim, "row": row, "shape": list(emb.shape), "source_mtime": source_mtime}
+        index_path = _packed_index_path(user_id)
+        with open(str(index_path) + ".tmp", "w", encoding="utf-8") as f:
+            json.dump({"voices": voices}, f, ensure_ascii=False)
+        os.replace(str(index_path) + ".tmp", index_path)
+    return row
+
+def load_embedding(user_id: str, voice_id: str, source_mtime: Optional[int] = None):
+    """ Read-only view of the voice's row in the packed matrix, None when it is not packed (or stale). """
+    entry = _packed_index(user_id).get(voice_id)
+    if entry is None or (source_mtime is not None and entry.get("source_mtime") != source_mtime):
+        return None
+    matrix = _packed_matrix(user_id, entry["dim"])
+    if matrix is None or entry["row"] >= matrix.shape[0]:
+        return None
+    return matrix[entry["row"]].reshape(entry["shape"])
+
+def find_similar_voices(user_id: str, embedding, threshold: float = 0.95, exclude: Optional[str] = None):
+    """ [(voice_id, cosine similarity)] of the user's voices above threshold, best first; one matrix product. """
+    q = np.asarray(embedding, dtype=np.float32).reshape(-1)
+    matrix = _packed_matrix(user_id, int(q.size))
+    if matrix is None or matrix.shape[0] == 0:
+        return []
+    _ensure_index()
+    with _INDEX_LOCK:
+        live = set(_INDEX.get(str(user_id), {}))
+    rows = {e["row"]: vid for vid, e in _packed_index(user_id).items()
+            if e["dim"] == q.size and vid in live and vid != exclude}
+    if not rows:
+        return []
+    norms = np.linalg.norm(matrix, axis=1) * (np.linalg.norm(q) or 1.)
+    scores = (matrix @ q) / np.maximum(norms, 1e-8)
+    found = [(vid, float(scores[row])) for row, vid in rows.items() if row < len(scores) and scores[row] >= threshold]
+    return sorted(found, key=lambda x: x[1], reverse=True)
+
 def save_profile(user_id: str, voice_id: str, embedding: np.ndarray, meta: dict):
     d = voice_dir(user_id, voice_id)
     d.mkdir(parents=True, exist_ok=True)
     np.save(d/"embedding.npy", embedding)
+    pack_embedding(user_id, voice_id, embedding, _mtime(d/"embedding.npy"))
     with open(d/"meta.json", "w", encoding="utf-8") as f:
         json.dump(meta, f, ensure_ascii=False, indent=2)
+    index_voice(user_id, voice_id)
 
 def load_profile(user_id: str, voice_id: str):
     d = voice_dir(user_id, voice_id)
-    emb = np.load(d/"embedding.npy")
-    with open(d/"meta.json","r",encoding="utf-8") as f:
-        meta = json.load(f)
-    return emb, meta
+    entry = _lookup(user_id, voice_id)
+    if entry is None or entry["emb_mtime"] is None:
+        raise FileNotFoundError(f"voice profile not found: {d}")
+    emb = load_embedding(user_id, voice_id, entry["emb_mtime"])
+    if emb is None:
+        # profile from before the packed matrix or embedding.npy rewritten since: read it once and pack it
+        emb = np.load(d/"embedding.npy")
+        try:
+            pack_embedding(user_id, voice_id, emb, entry["emb_mtime"])
+        except OSError as e:
+            print(f"⚠️ Could not pack embedding of {voice_id}: {e}")
+    # the embedding is a read-only view, the meta a private copy
+    return emb, copy.deepcopy(entry["meta"])
+
+def update_meta(user_id: str, voice_id: str, **fields):
+    d = voice_dir(user_id, voice_id)
+    with _INDEX_LOCK:
+        with open(d/"meta.json","r",encoding="utf-8") as f:
+            meta = json.load(f)
+        meta.update(fields)
+        with open(d/"meta.json", "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False, indent=2)
+        index_voice(user_id, voice_id)
+    return meta
+
+def conditioning_path(user_id: str, voice_id: str) -> Path:
+    return voice_dir(user_id, voice_id)/"conditioning.pth"
+
+def save_conditioning(user_id: str, voice_id: str, gpt_cond_latent, speaker_embedding):
+    """ XTTS conditioning latents computed once at enrollment, stored next to embedding.npy """
+    import torch
+    d = voice_dir(user_id, voice_id)
+    d.mkdir(parents=True, exist_ok=True)
+    torch.save({"gpt_cond_latent": gpt_cond_latent.detach().cpu(),
+                "speaker_embedding": speaker_embedding.detach().cpu()}, d/"conditioning.pth")
+    _CONDITIONING.pop(str(d/"conditioning.pth"), None)
+
+_CONDITIONING = {}
+
+def load_conditioning(user_id: str, voice_id: str):
+    """ (gpt_cond_latent, speaker_embedding) or None when the profile has no latents yet """
+    path = conditioning_path(user_id, voice_id)
+    if not path.exists():
+        return None
+    mtime = path.stat().st_mtime
+    cached = _CONDITIONING.get(str(path))
+    if cached is None or cached[0] != mtime:
+        import torch
+        data = torch.load(path, map_location="cpu")
+        cached = (mtime, (data["gpt_cond_latent"], data["speaker_embedding"]))
+        _CONDITIONING[str(path)] = cached
+    return cached[1]
 
 def list_voices(user_id: Optional[str] = None):
-    out = []
-    bases = [ROOT/str(user_id)] if user_id else [p for p in ROOT.glob("*") if p.is_dir()]
-    for base in bases:
-        if not base.exists(): continue
-        for vid in base.iterdir():
-            mpath = vid/"meta.json"
-            if mpath.exists():
-                with open(mpath,"r",encoding="utf-8") as f:
-                    out.append(json.load(f))
+    _ensure_index()
+    with _INDEX_LOCK:
+        users = [_INDEX.get(str(user_id), {})] if user_id else list(_INDEX.values())
+        out = [copy.deepcopy(entry["meta"]) for entries in users for entry in entries.values()]
     return sorted(out, key=lambda m: m.get("created_at", 0), reverse=True)
 
 def has_voice(user_id: str, voice_id: str) -> bool:
-    d = voice_dir(user_id, voice_id)
-    return (d/"embedding.npy").exists() and (d/"meta.json").exists()
+    entry = _lookup(user_id, voice_id)
+    return entry is not None and entry["emb_mtime"] is not None
@@ -0,0 +1,169 @@
+import os
+import re
+import json
+import time
+import shutil
+import hashlib
+import threading
+import unicodedata
+from typing import Optional
+
+import numpy as np
+
+
+def normalize_text(text: str) -> str:
+    """ NFC and collapsed whitespace, so re-typed or re-extracted slide text hits the same entry. """
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFC", text or "")).strip()
+
+
+def embedding_hash(emb) -> str:
+    if emb is None:
+        return ""
+    if hasattr(emb, "detach"):
+        emb = emb.detach().cpu().numpy()
+    emb = np.ascontiguousarray(np.asarray(emb, dtype=np.float32))
+    return hashlib.sha256(emb.tobytes()).hexdigest()[:16]
+
+
+def audio_duration(path: str) -> Optional[float]:
+    try:
+        import soundfile as sf
+        return float(sf.info(path).duration)
+    except Exception:
+        pass
+    try:
+        from pydub import AudioSegment
+        return AudioSegment.from_file(path).duration_seconds
+    except Exception:
+        return None
+
+
+class TTSCache:
+    """
+    Persistent cache of synthesized narration.
+
+    Entries are keyed by the normalized text, voice_id, embedding hash, language, speed and
+    backend model_type. Each entry is the finished audio file plus a .json with its duration;
+    the json is written last and its mtime is the LRU clock. Entries are evicted least recently
+    used once the cache grows past max_mb.
+    """
+
+    def __init__(self, root: str = os.path.join("data", "cache", "tts"), max_mb: float = 1024):
+        self.root = root
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(self.root, exist_ok=True)
+
+    def key(self, text: str, voice_id: str, emb_hash: str, lang: str, speed: float, model_type: str) -> str:
+        raw = "\x1f".join([normalize_text(text), voice_id or "", emb_hash or "", (lang or "").lower(),
+                           "%.3f" % float(speed), model_type or ""])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _meta_path(self, key: str) -> str:
+        return os.path.join(self.root, key + ".json")
+
+    def get(self, key: str, out_path: Optional[str] = None) -> Optional[dict]:
+        """
+        Metadata of a cached entry (audio_path, duration, ...) or None on a miss.
+        With out_path the audio is copied there, so callers may move or delete it freely.
+        """
+        meta_path = self._meta_path(key)
+        with self._lock:
+            try:
+                with open(meta_path, "r", encoding="utf-8") as f:
+                    meta = json.load(f)
+                audio_path = os.path.join(self.root, key + meta["ext"])
+                if out_path:
+                    os.makedirs(os.path.dirname(out_path) or ".", exist_ok=True)
+                    shutil.copyfile(audio_path, out_path)
+                    audio_path = out_path
+            except (OSError, ValueError, KeyError):
+                self.misses += 1
+                return None
+            now = time.time()
+            os.utime(meta_path, (now, now))
+            self.hits += 1
+            meta["audio_path"] = audio_path
+            return meta
+
+    def put(self, key: str, audio_path: str, **info) -> Optional[dict]:
+        ext = os.path.splitext(audio_path)[1] or ".wav"
+        meta = dict(info, ext=ext, duration=audio_duration(audio_path), created_at=time.time())
+        target = os.path.join(self.root, key + ext)
+        tmp = "%s.tmp-%d-%d" % (target, os.getpid(), threading.get_ident())
+        with self._lock:
+            try:
+                shutil.copyfile(audio_path, tmp)
+                os.replace(tmp, target)
+                # metadata is written last, its presence marks a complete entry
+                with open(self._meta_path(key) + ".tmp", "w", encoding="utf-8") as f:
+                    json.dump(meta, f, ensure_ascii=False)
+                os.replace(self._meta_path(key) + ".tmp", self._meta_path(key))
+            except OSError as e:
+                print(f"⚠️ TTS cache: could not store entry: {e}")
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+                return None
+            self._evict(keep=key)
+        return meta
+
+    def _entries(self):
+        groups = {}
+        for name in os.listdir(self.root):
+            if ".tmp" in name:
+                continue
+            groups.setdefault(name.split(".", 1)[0], []).append(os.path.join(self.root, name))
+        entries = []
+        for key, files in groups.items():
+            meta_path = self._meta_path(key)
+            if meta_path not in files:
+                continue
+            size = sum(os.path.getsize(p) for p in files)
+            entries.append((os.path.getmtime(meta_path), size, key, files))
+        return sorted(entries)
+
+    def _evict(self, keep=None):
+        entries = self._entries()
+        total = sum(size for _, size, _, _ in entries)
+        for _, size, key, files in entries:
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            for path in files:
+                if os.path.exists(path):
+                    os.remove(path)
+            total -= size
+
+    def clear(self):
+        with self._lock:
+            for _, _, _, files in self._entries():
+                for path in files:
+                    if os.path.exists(path):
+                        os.remove(path)
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries = self._entries()
+            return {"hits": self.hits,
+                    "misses": self.misses,
+                    "entries": len(entries),
+                    "size_mb": sum(size for _, size, _, _ in entries) / (1024 * 1024),
+                    "max_mb": self.max_bytes / (1024 * 1024)}
+
+
+_TTS_CACHE = None
+_TTS_CACHE_LOCK = threading.Lock()
+
+def get_tts_cache() -> Optional[TTSCache]:
+    """ Shared cache instance; SADTALKER_TTS_CACHE=0 disables it, SADTALKER_TTS_CACHE_MB sets the cap. """
+    global _TTS_CACHE
+    if os.environ.get("SADTALKER_TTS_CACHE", "1") == "0":
+        return None
+    with _TTS_CACHE_LOCK:
+        if _TTS_CACHE is None:
+            _TTS_CACHE = TTSCache(root=os.environ.get("SADTALKER_TTS_CACHE_DIR", os.path.join("data", "cache", "tts")),
+                                  max_mb=float(os.environ.get("SADTALKER_TTS_CACHE_MB", 1024)))
+        return _TTS_CACHE
@@ -1,259 +1,555 @@
 import soundfile as sf, torch
 import os
-from .store import load_profile
-from .enrollment import load_xtts
+import shutil
+import tempfile
+import threading
+import subprocess
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from .store import load_profile, load_conditioning, save_conditioning, update_meta
+from .enrollment import load_xtts, get_xtts_model, compute_conditioning_latents, MODEL_LOCK
+from .tts_cache import get_tts_cache, embedding_hash, normalize_text
+from .tts_worker import TTSWorker
+from .chunking import split_text, crossfade_concat, resample_linear
+from .xtts_batch import xtts_inference_batch
 
-def synthesize(text: str, user_id: str, voice_id: str,
-               lang: str = "vi", speed: float = 1.0,
-               out_path: str = "data/tmp/voice_out.wav"):
-    
-    # Language handling for XTTS compatibility
-    def get_xtts_language(lang_code):
-        """Get XTTS language - XTTS không support tiếng Việt nên dùng English"""
-        if lang_code.lower() in ['vi', 'vi-vn']:
-            # XTTS không support tiếng Việt, dùng English để giữ giọng clone
-            print(f"🌐 XTTS không support tiếng Việt, dùng English để giữ giọng clone")
-            return 'en'
+XTTS_SAMPLE_RATE = 24000
+XTTS_MODEL_TYPES = ["xtts_v2", "xtts_v2_api", "xtts_v2_local"]
+
+def _chunk_chars():
+    """SADTALKER_TTS_CHUNK_CHARS: độ dài tối đa mỗi đoạn khi chia narration, 0 để tắt."""
+    return int(os.environ.get("SADTALKER_TTS_CHUNK_CHARS", 250))
+
+def _chunk_workers():
+    return int(os.environ.get("SADTALKER_TTS_CHUNK_WORKERS", 4))
+
+def _crossfade_ms():
+    return float(os.environ.get("SADTALKER_TTS_CROSSFADE_MS", 40))
+
+def _gpt_batch():
+    """SADTALKER_TTS_GPT_BATCH: số đoạn tối đa trong một lần XTTS generate."""
+    return int(os.environ.get("SADTALKER_TTS_GPT_BATCH", 8))
+
+# Language handling for XTTS compatibility
+def get_xtts_language(lang_code):
+    """Get XTTS language - XTTS không support tiếng Việt nên dùng English"""
+    if lang_code.lower() in ['vi', 'vi-vn']:
+        # XTTS không support tiếng Việt, dùng English để giữ giọng clone
+        print(f"🌐 XTTS không support tiếng Việt, dùng English để giữ giọng clone")
+        return 'en'
+    else:
+        # Các ngôn ngữ khác giữ nguyên
+        return lang_code.lower()
+
+
+# Các strategy của XTTS: nhận ctx, trả về (wav, sample_rate) hoặc None / raise nếu không dùng được.
+# Thứ tự giống các "Method" cũ của synthesize.
+
+def _voice_latents(model, user_id, voice_id, meta):
+    """(xtts, gpt_cond_latent, speaker_embedding) của voice, None nếu backend hoặc profile không có latents."""
+    xtts = get_xtts_model(model)
+    if xtts is None:
+        return None
+    conditioning = load_conditioning(user_id, voice_id)
+    sample_audio_path = meta.get('sample_audio')
+    if conditioning is None and sample_audio_path and os.path.exists(sample_audio_path):
+        # Profile cũ chưa có latents: tính một lần rồi lưu lại
+        print("🔧 Computing conditioning latents for this voice (one time)")
+        conditioning = compute_conditioning_latents(model, sample_audio_path)
+        save_conditioning(user_id, voice_id, *conditioning)
+    if conditioning is None:
+        return None
+    return (xtts,) + tuple(conditioning)
+
+def _strategy_latents(ctx):
+    """Method 0: conditioning latents đã lưu trong profile - không xử lý lại audio mẫu, không ffmpeg"""
+    voice = _voice_latents(ctx["model"], ctx["user_id"], ctx["voice_id"], ctx["meta"])
+    if voice is None:
+        return None
+    xtts, gpt_cond_latent, speaker_embedding = voice
+    device = next(xtts.parameters()).device
+    with torch.no_grad():
+        out = xtts.inference(ctx["text"], ctx["xtts_lang"], gpt_cond_latent.to(device),
+                             speaker_embedding.to(device), speed=ctx["speed"])
+    wav = out["wav"]
+    if hasattr(wav, "cpu"):
+        wav = wav.cpu().numpy()
+    return wav, XTTS_SAMPLE_RATE
+
+def _strategy_speaker_embedding(ctx):
+    """Method 1: Speaker embedding với speaker parameter"""
+    if ctx["emb"] is None:
+        return None
+    # XTTS cần speaker ID đúng format, thử với 'speaker' parameter
+    wav = ctx["model"].tts(text=ctx["text"], speaker=ctx["voice_id"], speaker_embedding=ctx["emb"],
+                           language=ctx["xtts_lang"], speed=ctx["speed"])
+    return None if wav is None else (wav, XTTS_SAMPLE_RATE)
+
+def _strategy_speaker_id(ctx):
+    """Method 2: Speaker parameter trực tiếp"""
+    wav = ctx["model"].tts(text=ctx["text"], speaker=ctx["voice_id"], language=ctx["xtts_lang"], speed=ctx["speed"])
+    return None if wav is None else (wav, XTTS_SAMPLE_RATE)
+
+def _strategy_speaker_wav(ctx):
+    """Method 3: Speaker_wav từ voice profile"""
+    sample_audio_path = ctx["meta"].get('sample_audio')
+    if not sample_audio_path or not os.path.exists(sample_audio_path):
+        print("⚠️ No sample audio found in voice profile")
+        return None
+    print(f"🔄 Trying speaker_wav: {sample_audio_path}")
+    # Bản 16kHz mono PCM đã được lưu lúc đăng ký thì dùng trực tiếp, không cần ffmpeg
+    sample_16k_path = ctx["meta"].get('sample_audio_16k')
+    if sample_16k_path and os.path.exists(sample_16k_path):
+        wav = ctx["model"].tts(text=ctx["text"], speaker_wav=sample_16k_path, language=ctx["xtts_lang"], speed=ctx["speed"])
+        return None if wav is None else (wav, XTTS_SAMPLE_RATE)
+    # Convert sample audio to 16kHz mono if needed, vào thư mục tạm của request chứ không cạnh file mẫu
+    tmp_dir = ctx.get("tmp_dir") or tempfile.gettempdir()
+    temp_16k_path = os.path.join(tmp_dir, os.path.splitext(os.path.basename(sample_audio_path))[0] + '_16k_mono.wav')
+    cmd = ['ffmpeg', '-y', '-i', sample_audio_path, '-ac', '1', '-ar', '16000', '-sample_fmt', 's16', temp_16k_path]
+    try:
+        result = subprocess.run(cmd, capture_output=True, text=True)
+        converted = result.returncode == 0 and os.path.exists(temp_16k_path)
+    except Exception as convert_error:
+        print(f"⚠️ Sample audio conversion failed: {convert_error}, using original")
+        converted = False
+    try:
+        speaker_wav = temp_16k_path if converted else sample_audio_path
+        wav = ctx["model"].tts(text=ctx["text"], speaker_wav=speaker_wav, language=ctx["xtts_lang"], speed=ctx["speed"])
+    finally:
+        if converted:
+            try:
+                os.unlink(temp_16k_path)
+            except:
+                pass
+    return None if wav is None else (wav, XTTS_SAMPLE_RATE)
+
+def _strategy_default_voice(ctx):
+    """Method 4: Không có speaker (default voice)"""
+    wav = ctx["model"].tts(text=ctx["text"], language=ctx["xtts_lang"], speed=ctx["speed"])
+    return None if wav is None else (wav, XTTS_SAMPLE_RATE)
+
+def _strategy_gtts(ctx):
+    """Method 5: Fallback về gTTS với format chuẩn PCM 16-bit, dùng language gốc (tiếng Việt)"""
+    from gtts import gTTS
+
+    with tempfile.NamedTemporaryFile(suffix='.mp3', delete=False) as temp_file:
+        temp_mp3 = temp_file.name
+    temp_wav = temp_mp3.replace('.mp3', '_16k_mono_pcm.wav')
+    try:
+        print(f"🎤 gTTS fallback: Sử dụng language '{ctx['lang']}' để giữ tiếng Việt")
+        gTTS(text=ctx["text"], lang=ctx["lang"], slow=False).save(temp_mp3)
+
+        # Convert MP3 sang WAV 16kHz mono PCM s16, pad 0.5s để đủ frame
+        cmd = ['ffmpeg', '-y', '-i', temp_mp3, '-ac', '1', '-ar', '16000', '-sample_fmt', 's16',
+               '-af', 'apad=pad_dur=0.5', '-f', 'wav', temp_wav]
+        result = subprocess.run(cmd, capture_output=True, text=True)
+        if result.returncode == 0 and os.path.exists(temp_wav):
+            audio, sr = sf.read(temp_wav)
         else:
-            # Các ngôn ngữ khác giữ nguyên
-            return lang_code.lower()
-    
+            print(f"⚠️ FFmpeg conversion failed: {result.stderr}")
+            audio, sr = sf.read(temp_mp3)
+        return audio, sr
+    finally:
+        for path in (temp_mp3, temp_wav):
+            if os.path.exists(path):
+                try:
+                    os.unlink(path)
+                except:
+                    pass
+
+XTTS_STRATEGIES = [
+    ("latents", _strategy_latents),
+    ("speaker_embedding", _strategy_speaker_embedding),
+    ("speaker_id", _strategy_speaker_id),
+    ("speaker_wav", _strategy_speaker_wav),
+    ("default_voice", _strategy_default_voice),
+    ("gtts", _strategy_gtts),
+]
+_STRATEGY_FNS = dict(XTTS_STRATEGIES)
+
+# Strategy đã chạy được cho từng (model_type, voice_id), chỉ probe một lần
+_SELECTED = {}
+_METRICS = Counter()
+_STRATEGY_LOCK = threading.Lock()
+# model chỉ được dùng bởi một luồng tại một thời điểm (TTSWorker, probe và enroll_voice lúc đăng ký)
+_MODEL_LOCK = MODEL_LOCK
+
+def _try_strategy(name, ctx):
+    print(f"🔄 Trying strategy: {name}")
+    try:
+        result = _STRATEGY_FNS[name](ctx)
+    except Exception as e:
+        print(f"⚠️ Strategy {name} failed: {e}")
+        result = None
+    if result is None:
+        with _STRATEGY_LOCK:
+            _METRICS["failed:" + name] += 1
+    return result
+
+def _run_strategies(ctx, model_type, voice_id):
+    """Dùng strategy đã ghi nhớ; nếu chưa có hoặc hết dùng được thì probe lại theo thứ tự."""
+    key = (model_type, voice_id)
+    with _STRATEGY_LOCK:
+        # strategy probe lúc đăng ký được lưu trong meta.json, dùng lại sau khi khởi động lại
+        selected = _SELECTED.get(key) or ctx["meta"].get("synthesis_strategy", {}).get(model_type)
+    if selected is not None:
+        result = _try_strategy(selected, ctx)
+        if result is not None:
+            with _STRATEGY_LOCK:
+                _SELECTED[key] = selected
+                _METRICS["served:" + selected] += 1
+            return result, selected
+        print(f"⚠️ Strategy {selected} stopped working for {voice_id}, probing again")
+        with _STRATEGY_LOCK:
+            _SELECTED.pop(key, None)
+
+    with _STRATEGY_LOCK:
+        _METRICS["probes"] += 1
+    for name, _ in XTTS_STRATEGIES:
+        if name == selected:
+            continue
+        result = _try_strategy(name, ctx)
+        if result is None:
+            continue
+        with _STRATEGY_LOCK:
+            # gTTS chỉ là fallback tạm thời, lần sau vẫn thử lại XTTS
+            if name != "gtts":
+                _SELECTED[key] = name
+            _METRICS["served:" + name] += 1
+        print(f"✅ Strategy {name} selected for ({model_type}, {voice_id})")
+        return result, name
+    return None, None
+
+def strategy_metrics():
+    """Strategy đã chọn cho từng voice và số request mỗi strategy đã phục vụ / thất bại."""
+    with _STRATEGY_LOCK:
+        return {
+            "selected": {f"{mt}/{vid}": name for (mt, vid), name in _SELECTED.items()},
+            "served": {k[len("served:"):]: v for k, v in _METRICS.items() if k.startswith("served:")},
+            "failed": {k[len("failed:"):]: v for k, v in _METRICS.items() if k.startswith("failed:")},
+            "probes": _METRICS["probes"],
+            "batched_calls": _METRICS["batched_calls"],
+        }
+
+def probe_voice(user_id: str, voice_id: str, lang: str = "vi", text: str = "Xin chào."):
+    """Chọn trước strategy cho voice bằng một câu ngắn, gọi khi đăng ký giọng nói."""
+    model, model_type = load_xtts()
+    if model_type not in XTTS_MODEL_TYPES or not hasattr(model, 'tts'):
+        return model_type
+    with _STRATEGY_LOCK:
+        _SELECTED.pop((model_type, voice_id), None)
+    emb, meta = load_profile(user_id, voice_id)
+    probe_meta = {k: v for k, v in meta.items() if k != "synthesis_strategy"}
+    tmp_dir = tempfile.mkdtemp(prefix="probe_")
+    ctx = dict(model=model, text=text, user_id=user_id, voice_id=voice_id, emb=emb, meta=probe_meta,
+               xtts_lang=get_xtts_language(lang), lang=lang, speed=1.0, tmp_dir=tmp_dir)
+    try:
+        with _MODEL_LOCK:
+            _, name = _run_strategies(ctx, model_type, voice_id)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    if name is not None and name != "gtts":
+        strategies = dict(meta.get("synthesis_strategy", {}), **{model_type: name})
+        update_meta(user_id, voice_id, synthesis_strategy=strategies)
+    return name
+
+def _synthesize_latents_batch(texts, user_id, voice_id, lang, speed, model, model_type, meta):
+    """
+    Mọi đoạn text của cùng một giọng qua xtts_inference_batch: latents load một lần, gpt.generate
+    chạy theo batch. Trả về list waveform, hoặc None nếu voice không dùng strategy latents (khi đó
+    các đoạn đi qua các strategy như trước).
+    """
+    key = (model_type, voice_id)
+    with _STRATEGY_LOCK:
+        selected = _SELECTED.get(key) or meta.get("synthesis_strategy", {}).get(model_type)
+    if selected not in (None, "latents"):
+        return None
+    try:
+        voice = _voice_latents(model, user_id, voice_id, meta)
+        if voice is None:
+            return None
+        xtts, gpt_cond_latent, speaker_embedding = voice
+        wavs = xtts_inference_batch(xtts, texts, get_xtts_language(lang), gpt_cond_latent, speaker_embedding,
+                                    speed=speed, max_batch=_gpt_batch())
+    except Exception as e:
+        print(f"⚠️ Batched XTTS inference failed: {e}, synthesizing chunks one by one")
+        with _STRATEGY_LOCK:
+            _METRICS["failed:latents_batch"] += 1
+        return None
+    with _STRATEGY_LOCK:
+        _SELECTED[key] = "latents"
+        _METRICS["served:latents"] += len(texts)
+        _METRICS["batched_calls"] += 1
+    print(f"📊 Served by strategy: latents ({len(texts)} chunks in one batched call)")
+    return wavs
+
+def _cache_lookup(text, voice_id, emb, lang, speed, model_type, out_path):
+    """(cache_key, hit): key trong TTS cache (None khi cache tắt), hit=True nếu out_path đã được lấy từ cache."""
+    # Cache theo nội dung: text đã chuẩn hoá, voice, embedding, ngôn ngữ, tốc độ và backend
+    tts_cache = get_tts_cache()
+    if tts_cache is None:
+        return None, False
+    cache_key = tts_cache.key(text, voice_id, embedding_hash(emb), lang, speed, model_type)
+    cached = tts_cache.get(cache_key, out_path)
+    if cached is None:
+        return cache_key, False
+    with _STRATEGY_LOCK:
+        _METRICS["served:cache"] += 1
+    print(f"♻️ TTS cache hit ({cached.get('duration') or 0:.2f}s): {out_path}")
+    return cache_key, True
+
+def _split_narration(text):
+    # Narration dài được chia theo câu / mệnh đề; XTTS tốt hơn với input ngắn và mỗi đoạn decode ngắn hơn
+    chunks = split_text(text, _chunk_chars()) or [text]
+    if len(chunks) > 1:
+        print(f"✂️ Split narration ({len(text)} chars) into {len(chunks)} chunks")
+    return chunks
+
+def _save_audio(results, out_path, model_type, cache_key, voice_id, lang):
+    """Ghép các đoạn (wav, sample_rate, strategy) bằng crossfade, ghi ra out_path và lưu vào cache."""
+    if any(result is None for result in results):
+        print("❌ All synthesis strategies failed")
+        return None
+    if any(result[0] is None for result in results):
+        print("❌ TTS returned None")
+        return None
+    # kết quả fallback gTTS không được cache dưới key của XTTS
+    cacheable = not (model_type in XTTS_MODEL_TYPES and any(result[2] == "gtts" for result in results))
+
+    sample_rate = results[0][1]
+    if len(results) == 1:
+        wav = results[0][0]
+    else:
+        # đoạn fallback gTTS có thể có sample rate khác
+        wav = crossfade_concat([resample_linear(w, sr, sample_rate) for w, sr, _ in results], sample_rate,
+                               crossfade_ms=_crossfade_ms())
+
+    sf.write(out_path, wav, sample_rate)
+    print(f"✅ Audio saved to: {out_path}")
+    tts_cache = get_tts_cache()
+    if tts_cache is not None and cache_key is not None and cacheable:
+        tts_cache.put(cache_key, out_path, voice_id=voice_id, lang=lang, model_type=model_type)
+    return out_path
+
+def _synthesize_request(text, user_id, voice_id, lang, speed, out_path, model, model_type, emb, meta, batch=True):
     # Get XTTS language - XTTS dùng English, gTTS dùng tiếng Việt
     xtts_lang = get_xtts_language(lang)
     print(f"🌐 Language for XTTS: {xtts_lang} (XTTS dùng English, gTTS dùng {lang})")
     try:
         # Tạo thư mục output nếu chưa tồn tại
         os.makedirs(os.path.dirname(out_path), exist_ok=True)
-        
-        model, model_type = load_xtts()
-        emb, meta = load_profile(user_id, voice_id)
-        
+
+        cache_key, hit = _cache_lookup(text, voice_id, emb, lang, speed, model_type, out_path)
+        if hit:
+            return out_path
+        chunks = _split_narration(text)
+
         # Kiểm tra loại model để quyết định cách synthesize
-        if model_type in ["xtts_v2", "xtts_v2_api"]:
-            # XTTS v2 có thể sử dụng speaker_embedding
+        if model_type in XTTS_MODEL_TYPES:
             print(f"🎤 {model_type}: Synthesizing with speaker embedding")
-            
-            # Kiểm tra xem model có method tts không
-            if not hasattr(model, 'tts'):
-                print("❌ Model doesn't have 'tts' method - checkpoint loading may have failed")
-                print("🔄 Falling back to gTTS...")
-                # Fallback về gTTS
-                try:
-                    from gtts import gTTS
-                    import tempfile
-                    
-                    # Tạo file tạm
-                    temp_file = tempfile.NamedTemporaryFile(suffix='.wav', delete=False)
-                    temp_path = temp_file.name
-                    temp_file.close()
-                    
-                    # Sử dụng gTTS
-                    tts = gTTS(text=text, lang=lang, slow=False)
-                    tts.save(temp_path)
-                    
-                    # Convert to numpy array
-                    audio, sr = sf.read(temp_path)
-                    
-                    # Clean up
-                    os.unlink(temp_path)
-                    
-                    wav = audio
-                    print("✅ gTTS fallback successful")
-                    
-                except Exception as gtts_error:
-                    print(f"❌ gTTS fallback also failed: {gtts_error}")
+
+            def synth_chunk(chunk):
+                ctx = dict(model=model, text=chunk, user_id=user_id, voice_id=voice_id, emb=emb, meta=meta,
+                           xtts_lang=xtts_lang, lang=lang, speed=speed, tmp_dir=os.path.dirname(out_path))
+
+                # Kiểm tra xem model có method tts không
+                if not hasattr(model, 'tts'):
+                    print("❌ Model doesn't have 'tts' method - checkpoint loading may have failed")
+                    print("🔄 Falling back to gTTS...")
+                    result, strategy = _try_strategy("gtts", ctx), "gtts"
+                    if result is not None:
+                        with _STRATEGY_LOCK:
+                            _METRICS["served:gtts"] += 1
+                else:
+                    result, strategy = _run_strategies(ctx, model_type, voice_id)
+                if result is None:
                     return None
-            else:
-                # Thử các phương pháp TTS khác nhau
-                wav = None
-                
-                # Method 1: Speaker embedding với speaker parameter
-                if emb is not None:
-                    try:
-                        print("🔄 Trying speaker embedding with speaker parameter...")
-                        # XTTS cần speaker ID đúng format, thử với 'speaker' parameter
-                        wav = model.tts(text=text, speaker=voice_id, speaker_embedding=emb,
-                                        language=xtts_lang, speed=speed)
-                        if wav is not None:
-                            print("✅ Speaker embedding with speaker parameter successful")
-                        else:
-                            print("⚠️ Speaker embedding with speaker parameter failed: 'myVoice'")
-                    except Exception as e:
-                        print(f"⚠️ Speaker embedding with speaker parameter failed: {e}")
-                
-                # Method 2: Speaker parameter trực tiếp (thử với speaker ID khác)
-                if wav is None:
-                    try:
-                        print(f"🔄 Trying with speaker parameter: {voice_id}")
-                        # Thử với speaker ID khác nếu có
-                        wav = model.tts(text=text, speaker=voice_id, language=xtts_lang, speed=speed)
-                        if wav is not None:
-                            print("✅ Speaker parameter successful")
-                        else:
-                            print("⚠️ Speaker parameter failed: 'myVoice'")
-                    except Exception as e:
-                        print(f"⚠️ Speaker parameter failed: {e}")
-                
-                # Method 3: Speaker_wav từ voice profile
-                if wav is None:
-                    try:
-                        sample_audio_path = meta.get('sample_audio')
-                        if sample_audio_path and os.path.exists(sample_audio_path):
-                            print(f"🔄 Trying speaker_wav: {sample_audio_path}")
-                            # Convert sample audio to 16kHz mono if needed
-                            try:
-                                import subprocess
-                                temp_16k_path = sample_audio_path.replace('.wav', '_16k_mono.wav')
-                                
-                                # Use FFmpeg to convert to 16kHz mono
-                                cmd = [
-                                    'ffmpeg', '-y',
-                                    '-i', sample_audio_path,
-                                    '-ac', '1',  # Mono
-                                    '-ar', '16000',  # 16kHz
-                                    '-sample_fmt', 's16',  # 16-bit PCM
-                                    temp_16k_path
-                                ]
-                                
-                                result = subprocess.run(cmd, capture_output=True, text=True)
-                                
-                                if result.returncode == 0 and os.path.exists(temp_16k_path):
-                                    print(f"🔧 Converted sample audio to 16kHz mono: {temp_16k_path}")
-                                    wav = model.tts(text=text, speaker_wav=temp_16k_path, language=xtts_lang, speed=speed)
-                                    # Clean up temp file
-                                    try:
-                                        os.unlink(temp_16k_path)
-                                    except:
-                                        pass
-                                else:
-                                    print(f"⚠️ Sample audio conversion failed, using original")
-                                    wav = model.tts(text=text, speaker_wav=sample_audio_path, language=xtts_lang, speed=speed)
-                                    
-                            except Exception as convert_error:
-                                print(f"⚠️ Sample audio conversion failed: {convert_error}, using original")
-                                wav = model.tts(text=text, speaker_wav=sample_audio_path, language=xtts_lang, speed=speed)
-                            
-                            if wav is not None:
-                                print("✅ Speaker_wav successful")
-                        else:
-                            print("⚠️ No sample audio found in voice profile")
-                            print(f"🔍 Available metadata keys: {list(meta.keys()) if meta else 'None'}")
-                    except Exception as e:
-                        print(f"⚠️ Speaker_wav failed: {e}")
-                        import traceback
-                        traceback.print_exc()
-                
-                # Method 4: Không có speaker (default voice)
-                if wav is None:
-                    try:
-                        print("🔄 Trying without speaker...")
-                        wav = model.tts(text=text, language=xtts_lang, speed=speed)
-                        if wav is not None:
-                            print("✅ Default voice successful")
-                    except Exception as e:
-                        print(f"⚠️ Default voice failed: {e}")
-                
-                # Method 5: Fallback về gTTS với format chuẩn PCM 16-bit
-                if wav is None:
-                    print("🔄 All XTTS methods failed, falling back to gTTS with PCM 16-bit format...")
-                    try:
-                        from gtts import gTTS
-                        import tempfile
-                        import subprocess
-                        
-                        # Tạo file tạm MP3 trước
-                        with tempfile.NamedTemporaryFile(suffix='.mp3', delete=False) as temp_file:
-                            temp_mp3 = temp_file.name
-                        
-                        # Sử dụng gTTS để tạo MP3 với language gốc (tiếng Việt)
-                        print(f"🎤 gTTS fallback: Sử dụng language '{lang}' để giữ tiếng Việt")
-                        tts = gTTS(text=text, lang=lang, slow=False)
-                        tts.save(temp_mp3)
-                        
-                        # Convert MP3 sang WAV 16kHz mono PCM s16 với padding
-                        temp_wav = temp_mp3.replace('.mp3', '_16k_mono_pcm.wav')
-                        
-                        try:
-                            # Sử dụng FFmpeg để convert format chuẩn PCM 16-bit
-                            cmd = [
-                                'ffmpeg', '-y',
-                                '-i', temp_mp3,
-                                '-ac', '1',  # Mono
-                                '-ar', '16000',  # 16kHz
-                                '-sample_fmt', 's16',  # 16-bit PCM (không phải float)
-                                '-af', 'apad=pad_dur=0.5',  # Pad 0.5s để đủ frame
-                                '-f', 'wav',  # Ép format WAV
-                                temp_wav
-                            ]
-                            
-                            print(f"🔄 Converting to PCM 16-bit format: {' '.join(cmd)}")
-                            result = subprocess.run(cmd, capture_output=True, text=True)
-                            
-                            if result.returncode == 0 and os.path.exists(temp_wav):
-                                # Đọc WAV đã convert
-                                audio, sr = sf.read(temp_wav)
-                                wav = audio
-                                print("✅ gTTS fallback with PCM 16-bit format successful")
-                                print(f"🔧 Audio format: {sr}Hz, {len(audio)} samples, mono, PCM 16-bit")
-                                
-                                # Verify audio format
-                                if sr == 16000 and len(audio.shape) == 1:
-                                    print("✅ Audio format verified: 16kHz mono")
-                                else:
-                                    print(f"⚠️ Audio format mismatch: {sr}Hz, shape: {audio.shape}")
-                                
-                            else:
-                                # Fallback nếu FFmpeg thất bại
-                                print(f"⚠️ FFmpeg conversion failed: {result.stderr}")
-                                print("🔄 Falling back to direct MP3 reading")
-                                audio, sr = sf.read(temp_mp3)
-                                wav = audio
-                                print("✅ gTTS fallback successful (MP3 format)")
-                        
-                        except Exception as convert_error:
-                            print(f"⚠️ Format conversion failed: {convert_error}")
-                            # Fallback về đọc MP3 trực tiếp
-                            audio, sr = sf.read(temp_mp3)
-                            wav = audio
-                            print("✅ gTTS fallback successful (MP3 format)")
-                        
-                        # Clean up
-                        try:
-                            os.unlink(temp_mp3)
-                            if os.path.exists(temp_wav):
-                                os.unlink(temp_wav)
-                        except:
-                            pass
-                        
-                    except Exception as gtts_error:
-                        print(f"❌ Even gTTS failed: {gtts_error}")
-                        return None
-                
+                print(f"📊 Served by strategy: {strategy}")
+                return result[0], result[1], strategy
+
+            def synth_batch(chunks):
+                # tất cả các đoạn trong một lần generate batch, latents load một lần
+                with _MODEL_LOCK:
+                    wavs = _synthesize_latents_batch(chunks, user_id, voice_id, lang, speed, model, model_type, meta)
+                return None if wavs is None else [(wav, XTTS_SAMPLE_RATE, "latents") for wav in wavs]
+
+            # strategy khác latents: model chỉ chạy một luồng, các đoạn được synthesize lần lượt
+            parallel = False
+
         elif model_type == "gtts":
             # gTTS wrapper
             print("🎤 gTTS: Synthesizing with language hint")
-            wav = model.tts(text=text, language=lang, speed=speed)
-            
+
+            def synth_chunk(chunk):
+                return model.tts(text=chunk, language=lang, speed=speed), XTTS_SAMPLE_RATE, model_type
+
+            # gTTS là request mạng, các đoạn chạy song song được
+            parallel = True
+            synth_batch = None
+
         else:
             # Tacotron2 hoặc model khác
             print(f"Warning: Using {model_type} model. Voice cloning not available.")
+
+            def synth_chunk(chunk):
+                try:
+                    # Thử với language parameter
+                    wav = model.tts(text=chunk, speaker=model.speakers[0] if hasattr(model, 'speakers') else None,
+                                    language=lang)
+                except Exception as e:
+                    print(f"⚠️ Language parameter failed, trying without: {e}")
+                    # Thử không có language parameter
+                    wav = model.tts(text=chunk, speaker=model.speakers[0] if hasattr(model, 'speakers') else None)
+                return wav, XTTS_SAMPLE_RATE, model_type
+
+            parallel = False
+            synth_batch = None
+
+        results = None
+        if batch and synth_batch is not None and len(chunks) > 1 and hasattr(model, 'tts'):
+            results = synth_batch(chunks)
+        if results is None:
+            if parallel and len(chunks) > 1:
+                with ThreadPoolExecutor(max_workers=min(len(chunks), _chunk_workers())) as pool:
+                    results = list(pool.map(synth_chunk, chunks))
+            elif parallel:
+                results = [synth_chunk(chunk) for chunk in chunks]
+            else:
+                # model local chỉ được một luồng dùng tại một thời điểm
+                with _MODEL_LOCK:
+                    results = [synth_chunk(chunk) for chunk in chunks]
+
+        return _save_audio(results, out_path, model_type, cache_key, voice_id, lang)
+
+    except Exception as e:
+        print(f"❌ Error in synthesize: {str(e)}")
+        return None
+
+def _synthesize_group_batched(requests, model, model_type, emb, meta):
+    """
+    Các đoạn của mọi request trong group (cùng voice / ngôn ngữ / tốc độ) trong cùng một
+    xtts_inference_batch với latents dùng chung. Trả về list path (None nếu lỗi) theo thứ tự
+    requests, hoặc None nếu voice không synthesize bằng latents được.
+    """
+    first = requests[0]
+    results = [None] * len(requests)
+    pending = []
+    try:
+        for i, request in enumerate(requests):
+            os.makedirs(os.path.dirname(request.out_path), exist_ok=True)
+            cache_key, hit = _cache_lookup(request.text, request.voice_id, emb, request.lang, request.speed,
+                                           model_type, request.out_path)
+            if hit:
+                results[i] = request.out_path
+            else:
+                pending.append((i, cache_key, _split_narration(request.text)))
+    except Exception as e:
+        print(f"❌ Error in synthesize: {str(e)}")
+        return None
+    if not pending:
+        return results
+
+    texts = [chunk for _, _, chunks in pending for chunk in chunks]
+    print(f"🎤 {model_type}: {len(texts)} chunks of {len(pending)} requests in one batched call")
+    with _MODEL_LOCK:
+        wavs = _synthesize_latents_batch(texts, first.user_id, first.voice_id, first.lang, first.speed,
+                                         model, model_type, meta)
+    if wavs is None:
+        return None
+
+    start = 0
+    for i, cache_key, chunks in pending:
+        request = requests[i]
+        parts = [(wav, XTTS_SAMPLE_RATE, "latents") for wav in wavs[start:start + len(chunks)]]
+        start += len(chunks)
+        try:
+            results[i] = _save_audio(parts, request.out_path, model_type, cache_key, request.voice_id, request.lang)
+        except Exception as e:
+            print(f"❌ Error in synthesize: {str(e)}")
+    return results
+
+def _synthesize_group(requests):
+    """
+    Handler của TTSWorker: các request cùng voice / ngôn ngữ / tốc độ dùng chung model và profile.
+    Với XTTS (strategy latents) mọi đoạn của group chạy trong một lần generate batch; gTTS không
+    dùng model lock nên các request gTTS chạy song song.
+    """
+    first = requests[0]
+    try:
+        model, model_type = load_xtts()
+        emb, meta = load_profile(first.user_id, first.voice_id)
+    except Exception as e:
+        print(f"❌ Error in synthesize: {str(e)}")
+        return [None] * len(requests)
+
+    # cùng một đoạn text trong group chỉ synthesize một lần
+    owners, copies = {}, []
+    for i, request in enumerate(requests):
+        text_key = normalize_text(request.text)
+        if text_key in owners:
+            copies.append((i, owners[text_key]))
+        else:
+            owners[text_key] = i
+    unique = list(owners.values())
+
+    paths = None
+    if model_type in XTTS_MODEL_TYPES and hasattr(model, 'tts'):
+        paths = _synthesize_group_batched([requests[i] for i in unique], model, model_type, emb, meta)
+
+    def synth(request, batch=True):
+        return _synthesize_request(request.text, request.user_id, request.voice_id, request.lang, request.speed,
+                                   request.out_path, model, model_type, emb, meta, batch=batch)
+
+    if paths is None:
+        if model_type == "gtts" and len(unique) > 1:
+            with ThreadPoolExecutor(max_workers=min(len(unique), _chunk_workers())) as pool:
+                paths = list(pool.map(synth, [requests[i] for i in unique]))
+        else:
+            # batch đã thử ở trên (hoặc không áp dụng), không thử lại cho từng request
+            paths = [synth(requests[i], batch=False) for i in unique]
+
+    results = [None] * len(requests)
+    for i, path in zip(unique, paths):
+        results[i] = path
+    for i, owner in copies:
+        if results[owner]:
             try:
-                # Thử với language parameter
-                wav = model.tts(text=text, speaker=model.speakers[0] if hasattr(model, 'speakers') else None,
-                                language=lang)
-            except Exception as e:
-                print(f"⚠️ Language parameter failed, trying without: {e}")
-                # Thử không có language parameter
-                wav = model.tts(text=text, speaker=model.speakers[0] if hasattr(model, 'speakers') else None)
-        
-        if wav is None:
-            print("❌ TTS returned None")
-            return None
-            
-        sf.write(out_path, wav, 24000)
-        print(f"✅ Audio saved to: {out_path}")
-        return out_path
-        
+                shutil.copyfile(results[owner], requests[i].out_path)
+                results[i] = requests[i].out_path
+                continue
+            except OSError:
+                pass
+        results[i] = synth(requests[i], batch=False)
+    return results
+
+_WORKER = None
+_WORKER_LOCK = threading.Lock()
+
+def get_tts_worker():
+    """
+    TTSWorker dùng chung cho cả process; SADTALKER_TTS_MAX_BATCH và SADTALKER_TTS_BATCH_WAIT_MS để tinh
+    chỉnh batching, SADTALKER_TTS_GROUP_WORKERS là số group của một batch chạy song song.
+    """
+    global _WORKER
+    with _WORKER_LOCK:
+        if _WORKER is None:
+            _WORKER = TTSWorker(_synthesize_group,
+                                max_batch=int(os.environ.get("SADTALKER_TTS_MAX_BATCH", 8)),
+                                batch_wait=float(os.environ.get("SADTALKER_TTS_BATCH_WAIT_MS", 50)) / 1000.,
+                                group_workers=int(os.environ.get("SADTALKER_TTS_GROUP_WORKERS", 4)),
+                                tmp_root=os.environ.get("SADTALKER_TTS_TMP_DIR", os.path.join("data", "tmp", "tts")))
+        return _WORKER
+
+def synthesize(text: str, user_id: str, voice_id: str,
+               lang: str = "vi", speed: float = 1.0,
+               out_path: str = None):
+    """
+    Synthesize qua TTSWorker dùng chung, an toàn khi nhiều lecture job chạy song song.
+    Không truyền out_path thì mỗi request có thư mục tạm riêng trong data/tmp/tts; người gọi
+    sở hữu file trả về và có thể move / xoá nó.
+    """
+    try:
+        return get_tts_worker().submit(text, user_id, voice_id, lang, speed, out_path).result()
     except Exception as e:
         print(f"❌ Error in synthesize: {str(e)}")
         return None
@@ -0,0 +1,132 @@
+import os
+import time
+import queue
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+
+_STOP = object()
+
+
+class TTSRequest():
+    def __init__(self, text, user_id, voice_id, lang="vi", speed=1.0, out_path=None):
+        self.text = text
+        self.user_id = user_id
+        self.voice_id = voice_id
+        self.lang = lang
+        self.speed = speed
+        self.out_path = out_path
+        self.future = Future()
+        self.submitted_at = time.time()
+
+    @property
+    def group_key(self):
+        """ Requests with the same key share one profile / conditioning load and one handler call. """
+        return (self.user_id, self.voice_id, (self.lang or "").lower(), float(self.speed))
+
+
+class TTSWorker():
+    """
+    Owns the TTS model and serves synthesis requests from a queue.
+
+    Every request gets its own temp directory for the output, so concurrent lecture jobs never
+    write to the same file. The worker takes the first queued request, waits at most batch_wait
+    seconds for more (up to max_batch), groups them by (user, voice, language, speed) and hands
+    every group to handler(requests), which returns one output path (or None) per request.
+    The groups of a batch run concurrently on up to group_workers threads; the handler takes the
+    model lock itself around local model calls, so network backends (gTTS) are not serialized
+    behind the model. The model is only ever used from the worker threads.
+    """
+
+    def __init__(self, handler, max_batch=8, batch_wait=0.05, workers=1, group_workers=4,
+                 tmp_root=os.path.join("data", "tmp", "tts")):
+        self.handler = handler
+        self.max_batch = max(1, int(max_batch))
+        self.batch_wait = batch_wait
+        self.group_workers = max(1, int(group_workers))
+        self.tmp_root = tmp_root
+        self.requests = 0
+        self.batches = 0
+        self.groups = 0
+        self.busy_time = 0.
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._threads = [threading.Thread(target=self._loop, daemon=True, name=f"tts-worker-{i}")
+                         for i in range(max(1, int(workers)))]
+        for t in self._threads:
+            t.start()
+
+    def submit(self, text, user_id, voice_id, lang="vi", speed=1.0, out_path=None):
+        """ Future resolving to the output path; without out_path a fresh per-request temp dir is used. """
+        if out_path is None:
+            os.makedirs(self.tmp_root, exist_ok=True)
+            out_path = os.path.join(tempfile.mkdtemp(prefix="req_", dir=self.tmp_root), "voice_out.wav")
+        request = TTSRequest(text, user_id, voice_id, lang, speed, out_path)
+        self._queue.put(request)
+        return request.future
+
+    def _collect(self):
+        first = self._queue.get()
+        if first is _STOP:
+            return None
+        batch = [first]
+        deadline = time.time() + self.batch_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.time()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                self._queue.put(_STOP)
+                break
+            batch.append(item)
+        return batch
+
+    def _loop(self):
+        while True:
+            batch = self._collect()
+            if batch is None:
+                self._queue.put(_STOP)  # let the sibling workers see it too
+                return
+            groups = OrderedDict()
+            for request in batch:
+                groups.setdefault(request.group_key, []).append(request)
+            start = time.time()
+            if len(groups) > 1 and self.group_workers > 1:
+                with ThreadPoolExecutor(max_workers=min(len(groups), self.group_workers)) as pool:
+                    list(pool.map(self._run_group, groups.values()))
+            else:
+                for requests in groups.values():
+                    self._run_group(requests)
+            with self._lock:
+                self.requests += len(batch)
+                self.batches += 1
+                self.groups += len(groups)
+                self.busy_time += time.time() - start
+
+    def _run_group(self, requests):
+        try:
+            results = self.handler(requests)
+        except Exception as e:
+            for request in requests:
+                if not request.future.done():
+                    request.future.set_exception(e)
+            return
+        for request, result in zip(requests, results):
+            request.future.set_result(result)
+
+    def close(self, timeout=None):
+        self._queue.put(_STOP)
+        for t in self._threads:
+            t.join(timeout)
+
+    def stats(self):
+        with self._lock:
+            return {"requests": self.requests,
+                    "batches": self.batches,
+                    "groups": self.groups,
+                    "avg_batch": self.requests / self.batches if self.batches else 0.,
+                    "queued": self._queue.qsize(),
+                    "busy_s": self.busy_time}
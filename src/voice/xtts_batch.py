@@ -0,0 +1,94 @@
+import torch
+import torch.nn.functional as F
+
+# Giống giá trị mặc định của Xtts.inference, để kết quả batch giống khi gọi từng đoạn
+GENERATE_SETTINGS = dict(temperature=0.75, length_penalty=1.0, repetition_penalty=10.0,
+                         top_k=50, top_p=0.85, do_sample=True, num_beams=1)
+
+
+def _text_tokens(xtts, text, language, device):
+    tokens = xtts.tokenizer.encode(text.strip().lower(), lang=language)
+    if len(tokens) >= xtts.args.gpt_max_text_tokens:
+        raise ValueError(f"Đoạn text quá dài cho XTTS ({len(tokens)} tokens)")
+    return torch.IntTensor(tokens).to(device)
+
+
+def _generate_codes(xtts, token_list, gpt_cond_latent, settings):
+    """
+    Một lần gpt.generate cho nhiều đoạn text. Prefix (latents + text) của mỗi đoạn được pad bên
+    trái và che bằng attention_mask; vị trí của text và audio token là learned embedding tính
+    riêng cho từng đoạn, nên mỗi dòng cho cùng kết quả như khi generate một mình.
+    """
+    gpt = xtts.gpt
+    device = gpt_cond_latent.device
+    prefixes = []
+    for tokens in token_list:
+        text_inputs = F.pad(tokens.unsqueeze(0), (0, 1), value=gpt.stop_text_token)
+        text_inputs = F.pad(text_inputs, (1, 0), value=gpt.start_text_token)
+        emb = gpt.text_embedding(text_inputs) + gpt.text_pos_embedding(text_inputs)
+        prefixes.append(torch.cat([gpt_cond_latent, emb], dim=1)[0])
+
+    longest = max(p.shape[0] for p in prefixes)
+    prefix_emb = prefixes[0].new_zeros(len(prefixes), longest, prefixes[0].shape[-1])
+    attention_mask = torch.zeros(len(prefixes), longest + 1, dtype=torch.long, device=device)
+    for i, p in enumerate(prefixes):
+        prefix_emb[i, longest - p.shape[0]:] = p
+        attention_mask[i, longest - p.shape[0]:] = 1
+    gpt.gpt_inference.store_prefix_emb(prefix_emb)
+
+    gpt_inputs = torch.full((len(prefixes), longest + 1), fill_value=1, dtype=torch.long, device=device)
+    gpt_inputs[:, -1] = gpt.start_audio_token
+    gen = gpt.gpt_inference.generate(
+        gpt_inputs,
+        attention_mask=attention_mask,
+        bos_token_id=gpt.start_audio_token,
+        pad_token_id=gpt.stop_audio_token,
+        eos_token_id=gpt.stop_audio_token,
+        max_length=gpt.max_gen_mel_tokens + gpt_inputs.shape[-1],
+        num_return_sequences=1,
+        output_attentions=False,
+        **settings,
+    )
+    codes = []
+    for row in gen[:, gpt_inputs.shape[1]:]:
+        # dòng đã dừng được pad bằng stop token, giữ đến stop token đầu tiên như generate một mình
+        stop = (row == gpt.stop_audio_token).nonzero()
+        codes.append(row[:stop[0, 0] + 1] if len(stop) else row)
+    return codes
+
+
+@torch.no_grad()
+def xtts_inference_batch(xtts, texts, language, gpt_cond_latent, speaker_embedding, speed=1.0, max_batch=8,
+                         **settings):
+    """
+    Xtts.inference cho nhiều đoạn text cùng một giọng: conditioning latents dùng chung, phần
+    autoregressive (gpt.generate) chạy theo batch tối đa max_batch đoạn, các đoạn có độ dài gần
+    nhau được gom chung để ít padding. Latent và HiFi-GAN decode chạy từng đoạn (một forward).
+    Trả về list waveform numpy theo thứ tự của texts.
+    """
+    settings = dict(GENERATE_SETTINGS, **settings)
+    language = language.split("-")[0]
+    length_scale = 1.0 / max(speed, 0.05)
+    device = next(xtts.parameters()).device
+    gpt_cond_latent = gpt_cond_latent.to(device)
+    speaker_embedding = speaker_embedding.to(device)
+    gpt = xtts.gpt
+
+    tokens = [_text_tokens(xtts, text, language, device) for text in texts]
+    order = sorted(range(len(texts)), key=lambda i: tokens[i].shape[0])
+    wavs = [None] * len(texts)
+    for start in range(0, len(order), max(1, max_batch)):
+        batch = order[start:start + max(1, max_batch)]
+        codes = _generate_codes(xtts, [tokens[i] for i in batch], gpt_cond_latent, settings)
+        for i, gpt_codes in zip(batch, codes):
+            text_tokens = tokens[i].unsqueeze(0)
+            gpt_codes = gpt_codes.unsqueeze(0)
+            expected_output_len = torch.tensor([gpt_codes.shape[-1] * gpt.code_stride_len], device=device)
+            text_len = torch.tensor([text_tokens.shape[-1]], device=device)
+            gpt_latents = gpt(text_tokens, text_len, gpt_codes, expected_output_len, cond_latents=gpt_cond_latent,
+                              return_attentions=False, return_latent=True)
+            if length_scale != 1.0:
+                gpt_latents = F.interpolate(gpt_latents.transpose(1, 2), scale_factor=length_scale,
+                                            mode="linear").transpose(1, 2)
+            wavs[i] = xtts.hifigan_decoder(gpt_latents, g=speaker_embedding).cpu().squeeze().numpy()
+    return wavs